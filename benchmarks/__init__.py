@@ -0,0 +1,10 @@
+"""
+Бенчмарки FlowClick Studio.
+
+    python -m benchmarks run --save benchmarks/baseline.json
+    python -m benchmarks run --compare benchmarks/baseline.json --threshold 0.2
+
+flowgen - генератор синтетических потоков в формате vibe_click_config.json,
+bench - замеры загрузки, перетаскивания, экспорта, генерации кода блока,
+компиляции и выполнения на бэкенде, который ничего не делает.
+"""
@@ -0,0 +1,300 @@
+"""
+Замеры производительности на синтетических потоках.
+
+Без редактора: validate (validate_flow), compile (compile_flow), optimize (optimize_plan),
+execute (FlowVM на NullBackend, паузы не выполняются), export_table (скрипт с таблицей инструкций
+и его компиляция Python). С редактором (нужен дисплей для Tk): load
+(load_flow_silent + отрисовка видимой части), drag (перетаскивание самого связанного
+блока), export (текст Python скрипта), block_code (generate_single_block_code
+для всех блоков).
+
+Для каждой метрики берется лучшее время из нескольких повторов.
+Результаты сохраняются в JSON и сравниваются с базовым файлом:
+метрика считается регрессией, если стала медленнее на threshold
+(и больше чем на NOISE_FLOOR секунд).
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.flowgen import generate_flow
+from flow_engine import compile_flow, FlowVM, FlowCompileError
+from flow_export import build_table_script
+from flow_optimizer import optimize_plan
+from flow_graph import FlowGraph
+from flow_runner import DryRunToken
+from flow_validator import validate_flow
+from input_backends import NullBackend
+
+
+SCENARIOS = {
+    'chain-200': {'blocks': 200},
+    'chain-2000': {'blocks': 2000},
+    'tree-1000-fanout4': {'blocks': 1000, 'fanout': 4},
+    'nested-repeat-300': {'blocks': 300, 'repeat_depth': 4},
+    'diamonds-300': {'blocks': 300, 'edges': 320},
+    'long-text-60': {'blocks': 60, 'text_length': 5000},
+}
+QUICK_SCENARIOS = ('chain-200', 'nested-repeat-300', 'long-text-60')
+
+DRAG_STEPS = 50       # Шагов перетаскивания в метрике drag
+NOISE_FLOOR = 0.0005  # Разница меньше этой (сек) не считается регрессией
+FORMAT_VERSION = 1
+
+
+def measure(fn, repeat):
+    """Лучшее время выполнения fn из repeat попыток (сек). Сборщик мусора отключается, как в timeit"""
+    best = None
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def bench_headless(data, repeat):
+    """Компиляция и выполнение без Tk и без реального ввода"""
+    results = {}
+    info = {}
+    graph = FlowGraph.from_dict(data)
+    results['validate'] = measure(lambda: validate_flow(graph), repeat)
+    results['compile'] = measure(lambda: compile_flow(graph), repeat)
+    plan = compile_flow(graph)
+    info['plan_size'] = len(plan)
+    results['optimize'] = measure(lambda: optimize_plan(plan), repeat)
+    info['optimized_plan_size'] = len(optimize_plan(plan)[0])
+
+    def execute():
+        vm = FlowVM(plan, token=DryRunToken(), backend=NullBackend())
+        vm.run()
+        info['steps'] = vm.steps
+
+    results['execute'] = measure(execute, repeat)
+
+    def export_table():
+        script = build_table_script(plan, 'turbo')
+        compile(script, 'flow_script.py', 'exec')
+        info['export_table_lines'] = script.count('\n')
+
+    results['export_table'] = measure(export_table, repeat)
+    return results, info
+
+
+def create_editor():
+    """Редактор на скрытом окне Tk. Возвращает (editor, None) или (None, причина)"""
+    import main
+    main.load_ui_modules()
+    try:
+        root = main.tk.Tk()
+    except main.tk.TclError as e:
+        return None, f"Tk недоступен: {e}"
+    root.withdraw()
+    editor = main.FlowEditor(root)
+    # Не загружаем поток пользователя и не регистрируем горячие клавиши
+    editor.startup_done = True
+    return editor, None
+
+
+def bench_gui(editor, data, repeat):
+    """Загрузка, перетаскивание, экспорт и генерация кода блока в редакторе"""
+    results = {}
+    errors = {}
+    root = editor.root
+
+    fd, path = tempfile.mkstemp(suffix='.json', prefix='flowbench_')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        editor.config_file = path
+
+        def load():
+            with contextlib.redirect_stdout(io.StringIO()):
+                editor.load_flow_silent()
+            # Видимая часть рисуется порциями между событиями Tk
+            while editor.rendering:
+                root.update()
+            root.update_idletasks()
+
+        results['load'] = measure(load, repeat)
+    finally:
+        # Перетаскивание ниже не должно писать журнал временного файла
+        if editor.journal is not None:
+            editor.journal.close()
+            editor.journal = None
+        os.remove(path)
+
+    # Самый связанный блок - больше всего соединений перерисовывается
+    hub = max(editor.blocks, key=lambda block: len(editor.graph.incident_edges(block.id)))
+
+    def drag():
+        x, y = hub.x + 5, hub.y + 5
+        editor.drag_data.update({'x': x, 'y': y, 'block': hub})
+        for step in range(DRAG_STEPS):
+            x += 2 if step % 2 == 0 else -2
+            editor.on_canvas_drag(types.SimpleNamespace(x=x, y=y))
+            root.update_idletasks()
+        editor.on_canvas_release(types.SimpleNamespace(x=x, y=y))
+
+    results['drag'] = measure(drag, repeat)
+
+    def export():
+        # Экспорт печатает отчет оптимизатора
+        with contextlib.redirect_stdout(io.StringIO()):
+            editor.build_python_script()
+
+    try:
+        results['export'] = measure(export, repeat)
+    except FlowCompileError as e:
+        results['export'] = None
+        errors['export'] = str(e)
+
+    def block_code():
+        for block in editor.blocks:
+            editor.generate_single_block_code(block)
+
+    results['block_code'] = measure(block_code, repeat)
+    return results, errors
+
+
+def run_benchmarks(names, repeat=5, gui=True, log=print):
+    """Замер сценариев. Возвращает словарь для сохранения в JSON"""
+    editor, gui_error = (None, "отключено (--no-gui)")
+    if gui:
+        editor, gui_error = create_editor()
+    if gui_error:
+        log(f"Метрики редактора пропущены: {gui_error}")
+
+    report = {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': {},
+        'info': {},
+        'errors': {}
+    }
+    for name in names:
+        params = SCENARIOS[name]
+        data = generate_flow(**params)
+        results = {}
+        errors = {}
+        try:
+            results, info = bench_headless(data, repeat)
+            report['info'][name] = info
+        except FlowCompileError as e:
+            errors['compile'] = str(e)
+        if editor is not None:
+            gui_results, gui_errors = bench_gui(editor, data, repeat)
+            results.update(gui_results)
+            errors.update(gui_errors)
+        report['results'][name] = results
+        if errors:
+            report['errors'][name] = errors
+        log(f"{name:<20} " + '  '.join(
+            f"{metric}={format_seconds(seconds)}" for metric, seconds in results.items()
+        ))
+        for metric, error in errors.items():
+            log(f"{'':<20} {metric}: {error}")
+
+    if editor is not None:
+        editor.root.destroy()
+    return report
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '—'
+    if seconds < 1:
+        return f"{seconds * 1000:.2f}мс"
+    return f"{seconds:.2f}с"
+
+
+def compare_reports(baseline, current, threshold, log=print):
+    """Сравнение с базовым файлом. Возвращает список регрессий (сценарий, метрика, было, стало)"""
+    regressions = []
+    for name, metrics in current['results'].items():
+        base_metrics = baseline.get('results', {}).get(name)
+        if not base_metrics:
+            continue
+        for metric, seconds in metrics.items():
+            base = base_metrics.get(metric)
+            if base is None or seconds is None:
+                continue
+            change = (seconds - base) / base if base > 0 else 0.0
+            regressed = seconds > base * (1 + threshold) and seconds - base > NOISE_FLOOR
+            mark = 'РЕГРЕССИЯ' if regressed else ''
+            log(f"{name:<20} {metric:<11} {format_seconds(base):>10} → {format_seconds(seconds):>10} "
+                f"{change * 100:+7.1f}% {mark}")
+            if regressed:
+                regressions.append((name, metric, base, seconds))
+    return regressions
+
+
+def load_report(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Бенчмарки FlowClick Studio')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='выполнить замеры')
+    run_parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                            help='сценарий (можно несколько раз; по умолчанию - все)')
+    run_parser.add_argument('--quick', action='store_true', help='только небольшие сценарии')
+    run_parser.add_argument('--repeat', type=int, default=5, help='повторов каждой метрики')
+    run_parser.add_argument('--no-gui', action='store_true', help='без метрик редактора')
+    run_parser.add_argument('--save', metavar='FILE', help='сохранить результаты в JSON')
+    run_parser.add_argument('--compare', metavar='FILE', help='сравнить с базовым JSON')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='допустимое замедление (0.2 = 20%%)')
+
+    compare_parser = commands.add_parser('compare', help='сравнить два сохраненных результата')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='допустимое замедление (0.2 = 20%%)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        regressions = compare_reports(load_report(args.baseline), load_report(args.current), args.threshold)
+        return 1 if regressions else 0
+
+    names = args.scenario or (list(QUICK_SCENARIOS) if args.quick else list(SCENARIOS))
+    report = run_benchmarks(names, args.repeat, gui=not args.no_gui)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.save}")
+
+    if args.compare:
+        print()
+        regressions = compare_reports(load_report(args.compare), report, args.threshold)
+        if regressions:
+            print(f"\n❌ Регрессий: {len(regressions)} (порог {args.threshold * 100:.0f}%)")
+            return 1
+        print(f"\n✅ Регрессий нет (порог {args.threshold * 100:.0f}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
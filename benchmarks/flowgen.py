@@ -0,0 +1,98 @@
+"""
+Генератор синтетических потоков в формате vibe_click_config.json.
+
+Блоки образуют дерево: у каждого блока не больше fanout потомков
+(fanout=1 - простая цепочка). Первые repeat_depth блоков - вложенные
+блоки повторений, остальной поток - их тело. Дополнительные соединения
+идут только от меньшего id к большему, поэтому граф остается без циклов.
+Каждое такое соединение создает "ромб", и блоки после него компилируются
+повторно - большое количество лишних соединений быстро раздувает план.
+"""
+import random
+
+from flow_graph import FORMAT_VERSION
+
+
+# Типы блоков тела потока (по кругу)
+BODY_TYPES = ('coordinate', 'click', 'delay', 'keyboard_input', 'click', 'group')
+
+GRID_STEP = 140  # Шаг раскладки блоков на canvas
+GRID_COLUMNS = 40
+
+
+def block_data(block_type, index, text_length, rng):
+    """Данные блока заданного типа"""
+    if block_type == 'coordinate':
+        return {'x': rng.randint(0, 1919), 'y': rng.randint(0, 1079)}
+    if block_type == 'click':
+        return {'click_type': ('left', 'right', 'middle')[index % 3]}
+    if block_type == 'delay':
+        return {'delay': 0.1}
+    if block_type == 'repeat':
+        return {'repeat_count': 2}
+    if block_type == 'group':
+        return {'group_type': 'start' if index % 2 else 'end', 'name': f'Группа {index}'}
+    if block_type == 'keyboard_input':
+        text = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(text_length))
+        return {'text': text, 'press_enter': index % 2 == 0}
+    return {}
+
+
+def generate_flow(blocks=100, edges=None, fanout=1, repeat_depth=0, text_length=20, seed=0):
+    """Синтетический поток.
+
+    blocks - количество блоков, edges - общее количество соединений
+    (по умолчанию blocks - 1, то есть только дерево), fanout - максимум
+    потомков у блока, repeat_depth - вложенность блоков повторений,
+    text_length - длина текста в блоках ввода.
+    """
+    if blocks < 1:
+        raise ValueError("blocks должен быть >= 1")
+    if fanout < 1:
+        raise ValueError("fanout должен быть >= 1")
+    rng = random.Random(seed)
+    repeat_depth = min(repeat_depth, blocks - 1)
+
+    data_blocks = []
+    for i in range(blocks):
+        block_id = i + 1
+        block_type = 'repeat' if i < repeat_depth else BODY_TYPES[i % len(BODY_TYPES)]
+        data_blocks.append({
+            'id': block_id,
+            'type': block_type,
+            'x': 40 + (i % GRID_COLUMNS) * GRID_STEP,
+            'y': 40 + (i // GRID_COLUMNS) * GRID_STEP,
+            'data': block_data(block_type, i, text_length, rng)
+        })
+
+    connections = []
+    seen = set()
+
+    def connect(from_id, to_id):
+        if (from_id, to_id) not in seen:
+            seen.add((from_id, to_id))
+            connections.append({'from': from_id, 'to': to_id, 'delay': 0.0})
+
+    # Цепочка вложенных повторений, затем дерево тела
+    for i in range(1, blocks):
+        if i <= repeat_depth:
+            parent = i - 1
+        else:
+            parent = repeat_depth + (i - repeat_depth - 1) // fanout
+        connect(parent + 1, i + 1)
+
+    # Лишние соединения (ромбы)
+    target = blocks - 1 if edges is None else edges
+    attempts = 0
+    while len(connections) < target and attempts < target * 10 and blocks > 2:
+        attempts += 1
+        from_index = rng.randrange(repeat_depth, blocks - 1)
+        to_index = rng.randrange(from_index + 1, blocks)
+        connect(from_index + 1, to_index + 1)
+
+    return {
+        'version': FORMAT_VERSION,
+        'blocks': data_blocks,
+        'connections': connections,
+        'timing': {'profile': 'turbo'}
+    }
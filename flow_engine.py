@@ -0,0 +1,848 @@
+"""
+Движок выполнения потоков FlowClick Studio.
+
+Поток (блоки + соединения) компилируется в плоский неизменяемый план -
+кортеж инструкций с заранее вычисленными координатами, задержками на
+переходах и адресами переходов для циклов RepeatBlock. План выполняет
+небольшой интерпретатор FlowVM без рекурсии и без копирования контекста.
+
+Блок координат с привязкой к изображению компилируется в OP_FIND: образец
+ищется на экране при выполнении, а клики после блока берут найденную точку.
+
+Ветви блока с несколькими выходами занимают в плане соседние диапазоны
+инструкций (OP_FORK). Последовательно они выполняются одна за другой,
+а в режиме параллельных ветвей - одновременно: паузы перекрываются,
+а клики и ввод текста идут по очереди через общую блокировку.
+
+Блок, в который сходятся несколько путей (слияние), по умолчанию ('once')
+компилируется один раз - после развилки своего ближайшего доминатора, когда
+пройдены все пути к нему. В режиме 'every' блок и всё после него копируются
+в план для каждого пути. Оба формата экспорта (flow_export) строятся из
+плана, поэтому следуют тем же правилам.
+"""
+import heapq
+import threading
+import time
+
+from input_backends import create_backend
+from typing_engine import TypingEngine
+from flow_trace import TracingBackend
+from screen_capture import WATCH_MODES, FrameCache, parse_color, wait_for_screen
+from template_match import AnchorLocator, anchor_key
+
+
+# Коды инструкций плана
+OP_COORD = 0   # (OP_COORD, block_id, x, y)
+OP_CLICK = 1   # (OP_CLICK, block_id, x, y, button[, anchor_id[, path]]) - anchor_id: точка из OP_FIND этого блока (или None),
+               # path: перетаскивание - смещения ((dx, dy), ...) от точки нажатия
+OP_DELAY = 2   # (OP_DELAY, block_id, seconds)
+OP_WAIT = 3    # (OP_WAIT, from_id, to_id, seconds) - задержка на соединении
+OP_LOOP = 4    # (OP_LOOP, block_id, count, end_pc)
+OP_NEXT = 5    # (OP_NEXT, block_id, count, body_pc)
+OP_GROUP = 6   # (OP_GROUP, block_id, group_type, name)
+OP_TYPE = 7    # (OP_TYPE, block_id, text, press_enter, strategy) - strategy: способ ввода TypingEngine
+OP_FAIL = 8    # (OP_FAIL, block_id, message)
+OP_FORK = 9    # (OP_FORK, block_id, ((start_pc, end_pc), ...)) - ветви блока
+OP_WATCH = 10  # (OP_WATCH, block_id, to_id, spec) - ожидание области экрана (to_id - для соединения, иначе None)
+OP_FIND = 11   # (OP_FIND, block_id, anchor_key, x, y, fail_on_miss) - поиск образца, x/y - сохраненные координаты
+
+OP_NAMES = ('coord', 'click', 'delay', 'wait', 'loop', 'next', 'group', 'type', 'fail', 'fork', 'watch', 'find')
+
+# Режимы выполнения ветвей. Хранятся в потоке как "branches": "parallel"
+BRANCH_MODES = ('sequential', 'parallel')
+DEFAULT_BRANCH_MODE = 'sequential'
+
+# Режимы слияния - блока с несколькими входящими соединениями. Хранятся в data блока как "join": "every".
+# 'once' - блок выполняется один раз за проход, когда пройдены все пути к нему,
+# 'every' - блок и всё после него выполняются заново для каждого пришедшего пути
+JOIN_MODES = ('once', 'every')
+DEFAULT_JOIN_MODE = 'once'
+
+
+class FlowCompileError(Exception):
+    """Ошибка компиляции потока"""
+    pass
+
+
+# Профили таймингов (секунды). Хранятся в потоке как
+# "timing": {"profile": "fast", "custom": {"click_settle": 0.05}}
+TIMING_PROFILES = {
+    'safe': {
+        'click_settle': 0.3,    # Пауза после клика
+        'paste_before': 0.15,   # Между копированием в буфер и Ctrl+V
+        'paste_after': 0.2,     # После Ctrl+V
+        'enter_before': 0.2,    # Перед нажатием Enter
+        'type_settle': 0.3,     # После ввода текста
+        'char_interval': 0.05,  # Между символами при посимвольном вводе
+        'input_pause': 0.1,     # Пауза бэкенда ввода после каждого вызова (pyautogui.PAUSE)
+    },
+    'fast': {
+        'click_settle': 0.1,
+        'paste_before': 0.05,
+        'paste_after': 0.05,
+        'enter_before': 0.05,
+        'type_settle': 0.1,
+        'char_interval': 0.01,
+        'input_pause': 0.0,
+    },
+    'turbo': {
+        'click_settle': 0.0,
+        'paste_before': 0.02,
+        'paste_after': 0.02,
+        'enter_before': 0.0,
+        'type_settle': 0.0,
+        'char_interval': 0.0,
+        'input_pause': 0.0,
+    },
+}
+DEFAULT_TIMING_PROFILE = 'safe'
+
+
+def resolve_timing(timing=None):
+    """Значения таймингов потока: профиль + пользовательские значения"""
+    timing = timing or {}
+    profile = timing.get('profile', DEFAULT_TIMING_PROFILE)
+    if profile not in TIMING_PROFILES:
+        raise FlowCompileError(f"Неизвестный профиль таймингов: {profile}")
+    values = dict(TIMING_PROFILES[profile])
+    for key, value in timing.get('custom', {}).items():
+        if key not in values:
+            raise FlowCompileError(f"Неизвестный параметр тайминга: {key}")
+        values[key] = float(value)
+    return values
+
+
+def watch_spec(data):
+    """Параметры ожидания экрана (блок screen_wait или ожидание на соединении) -> кортеж для OP_WATCH.
+
+    (область, режим, цвет, stable_ms, таймаут, ошибка по таймауту).
+    None, если область не задана.
+    """
+    region = data.get('region')
+    if not region:
+        return None
+    mode = data.get('mode', 'change')
+    if mode not in WATCH_MODES:
+        raise FlowCompileError(f"Неизвестный режим ожидания экрана: {mode}")
+    color = None
+    if mode == 'color':
+        try:
+            color = parse_color(data.get('color') or '')
+        except ValueError as e:
+            raise FlowCompileError(str(e))
+    return (
+        tuple(int(v) for v in region), mode, color, int(data.get('stable_ms', 300)),
+        float(data.get('timeout', 10.0)), data.get('on_timeout', 'continue') == 'fail'
+    )
+
+
+def find_spec(block_id, anchor):
+    """Ключ образца привязки к изображению для OP_FIND (FlowCompileError, если данные повреждены)"""
+    try:
+        return anchor_key(anchor)
+    except (KeyError, TypeError, ValueError):
+        raise FlowCompileError(f"Блок #{block_id}: поврежден образец привязки к изображению")
+
+
+def join_mode(node):
+    """Режим слияния блока (FlowNode или блок редактора с data)"""
+    mode = node.data.get('join', DEFAULT_JOIN_MODE)
+    return mode if mode in JOIN_MODES else DEFAULT_JOIN_MODE
+
+
+def join_owners(graph):
+    """Слияния 'once' -> владелец (в топологическом порядке): блок, после всех ветвей которого слияние выполняется.
+
+    Владелец - ближайший доминатор слияния (все пути к слиянию проходят через
+    него), поэтому все входы приходят внутри его развилки. None - слияние
+    ветвей разных начальных блоков, выполняется после них всех. Доминаторы
+    считаются в топологическом порядке как общий предок предыдущих блоков.
+
+    Слияние стоит на уровне владельца, поэтому вход через повторение ниже
+    владельца (C→R(×3)→K и C→K) не повторяет слияние: K выполнится один раз
+    после цикла, а тело R его не содержит. Клик слияния берет координаты
+    первого пришедшего пути. Такие слияния находит looped_joins - проверка
+    потока о них предупреждает; режим 'every' сохраняет итерации.
+    """
+    inc = graph.inc
+    idom = {}
+    depth = {None: 0}
+
+    def common(a, b):
+        while a != b:
+            if depth[a] < depth[b]:
+                b = idom[b]
+            elif depth[a] > depth[b]:
+                a = idom[a]
+            else:
+                a, b = idom[a], idom[b]
+        return a
+
+    owners = {}
+    nodes = graph.nodes
+    for node_id in graph.topological_order():
+        owner = None
+        previous = iter(inc[node_id])
+        first = next(previous, None)
+        if first is not None:
+            owner = first
+            for prev_id in previous:
+                owner = common(owner, prev_id)
+            if len(inc[node_id]) > 1 and join_mode(nodes[node_id]) == 'once':
+                owners[node_id] = owner
+        idom[node_id] = owner
+        depth[node_id] = depth[owner] + 1
+    return owners
+
+
+def looped_joins(graph, owners):
+    """Слияния 'once', вход которых идет через повторение ниже владельца -> id этого повторения.
+
+    Поиск идет назад от входов слияния до владельца, поэтому затрагивает
+    только блоки между ними.
+    """
+    nodes = graph.nodes
+    inc = graph.inc
+    loops = {}
+    for join_id, owner in owners.items():
+        queue = [prev_id for prev_id in inc[join_id] if prev_id != owner]
+        seen = set(queue)
+        seen.add(owner)
+        for node_id in queue:
+            if nodes[node_id].type == 'repeat':
+                loops[join_id] = node_id
+                break
+            for prev_id in inc[node_id]:
+                if prev_id not in seen:
+                    seen.add(prev_id)
+                    queue.append(prev_id)
+    return loops
+
+
+# Защита от взрывного роста плана (например, много слияний 'every' подряд)
+MAX_PLAN_SIZE = 1000000
+
+
+class StopToken:
+    """Флаг остановки с прерываемым ожиданием.
+
+    Все паузы движка идут через wait(), поэтому остановка срабатывает
+    сразу, а не после окончания самой длинной задержки.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.stop_requested_at = None
+
+    def stop(self):
+        """Запрос остановки (можно вызывать из любого потока)"""
+        if not self.event.is_set():
+            self.stop_requested_at = time.perf_counter()
+            self.event.set()
+
+    def is_stopped(self):
+        return self.event.is_set()
+
+    def wait(self, seconds):
+        """Пауза. Возвращает False, если пауза прервана остановкой"""
+        if seconds <= 0:
+            return not self.event.is_set()
+        return not self.event.wait(seconds)
+
+    def latency(self):
+        """Время от запроса остановки до текущего момента (сек)"""
+        if self.stop_requested_at is None:
+            return None
+        return time.perf_counter() - self.stop_requested_at
+
+
+class ProgressChannel:
+    """Последнее состояние выполнения для UI.
+
+    Поток выполнения только перезаписывает поля - без блокировок, очередей
+    и вызовов Tk. UI читает их по таймеру с фиксированной частотой, поэтому
+    промежуточные состояния между кадрами просто не показываются.
+    """
+    __slots__ = ('status', 'block_id')
+
+    def __init__(self):
+        self.status = None    # Последний текст статуса
+        self.block_id = None  # Блок, который выполняется сейчас
+
+    def post(self, text):
+        """Используется как on_status для FlowVM"""
+        self.status = text
+
+
+class FlowPlan:
+    """Скомпилированный поток - плоский список инструкций"""
+    def __init__(self, code, start_ids, block_count, timing, branch_mode=DEFAULT_BRANCH_MODE, block_types=None):
+        self.code = tuple(code)
+        self.start_ids = tuple(start_ids)
+        self.block_count = block_count
+        self.timing = timing
+        self.branch_mode = branch_mode
+        self.block_types = block_types or {}  # id -> тип блока (для трассировки)
+
+    def __len__(self):
+        return len(self.code)
+
+    def dump(self):
+        """Текстовое представление плана (для отладки)"""
+        lines = []
+        for pc, instr in enumerate(self.code):
+            args = [repr(a) for a in instr[1:]]
+            if instr[0] == OP_FIND:
+                # Данные образца не печатаются - только его размер
+                args[1] = f"<образец {instr[2][0]}x{instr[2][1]}>"
+            args = ', '.join(args)
+            lines.append(f"{pc:5d}  {OP_NAMES[instr[0]]:<6} {args}")
+        return '\n'.join(lines)
+
+
+def compile_flow(graph, profile=None, branch_mode=None):
+    """Компиляция графа потока (FlowGraph) в FlowPlan.
+
+    Данные блоков копируются в инструкции, поэтому план - это снимок:
+    изменения на canvas во время выполнения на него не влияют.
+    profile - переопределение профиля таймингов, сохраненного в потоке,
+    branch_mode - переопределение режима ветвей.
+    """
+    timing_data = dict(graph.timing)
+    if profile:
+        timing_data['profile'] = profile
+    timing = resolve_timing(timing_data)
+    branch_mode = branch_mode or graph.branch_mode
+    if branch_mode not in BRANCH_MODES:
+        raise FlowCompileError(f"Неизвестный режим ветвей: {branch_mode}")
+
+    blocks = graph.nodes
+    out_edges = graph.out
+    in_edges = graph.inc
+    start_ids = graph.start_ids()
+
+    code = []
+    typing = TypingEngine(None, timing)  # Только выбор способа ввода - одинаковый для VM и экспорта
+    on_path = set()
+    fork_starts = {}  # fork_pc -> начала ветвей
+    owners = join_owners(graph)
+    join_rank = {join_id: rank for rank, join_id in enumerate(owners)}  # owners - в топологическом порядке
+    pending = {}  # Владелец -> (куча (ранг, id слияния), {id слияния: координаты первого входа})
+
+    def push_successors(stack, block_id, coords):
+        edges = list(out_edges[block_id].items())
+        if len(edges) > 1:
+            # Диапазоны ветвей заполняются при закрытии развилки
+            fork_pc = len(code)
+            code.append((OP_FORK, block_id, None))
+            fork_starts[fork_pc] = []
+            stack.append(('endfork', fork_pc))
+        for next_id, edge in reversed(edges):
+            stack.append(('block', next_id, coords))
+            if edge.watch:
+                stack.append(('watch', block_id, next_id, edge.watch))
+            if edge.delay > 0:
+                stack.append(('wait', block_id, next_id, edge.delay))
+            if len(edges) > 1:
+                stack.append(('branch', fork_pc))
+
+    # Несколько начальных блоков - тоже независимые ветви
+    root_starts = []
+    if len(start_ids) > 1:
+        code.append((OP_FORK, None, None))
+
+    # Явный стек вместо рекурсии: ('block', id, coords) | ('join', id, coords) | ('joins', owner_id)
+    # | ('wait', from, to, delay) | ('watch', from, to, data) | ('endloop', loop_pc) | ('branch', fork_pc)
+    # | ('endfork', fork_pc) | ('leave', id)
+    def emit(stack):
+        while stack:
+            item = stack.pop()
+            kind = item[0]
+
+            if kind == 'leave':
+                on_path.discard(item[1])
+                continue
+
+            if kind == 'wait':
+                code.append((OP_WAIT, item[1], item[2], item[3]))
+                continue
+
+            if kind == 'watch':
+                spec = watch_spec(item[3])
+                if spec is None:
+                    code.append((OP_FAIL, item[1], f"Соединение #{item[1]} → #{item[2]}: область экрана не задана!"))
+                else:
+                    code.append((OP_WATCH, item[1], item[2], spec))
+                continue
+
+            if kind == 'endloop':
+                loop_pc = item[1]
+                _, block_id, count, _ = code[loop_pc]
+                code.append((OP_NEXT, block_id, count, loop_pc + 1))
+                code[loop_pc] = (OP_LOOP, block_id, count, len(code))
+                continue
+
+            if kind == 'branch':
+                fork_starts[item[1]].append(len(code))
+                continue
+
+            if kind == 'endfork':
+                fork_pc = item[1]
+                starts = fork_starts.pop(fork_pc)
+                ends = starts[1:] + [len(code)]
+                code[fork_pc] = (OP_FORK, code[fork_pc][1], tuple(zip(starts, ends)))
+                # Все ветви пройдены - выполняются слияния, которыми владеет этот блок
+                stack.append(('joins', code[fork_pc][1]))
+                continue
+
+            if kind == 'joins':
+                # По одному в топологическом порядке: хвост слияния может прийти в следующее слияние
+                # того же владельца, поэтому оно ждет, пока предыдущие не выполнены
+                owner = item[1]
+                ready = pending.get(owner)
+                if ready:
+                    _, join_id = heapq.heappop(ready[0])
+                    join_coords = ready[1].pop(join_id)
+                    if not ready[0]:
+                        del pending[owner]
+                    stack.append(('joins', owner))
+                    stack.append(('join', join_id, join_coords))
+                continue
+
+            _, block_id, coords = item
+            if kind == 'block' and block_id in owners:
+                # Вход слияния 'once': сам блок выполнится один раз после развилки владельца,
+                # с координатами первого пришедшего пути
+                heap, arrived = pending.setdefault(owners[block_id], ([], {}))
+                if block_id not in arrived:
+                    arrived[block_id] = coords
+                    heapq.heappush(heap, (join_rank[block_id], block_id))
+                continue
+            if block_id in on_path:
+                raise FlowCompileError(f"Цикл в потоке: блок #{block_id} достижим сам из себя")
+            if len(code) > MAX_PLAN_SIZE:
+                raise FlowCompileError(f"Поток слишком большой: более {MAX_PLAN_SIZE} инструкций")
+
+            block = blocks[block_id]
+            block_type = block.type
+            data = block.data
+
+            if block_type == 'coordinate' and data.get('anchor'):
+                # Точка ищется на экране при выполнении; сохраненные координаты - запасные
+                x, y = data.get('x'), data.get('y')
+                coords = (x, y, block_id)
+                code.append((OP_FIND, block_id, find_spec(block_id, data['anchor']), x, y,
+                             data['anchor'].get('on_miss', 'fail') != 'fallback'))
+
+            elif block_type == 'coordinate':
+                x, y = data.get('x'), data.get('y')
+                if x is None or y is None:
+                    code.append((OP_FAIL, block_id, f"Блок #{block_id}: координаты не заданы!"))
+                    # Выполнение на этом блоке прерывается - потомков не компилируем
+                    continue
+                coords = (x, y)
+                code.append((OP_COORD, block_id, x, y))
+
+            elif block_type == 'click':
+                if coords is None:
+                    # Ищем координаты во входящих блоках координат
+                    for in_id in in_edges[block_id]:
+                        in_block = blocks[in_id]
+                        if in_block.type == 'coordinate':
+                            in_data = in_block.data
+                            if in_data.get('anchor'):
+                                coords = (in_data.get('x'), in_data.get('y'), in_id)
+                                break
+                            if in_data.get('x') is not None and in_data.get('y') is not None:
+                                coords = (in_data['x'], in_data['y'])
+                                break
+                x, y = coords[:2] if coords else (None, None)
+                anchor_id = coords[2] if coords and len(coords) > 2 else None
+                click = (OP_CLICK, block_id, x, y, data.get('click_type', 'left'))
+                if data.get('drag'):
+                    code.append(click + (anchor_id, tuple(tuple(point) for point in data['drag'])))
+                elif anchor_id is not None:
+                    code.append(click + (anchor_id,))
+                else:
+                    code.append(click)
+
+            elif block_type == 'delay':
+                code.append((OP_DELAY, block_id, data.get('delay', 1.0)))
+
+            elif block_type == 'repeat':
+                loop_pc = len(code)
+                # end_pc заполняется при закрытии цикла
+                code.append((OP_LOOP, block_id, data.get('repeat_count', 1), None))
+                on_path.add(block_id)
+                stack.append(('leave', block_id))
+                stack.append(('endloop', loop_pc))
+                push_successors(stack, block_id, coords)
+                continue
+
+            elif block_type == 'group':
+                code.append((OP_GROUP, block_id, data.get('group_type', 'start'), data.get('name', 'Группа')))
+
+            elif block_type == 'keyboard_input':
+                text = data.get('text', '')
+                code.append((OP_TYPE, block_id, text, data.get('press_enter', True), typing.choose_strategy(text)))
+
+            elif block_type == 'screen_wait':
+                spec = watch_spec(data)
+                if spec is None:
+                    code.append((OP_FAIL, block_id, f"Блок #{block_id}: область экрана не задана!"))
+                    continue
+                code.append((OP_WATCH, block_id, None, spec))
+
+            else:
+                continue
+
+            on_path.add(block_id)
+            stack.append(('leave', block_id))
+            push_successors(stack, block_id, coords)
+
+    for start_id in start_ids:
+        root_starts.append(len(code))
+        emit([('block', start_id, None)])
+    roots_end = len(code)
+    # Слияния разных начальных блоков - после всех начальных ветвей
+    emit([('joins', None)])
+
+    if len(start_ids) > 1:
+        code[0] = (OP_FORK, None, tuple(zip(root_starts, root_starts[1:] + [roots_end])))
+
+    block_types = {block_id: block.type for block_id, block in blocks.items()}
+    return FlowPlan(code, start_ids, len(blocks), timing, branch_mode, block_types)
+
+
+class FlowVM:
+    """Интерпретатор плана: один цикл, постоянная глубина стека.
+
+    В режиме параллельных ветвей каждая ветвь OP_FORK выполняется отдельным
+    FlowVM в своем потоке. Клики и ввод текста (вместе с паузами после них)
+    выполняются под общей блокировкой input_lock, паузы - без нее.
+    """
+    def __init__(self, plan, token=None, backend=None, on_status=None, on_error=None, on_warning=None,
+                 branch_mode=None, input_lock=None, progress=None, tracer=None, screen=None, locator=None,
+                 targets=None):
+        self.plan = plan
+        self.backend = backend or create_backend()
+        # Общий кэш кадров для ожиданий экрана и поиска образцов (экран снимается при первом запросе)
+        self.screen = screen or FrameCache()
+        # Поиск образцов (кэш и прошлые находки можно переиспользовать между запусками)
+        self.locator = locator or AnchorLocator(self.screen)
+        self.locator.screen = self.screen
+        self.targets = targets if targets is not None else {}  # id блока координат -> найденная точка
+        self.tracer = tracer  # flow_trace.Tracer или None
+        if tracer is not None and not isinstance(self.backend, TracingBackend):
+            self.backend = TracingBackend(self.backend, tracer)
+        self.token = token or StopToken()
+        self.wait = self.token.wait
+        self.stop_latency = None  # Задержка реакции на остановку (сек)
+        self.progress = progress  # ProgressChannel - текущий блок и статус для UI
+        if on_status is None and progress is not None:
+            on_status = progress.post
+        self.on_status = on_status or (lambda text: None)
+        self.on_error = on_error or (lambda text: None)
+        self.on_warning = on_warning or (lambda text: None)
+        self.loops = []  # Стек счетчиков итераций
+        self.timing = plan.timing
+        self.typing = TypingEngine(self.backend, self.timing, self.wait, self.on_warning)
+        self.steps = 0
+        self.parallel = (branch_mode or plan.branch_mode) == 'parallel'
+        self.input_lock = input_lock or threading.Lock()
+        self.lock_wait = 0.0   # Ожидание блокировки ввода (сек)
+        self.saved_time = 0.0  # Выигрыш параллельных ветвей относительно последовательного выполнения (сек)
+        op_click, op_type = self.op_click, self.op_type
+        if self.parallel:
+            op_click, op_type = self.exclusive(op_click), self.exclusive(op_type)
+        self.handlers = (
+            self.op_coord,
+            op_click,
+            self.op_delay,
+            self.op_wait,
+            self.op_loop,
+            self.op_next,
+            self.op_group,
+            op_type,
+            self.op_fail,
+            self.op_fork,
+            self.op_watch,
+            self.op_find,
+        )
+        if tracer is not None:
+            self.handlers = tuple(self.traced(handler) for handler in self.handlers)
+
+    def run(self):
+        """Выполнение плана. Возвращает 'done', 'stopped' или 'failed'"""
+        self.backend.set_pause(self.timing['input_pause'])
+        if self.tracer is None:
+            return self.run_range(0, len(self.plan.code))
+        start = self.tracer.now()
+        result = self.run_range(0, len(self.plan.code))
+        self.tracer.complete('run', 'flow', start, self.tracer.now(), {'result': result, 'steps': self.steps})
+        return result
+
+    def run_range(self, pc, end):
+        """Выполнение инструкций [pc, end) - всего плана или одной ветви"""
+        code = self.plan.code
+        handlers = self.handlers
+        is_stopped = self.token.is_stopped
+        progress = self.progress
+        self.loops = []
+        while pc < end:
+            if is_stopped():
+                self.stop_latency = self.token.latency()
+                return 'stopped'
+            instr = code[pc]
+            if progress is not None:
+                progress.block_id = instr[1]
+            pc = handlers[instr[0]](instr, pc)
+            self.steps += 1
+            if pc < 0:
+                return 'failed'
+        if is_stopped():
+            self.stop_latency = self.token.latency()
+            return 'stopped'
+        return 'done'
+
+    def op_coord(self, instr, pc):
+        _, block_id, x, y = instr
+        self.on_status(f"📍 Блок #{block_id}: координаты установлены ({x}, {y})")
+        return pc + 1
+
+    def op_click(self, instr, pc):
+        _, block_id, x, y, click_type = instr[:5]
+        if len(instr) > 5 and instr[5] is not None:
+            x, y = self.targets.get(instr[5], (x, y))
+        if x is None:
+            pass
+        elif len(instr) > 6:
+            self.backend.drag(x, y, instr[6], click_type)
+            self.on_status(f"🖱️ Блок #{block_id}: {click_type} перетаскивание из ({x}, {y})")
+        else:
+            self.backend.click(x, y, click_type)
+            self.on_status(f"🖱️ Блок #{block_id}: {click_type} клик в ({x}, {y})")
+        self.wait(self.timing['click_settle'])
+        return pc + 1
+
+    def op_delay(self, instr, pc):
+        _, block_id, delay = instr
+        self.on_status(f"⏱️ Блок #{block_id}: задержка {delay} сек...")
+        self.wait(delay)
+        return pc + 1
+
+    def op_wait(self, instr, pc):
+        self.wait(instr[3])
+        return pc + 1
+
+    def op_loop(self, instr, pc):
+        _, block_id, count, end_pc = instr
+        self.on_status(f"🔄 Блок #{block_id}: повторение {count} раз...")
+        if count <= 0:
+            return end_pc
+        self.loops.append(0)
+        self.on_status(f"🔄 Блок #{block_id}: итерация 1/{count}")
+        return pc + 1
+
+    def op_next(self, instr, pc):
+        _, block_id, count, body_pc = instr
+        loops = self.loops
+        loops[-1] += 1
+        if loops[-1] < count:
+            self.on_status(f"🔄 Блок #{block_id}: итерация {loops[-1] + 1}/{count}")
+            return body_pc
+        loops.pop()
+        return pc + 1
+
+    def op_group(self, instr, pc):
+        _, block_id, group_type, name = instr
+        self.on_status(f"📦 Блок #{block_id}: {'Начало' if group_type == 'start' else 'Конец'} группы '{name}'")
+        return pc + 1
+
+    def op_type(self, instr, pc):
+        _, block_id, text, press_enter, strategy = instr
+        timing = self.timing
+        self.on_status(f"⌨️ Блок #{block_id}: ввод текста '{text[:20]}...'")
+
+        # Буфер обмена порциями или пакетный набор - что быстрее для этого текста
+        result = self.typing.type_text(text, strategy)
+        if not result.completed:
+            return pc + 1
+        if result.chars:
+            self.on_status(
+                f"⌨️ Блок #{block_id}: введено {result.chars} симв. "
+                f"({result.strategy}, {result.chars_per_second:.0f} симв/с)"
+            )
+
+        # Нажимаем Enter если нужно
+        if press_enter:
+            if not self.wait(timing['enter_before']):
+                return pc + 1
+            self.backend.press('enter')
+
+        self.wait(timing['type_settle'])
+        return pc + 1
+
+    def op_fail(self, instr, pc):
+        self.on_error(instr[2])
+        if self.parallel:
+            # Останавливаем остальные ветви
+            self.token.stop()
+        return -1
+
+    def op_fork(self, instr, pc):
+        if not self.parallel:
+            # Ветви идут в плане подряд - просто выполняем их по очереди
+            return pc + 1
+        branches = instr[2]
+        vms = [self.branch_vm() for _ in branches]
+        results = [None] * len(branches)
+        costs = [0.0] * len(branches)
+        errors = []  # Исключения ветвей (FailSafeException, ошибки бэкенда) - поднимаются после join
+
+        def run_branch(i):
+            vm = vms[i]
+            started = time.perf_counter()
+            try:
+                results[i] = vm.run_range(*branches[i])
+            except Exception as e:
+                # Остальные ветви не должны продолжать клики
+                errors.append(e)
+                self.token.stop()
+                results[i] = 'failed'
+            # Последовательно ветвь заняла бы свое время без ожидания блокировки
+            # (с учетом выигрыша вложенных развилок)
+            costs[i] = time.perf_counter() - started - vm.lock_wait + vm.saved_time
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run_branch, args=(i,), daemon=True) for i in range(1, len(branches))]
+        for thread in threads:
+            thread.start()
+        run_branch(0)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.saved_time += sum(costs) - elapsed
+        self.steps += sum(vm.steps for vm in vms)
+        if errors:
+            raise errors[0]
+        if 'failed' in results:
+            return -1
+        return branches[-1][1]
+
+    def op_watch(self, instr, pc):
+        _, block_id, to_id, spec = instr
+        region, mode, color, stable_ms, timeout, fail_on_timeout = spec
+        name = f"Блок #{block_id}" if to_id is None else f"Переход #{block_id} → #{to_id}"
+        self.on_status(f"👁 {name}: ожидание экрана ({mode}, до {timeout} сек)...")
+        try:
+            result = wait_for_screen(self.screen, region, mode, color, stable_ms, timeout, self.wait)
+        except (ImportError, OSError) as e:
+            self.on_error(f"{name}: снимок экрана недоступен: {e}")
+            return -1
+        if result.stopped:
+            return pc + 1
+        stats = f"{result.elapsed:.2f} сек, {result.polls} снимков по {result.poll_cost * 1000:.1f} мс"
+        if result.matched:
+            self.on_status(f"👁 {name}: дождались за {stats}")
+            return pc + 1
+        if fail_on_timeout:
+            self.on_error(f"{name}: условие на экране не выполнено за {timeout} сек")
+            if self.parallel:
+                self.token.stop()
+            return -1
+        self.on_status(f"⚠️ {name}: таймаут ожидания экрана ({stats}), продолжаю")
+        return pc + 1
+
+    def op_find(self, instr, pc):
+        _, block_id, key, x, y, fail_on_miss = instr
+        try:
+            lookup = self.locator.locate(key)
+        except (ImportError, OSError, ValueError) as e:
+            self.on_error(f"Блок #{block_id}: поиск по изображению недоступен: {e}")
+            return -1
+        where = "в прошлой области" if lookup.in_region else "по всему экрану"
+        if lookup.found:
+            self.targets[block_id] = (lookup.x, lookup.y)
+            self.on_status(
+                f"🎯 Блок #{block_id}: образец найден в ({lookup.x}, {lookup.y}) {where} "
+                f"за {lookup.elapsed * 1000:.1f} мс"
+            )
+            return pc + 1
+        if fail_on_miss or x is None:
+            self.on_error(f"Блок #{block_id}: образец не найден на экране ({lookup.elapsed * 1000:.1f} мс)")
+            if self.parallel:
+                self.token.stop()
+            return -1
+        self.targets[block_id] = (x, y)
+        self.on_warning(f"Блок #{block_id}: образец не найден, клик по сохраненным координатам ({x}, {y})")
+        return pc + 1
+
+    def vision_stats(self):
+        """Строки статистики снимков экрана и поиска образцов (пусто, если экран не снимался)"""
+        lines = []
+        stats = self.screen.stats if isinstance(self.screen, FrameCache) else None
+        if stats is not None and stats.captures:
+            lines.append(stats.format())
+        if self.locator.stats.lookups:
+            lines.append(self.locator.stats.format())
+        return lines
+
+    def branch_vm(self):
+        """VM для одной ветви: общие токен, бэкенд и блокировка ввода"""
+        return FlowVM(
+            self.plan,
+            token=self.token,
+            backend=self.backend,
+            on_status=self.on_status,
+            on_error=self.on_error,
+            on_warning=self.on_warning,
+            branch_mode='parallel',
+            input_lock=self.input_lock,
+            progress=self.progress,
+            tracer=self.tracer,
+            screen=self.screen,
+            locator=self.locator,
+            targets=self.targets
+        )
+
+    def traced(self, handler):
+        """Обертка обработчика: инструкция записывается интервалом трассы"""
+        tracer = self.tracer
+        block_types = self.plan.block_types
+
+        def run(instr, pc):
+            # Номер итерации ближайшего цикла - до того, как OP_NEXT его изменит
+            iteration = self.loops[-1] if self.loops else None
+            start = tracer.now()
+            next_pc = handler(instr, pc)
+            op = instr[0]
+            if op == OP_WAIT:
+                name = f"wait #{instr[1]} → #{instr[2]}"
+                category = 'connection'
+                args = {'from': instr[1], 'to': instr[2], 'delay': instr[3]}
+            elif op == OP_WATCH and instr[2] is not None:
+                name = f"watch #{instr[1]} → #{instr[2]}"
+                category = 'connection'
+                args = {'from': instr[1], 'to': instr[2], 'mode': instr[3][1]}
+            else:
+                block_id = instr[1]
+                name = f"{OP_NAMES[op]} #{block_id}"
+                category = 'block'
+                args = {'block_id': block_id, 'type': block_types.get(block_id), 'pc': pc}
+            if iteration is not None:
+                args['iteration'] = iteration
+            tracer.complete(name, category, start, tracer.now(), args)
+            return next_pc
+        return run
+
+    def exclusive(self, handler):
+        """Обертка обработчика: инструкция ввода выполняется под блокировкой"""
+        lock = self.input_lock
+
+        def run(instr, pc):
+            requested = time.perf_counter()
+            with lock:
+                self.lock_wait += time.perf_counter() - requested
+                return handler(instr, pc)
+        return run
@@ -0,0 +1,544 @@
+"""
+Экспорт потока в Python скрипт.
+
+Формат 'table': вместо отдельного кода для каждого блока в скрипт
+записывается скомпилированный план (FlowPlan.code - кортежи, как в
+flow_engine) и небольшой общий интерпретатор. Размер скрипта растет
+линейно с числом инструкций, вложенность повторений не ограничена
+отступами Python, а таблица из констант компилируется в одну константу -
+скрипт быстро импортируется.
+
+Формат 'code': читаемый код по тем же инструкциям плана, повторения -
+циклы for.
+
+Оба формата строятся из одного плана, поэтому выполнение совпадает с
+FlowVM в последовательном режиме (ветви выполняются по очереди).
+"""
+from flow_engine import (
+    OP_COORD, OP_CLICK, OP_DELAY, OP_WAIT, OP_LOOP, OP_NEXT, OP_GROUP, OP_TYPE, OP_FAIL, OP_FORK, OP_WATCH,
+    OP_FIND, OP_NAMES, FlowCompileError
+)
+from typing_engine import TypingEngine
+
+
+# Порядок обработчиков в интерпретаторе скрипта - коды операций flow_engine
+EXPORT_OPS = ('coord', 'click', 'delay', 'wait', 'loop', 'next', 'group', 'type', 'fail', 'fork', 'watch', 'find')
+
+# Ожидание области экрана в скрипте (как screen_capture.wait_for_screen, снимки через PIL.ImageGrab).
+# Используется обоими форматами экспорта
+WAIT_SCREEN_CODE = '''
+def wait_screen(region, mode, color, stable_ms, timeout, fail_on_timeout):
+    """Ожидание условия в области экрана. False - таймаут, после которого нужно остановиться"""
+    x, y, width, height = region
+
+    def capture():
+        image = ImageGrab.grab(bbox=(x, y, x + width, y + height)).convert("RGB")
+        step_x, step_y = max(1, image.width // 32), max(1, image.height // 32)
+        data, stride = image.tobytes(), image.width * 3
+        rows = [data[row * stride:(row + 1) * stride] for row in range(step_y // 2, image.height, step_y)]
+        return tuple(b"".join(r[c::step_x * 3] for r in rows) for c in range(3))
+
+    def differs(a, b):
+        return a != b and any(abs(p - q) > 24 for ca, cb in zip(a, b) for p, q in zip(ca, cb))
+
+    print(f"👁 Ожидание экрана ({mode}, до {timeout} сек)...")
+    started = time.time()
+    baseline = previous = current = capture()
+    stable_since = started
+    while True:
+        now = time.time()
+        if mode == "change":
+            matched = differs(baseline, current)
+        elif mode == "color":
+            count = len(current[0]) or 1
+            matched = all(abs(sum(channel) / count - target) <= 24 for channel, target in zip(current, color))
+        else:
+            if differs(previous, current):
+                stable_since = now
+            matched = now - stable_since >= stable_ms / 1000
+        if matched:
+            return True
+        if now - started >= timeout:
+            print(f"⚠️  Таймаут ожидания экрана ({timeout} сек)")
+            return not fail_on_timeout
+        time.sleep(0.03)
+        previous, current = current, capture()
+'''
+
+WAIT_SCREEN_IMPORT = [
+    'try:',
+    '    from PIL import ImageGrab',
+    'except ImportError:',
+    '    print("Ошибка: установите Pillow (pip install pillow)")',
+    '    sys.exit(1)',
+]
+
+# Поиск образца привязки к изображению в скрипте: pyautogui.locateOnScreen (точное совпадение),
+# сначала у прошлой находки. Декодированные образцы кэшируются. Используется обоими форматами экспорта
+FIND_ANCHOR_CODE = '''
+ANCHOR_IMAGES = {}  # Данные образца -> PIL.Image
+ANCHOR_LAST = {}    # Данные образца -> (left, top) прошлой находки
+
+
+def locate(image, region):
+    try:
+        return pyautogui.locateOnScreen(image, region=region, grayscale=True)
+    except Exception:
+        return None
+
+
+def find_anchor(key):
+    """Поиск образца на экране: точка клика (x, y) или None"""
+    width, height, pixels, offset_x, offset_y = key
+    image = ANCHOR_IMAGES.get(pixels)
+    if image is None:
+        image = Image.frombytes("RGB", (width, height), zlib.decompress(base64.b64decode(pixels)))
+        ANCHOR_IMAGES[pixels] = image
+    started = time.time()
+    box = None
+    last = ANCHOR_LAST.get(pixels)
+    if last is not None:
+        box = locate(image, (max(0, last[0] - 48), max(0, last[1] - 48), width + 96, height + 96))
+    if box is None:
+        box = locate(image, None)
+    elapsed = (time.time() - started) * 1000
+    if box is None:
+        print(f"🎯 Образец не найден ({elapsed:.0f} мс)")
+        return None
+    ANCHOR_LAST[pixels] = (box[0], box[1])
+    print(f"🎯 Образец найден в ({box[0] + offset_x}, {box[1] + offset_y}) за {elapsed:.0f} мс")
+    return box[0] + offset_x, box[1] + offset_y
+'''
+
+FIND_ANCHOR_IMPORT = [
+    'import base64',
+    'import zlib',
+    'try:',
+    '    from PIL import Image',
+    'except ImportError:',
+    '    print("Ошибка: установите Pillow (pip install pillow)")',
+    '    sys.exit(1)',
+]
+
+# Ввод текста в скрипте - как TypingEngine: способ ('paste'/'keys') выбран при компиляции,
+# вставка порциями, набор пакетами с паузой после пакета, при ошибке буфера обмена остаток
+# набирается клавишами.
+# Используется обоими форматами экспорта
+TYPE_TEXT_CODE = '''
+def type_text(text, strategy):
+    """Ввод текста выбранным способом"""
+    typed = 0
+    if strategy == "paste":
+        try:
+            for start in range(0, len(text), TYPING["paste_chunk"]):
+                chunk = text[start:start + TYPING["paste_chunk"]]
+                pyperclip.copy(chunk)
+                time.sleep(TYPING["paste_before"])
+                pyautogui.hotkey("ctrl", "v")
+                typed += len(chunk)
+                time.sleep(TYPING["paste_after"])
+        except Exception as e:
+            print(f"⚠️  Ошибка буфера обмена: {e}")
+            strategy = "keys"
+    if strategy == "keys":
+        for start in range(typed, len(text), TYPING["key_batch"]):
+            batch = text[start:start + TYPING["key_batch"]]
+            pyautogui.write(batch)
+            time.sleep(len(batch) * TYPING["char_interval"])
+'''
+
+TYPE_TEXT_IMPORT = [
+    'try:',
+    '    import pyperclip',
+    'except ImportError:',
+    '    print("Ошибка: установите pyperclip (pip install pyperclip)")',
+    '    sys.exit(1)',
+]
+
+
+def type_text_code(timing):
+    """Функция ввода текста для скрипта с размерами порций и паузами профиля таймингов"""
+    typing = TypingEngine(None, timing)
+    constants = {
+        'paste_chunk': typing.chunk_size('paste'),
+        'key_batch': typing.chunk_size('keys'),
+        'paste_before': timing['paste_before'],
+        'paste_after': timing['paste_after'],
+        'char_interval': timing['char_interval'],
+    }
+    return f'\nTYPING = {constants!r}\n' + TYPE_TEXT_CODE
+
+
+INTERPRETER = '''
+def main():
+    """Выполнение таблицы PLAN"""
+    print("🚀 Запуск автоматизации...")
+    print("⏱️  Ожидание 2 секунды перед началом...")
+    time.sleep(2)
+    print("▶ Начало выполнения!\\n")
+
+    loops = []  # Счетчики итераций вложенных повторений
+    found = {}  # id блока координат -> точка, найденная по образцу
+
+    def sleep(seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def op_coord(instr, pc):
+        print(f"📍 Блок #{instr[1]}: координаты ({instr[2]}, {instr[3]})")
+        return pc + 1
+
+    def op_click(instr, pc):
+        _, block_id, x, y, button = instr[:5]
+        if len(instr) > 5 and instr[5] is not None:
+            x, y = found.get(instr[5], (x, y))
+        if x is None:
+            print(f"⚠️  Блок #{block_id}: нет координат для клика, пропускаю...")
+        elif len(instr) > 6:
+            print(f"🖱️  Блок #{block_id}: {button} перетаскивание из ({x}, {y})")
+            pyautogui.mouseDown(x, y, button=button, _pause=False)
+            for dx, dy in instr[6]:
+                pyautogui.moveTo(x + dx, y + dy, _pause=False)
+            pyautogui.mouseUp(button=button)
+        else:
+            print(f"🖱️  Блок #{block_id}: {button} клик в ({x}, {y})")
+            pyautogui.click(x, y, button=button)
+        sleep(TIMING["click_settle"])
+        return pc + 1
+
+    def op_delay(instr, pc):
+        print(f"⏱️  Блок #{instr[1]}: задержка {instr[2]} сек...")
+        sleep(instr[2])
+        return pc + 1
+
+    def op_wait(instr, pc):
+        sleep(instr[3])
+        return pc + 1
+
+    def op_loop(instr, pc):
+        _, block_id, count, end_pc = instr
+        print(f"🔄 Блок #{block_id}: повторение {count} раз...")
+        if count <= 0:
+            return end_pc
+        loops.append(0)
+        print(f"  → Итерация 1/{count}")
+        return pc + 1
+
+    def op_next(instr, pc):
+        _, block_id, count, body_pc = instr
+        loops[-1] += 1
+        if loops[-1] < count:
+            print(f"  → Итерация {loops[-1] + 1}/{count}")
+            return body_pc
+        loops.pop()
+        return pc + 1
+
+    def op_group(instr, pc):
+        marker = "Начало" if instr[2] == "start" else "Конец"
+        print(f"📦 {marker} группы: {instr[3]}")
+        return pc + 1
+
+    def op_type(instr, pc):
+        _, block_id, text, press_enter, strategy = instr
+        print(f"⌨️  Блок #{block_id}: ввод текста: {text[:30]}...")
+        type_text(text, strategy)
+        if press_enter:
+            sleep(TIMING["enter_before"])
+            pyautogui.press("enter")
+        sleep(TIMING["type_settle"])
+        return pc + 1
+
+    def op_fail(instr, pc):
+        print(f"❌ {instr[2]}")
+        return -1
+
+    def op_fork(instr, pc):
+        return pc + 1  # Ветви идут в таблице подряд - выполняются по очереди
+
+    def op_watch(instr, pc):
+        return pc + 1 if wait_screen(*instr[3]) else -1
+
+    def op_find(instr, pc):
+        _, block_id, key, x, y, fail_on_miss = instr
+        print(f"🎯 Блок #{block_id}: поиск по изображению...")
+        position = find_anchor(key)
+        if position is None:
+            if fail_on_miss or x is None:
+                print(f"❌ Блок #{block_id}: образец не найден на экране")
+                return -1
+            print(f"⚠️  Блок #{block_id}: клик по сохраненным координатам ({x}, {y})")
+            position = (x, y)
+        found[block_id] = position
+        return pc + 1
+
+    handlers = (
+        op_coord, op_click, op_delay, op_wait, op_loop, op_next, op_group, op_type, op_fail, op_fork, op_watch, op_find
+    )
+    pc = 0
+    end = len(PLAN)
+    while 0 <= pc < end:
+        instr = PLAN[pc]
+        pc = handlers[instr[0]](instr, pc)
+    if pc < 0:
+        print("\\n❌ Выполнение прервано")
+        return 1
+    print("\\n✅ Выполнение завершено!")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\\n⏹️  Прервано пользователем")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\\n❌ Ошибка: {e}")
+        sys.exit(1)
+'''
+
+
+def plan_features(plan):
+    """Какие вспомогательные функции нужны скрипту: (ввод текста, ожидание экрана, поиск образца)"""
+    ops = {instr[0] for instr in plan.code}
+    return OP_TYPE in ops, OP_WATCH in ops, OP_FIND in ops
+
+
+def script_header(title, plan):
+    """Заголовок и импорты скрипта"""
+    has_typing, has_watch, has_find = plan_features(plan)
+    lines = [
+        '#!/usr/bin/env python3',
+        '# -*- coding: utf-8 -*-',
+        '"""',
+        f'Автоматически сгенерированный скрипт из FlowClick Studio{title}',
+        'Для запуска: python <имя_файла>.py',
+        '"""',
+        '',
+        'import pyautogui',
+        'import time',
+        'import sys',
+    ]
+    if has_typing:
+        lines += TYPE_TEXT_IMPORT
+    if has_watch:
+        lines += WAIT_SCREEN_IMPORT
+    if has_find:
+        lines += FIND_ANCHOR_IMPORT
+    return lines
+
+
+def helper_lines(plan):
+    """Вспомогательные функции скрипта (ввод текста, ожидание экрана, поиск образца)"""
+    has_typing, has_watch, has_find = plan_features(plan)
+    lines = []
+    if has_typing:
+        lines.append(type_text_code(plan.timing).rstrip('\n'))
+    if has_watch:
+        lines.append(WAIT_SCREEN_CODE.rstrip('\n'))
+    if has_find:
+        lines.append(FIND_ANCHOR_CODE.rstrip('\n'))
+    return lines
+
+
+def build_table_script(plan, profile_name):
+    """Текст скрипта: таблица плана + интерпретатор"""
+    if OP_NAMES != EXPORT_OPS:
+        raise RuntimeError("Коды операций flow_engine изменились - обновите интерпретатор flow_export")
+    lines = script_header(' (таблица инструкций)', plan)
+    lines += [
+        '',
+        f'# Профиль таймингов: {profile_name}',
+        f'TIMING = {plan.timing!r}',
+        'pyautogui.PAUSE = TIMING["input_pause"]',
+        '',
+        '# Инструкции: (операция, id блока, параметры...)',
+        '# ' + ', '.join(f'{code} - {name}' for code, name in enumerate(EXPORT_OPS)),
+        'PLAN = (',
+    ]
+    lines += [f'    {instr!r},' for instr in plan.code]
+    lines.append(')')
+    lines += helper_lines(plan)
+    return '\n'.join(lines) + '\n' + INTERPRETER
+
+
+def click_lines(ind, name, x, y, button, path):
+    """Клик или перетаскивание по пути path; x, y - числа или имена переменных скрипта"""
+    if isinstance(x, str):
+        where = f'f"%s ({{{x}}}, {{{y}}})"'
+        points = [f'{x} + {dx}, {y} + {dy}' for dx, dy in path or ()]
+    else:
+        where = f'"%s ({x}, {y})"'
+        points = [f'{x + dx}, {y + dy}' for dx, dy in path or ()]
+    if not path:
+        return [f'{ind}print({where % f"🖱️  {name} клик в"})',
+                f'{ind}pyautogui.click({x}, {y}, button="{button}")']
+    # Точки пути - отдельными строками: цикл добавил бы уровень вложенности
+    lines = [f'{ind}print({where % f"🖱️  {name} перетаскивание из"})',
+             f'{ind}pyautogui.mouseDown({x}, {y}, button="{button}", _pause=False)']
+    lines += [f'{ind}pyautogui.moveTo({point}, _pause=False)' for point in points]
+    lines.append(f'{ind}pyautogui.mouseUp(button="{button}")')
+    return lines
+
+
+def sleep_lines(ind, seconds):
+    """Пауза из профиля таймингов (нулевые паузы не генерируются)"""
+    return [f'{ind}time.sleep({seconds})'] if seconds > 0 else []
+
+
+# Вложенных повторений в экспорте кодом блоков не больше: Python ограничивает
+# вложенность блоков кода (20), а внутри цикла бывает еще проверка if
+MAX_CODE_LOOPS = 18
+
+CLICK_NAMES = {'left': 'Левый', 'right': 'Правый', 'middle': 'Средний'}
+
+CODE_FOOTER = '''
+    print("\\n✅ Выполнение завершено!")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\\n⏹️  Прервано пользователем")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\\n❌ Ошибка: {e}")
+        sys.exit(1)
+'''
+
+
+def build_code_script(plan, profile_name):
+    """Текст скрипта: код по инструкциям плана (повторения - циклы for).
+
+    Код строится из того же плана, что выполняет FlowVM, поэтому слияния,
+    координаты кликов и ошибки совпадают с запуском и с таблицей инструкций.
+    FlowCompileError, если повторения вложены глубже MAX_CODE_LOOPS.
+    """
+    timing = plan.timing
+    lines = script_header('', plan)
+    lines += [
+        '',
+        f'# Профиль таймингов: {profile_name}',
+        f'pyautogui.PAUSE = {timing["input_pause"]}',
+    ]
+    lines += helper_lines(plan)
+    lines += [
+        '',
+        '',
+        'def main():',
+        '    """Основная функция выполнения скрипта"""',
+        '    print("🚀 Запуск автоматизации...")',
+        '    print("⏱️  Ожидание 2 секунды перед началом...")',
+        '    time.sleep(2)',
+        '    print("▶ Начало выполнения!\\n")',
+        '    found = {}  # id блока координат -> точка, найденная по образцу',
+    ]
+
+    depth = 1
+    for instr in plan.code:
+        op, block_id = instr[0], instr[1]
+        ind = '    ' * depth
+        emit = lines.append
+
+        if op == OP_COORD:
+            _, _, x, y = instr
+            emit(f'{ind}# Блок #{block_id}: Координаты')
+            emit(f'{ind}print("📍 Блок #{block_id}: координаты ({x}, {y})")')
+
+        elif op == OP_FIND:
+            _, _, key, x, y, fail_on_miss = instr
+            emit(f'{ind}# Блок #{block_id}: Координаты по изображению')
+            emit(f'{ind}print("🎯 Блок #{block_id}: поиск по изображению...")')
+            emit(f'{ind}found[{block_id}] = find_anchor({key!r})')
+            emit(f'{ind}if found[{block_id}] is None:')
+            if fail_on_miss or x is None:
+                emit(f'{ind}    print("❌ Блок #{block_id}: образец не найден на экране")')
+                emit(f'{ind}    sys.exit(1)')
+            else:
+                emit(f'{ind}    print("⚠️  Блок #{block_id}: клик по сохраненным координатам ({x}, {y})")')
+                emit(f'{ind}    found[{block_id}] = ({x}, {y})')
+
+        elif op == OP_CLICK:
+            _, _, x, y, button = instr[:5]
+            name = CLICK_NAMES.get(button, button)
+            emit(f'{ind}# Блок #{block_id}: {name} клик')
+            path = instr[6] if len(instr) > 6 else None
+            if len(instr) > 5 and instr[5] is not None:
+                # Точка блока координат по изображению (сохраненная - если поиска не было)
+                emit(f'{ind}x, y = found.get({instr[5]}, ({x}, {y}))')
+                click_ind = ind
+                if x is None:
+                    emit(f'{ind}if x is None:')
+                    emit(f'{ind}    print("⚠️  Блок #{block_id}: нет координат для клика, пропускаю...")')
+                    emit(f'{ind}else:')
+                    click_ind = ind + '    '
+                lines += click_lines(click_ind, name, 'x', 'y', button, path)
+            elif x is None:
+                emit(f'{ind}print("⚠️  Блок #{block_id}: нет координат для клика, пропускаю...")')
+            else:
+                lines += click_lines(ind, name, x, y, button, path)
+            lines += sleep_lines(ind, timing['click_settle'])
+
+        elif op == OP_DELAY:
+            delay = instr[2]
+            emit(f'{ind}# Блок #{block_id}: Задержка')
+            emit(f'{ind}print("⏱️  Задержка {delay} сек...")')
+            lines += sleep_lines(ind, delay)
+
+        elif op == OP_WAIT:
+            if instr[3] > 0:
+                emit(f'{ind}# Задержка на переходе #{block_id} → #{instr[2]}')
+                emit(f'{ind}time.sleep({instr[3]})')
+
+        elif op == OP_LOOP:
+            count = instr[2]
+            if depth > MAX_CODE_LOOPS:
+                raise FlowCompileError(
+                    f"Повторения вложены глубже {MAX_CODE_LOOPS} уровней - для экспорта кодом блоков "
+                    f"это слишком глубоко. Выберите формат экспорта 'table'"
+                )
+            emit(f'{ind}# Блок #{block_id}: Повторение {count}x')
+            emit(f'{ind}print("🔄 Повторение {count} раз...")')
+            emit(f'{ind}for iteration in range({count}):')
+            emit(f'{ind}    print(f"  → Итерация {{iteration + 1}}/{count}")')
+            depth += 1
+
+        elif op == OP_NEXT:
+            depth -= 1
+
+        elif op == OP_GROUP:
+            _, _, group_type, name = instr
+            marker = 'Начало' if group_type == 'start' else 'Конец'
+            emit(f'{ind}# Блок #{block_id}: {marker} группы {name!r}')
+            emit(f'{ind}print({f"📦 {marker} группы: {name}"!r})')
+
+        elif op == OP_TYPE:
+            _, _, text, press_enter, strategy = instr
+            emit(f'{ind}# Блок #{block_id}: Ввод текста')
+            emit(f'{ind}text_to_type = {text!r}')
+            emit(f'{ind}print(f"⌨️  Ввод текста: {{text_to_type[:30]}}...")')
+            emit(f'{ind}type_text(text_to_type, "{strategy}")')
+            if press_enter:
+                lines += sleep_lines(ind, timing['enter_before'])
+                emit(f'{ind}pyautogui.press("enter")')
+            lines += sleep_lines(ind, timing['type_settle'])
+
+        elif op == OP_FAIL:
+            emit(f'{ind}print({"❌ " + instr[2]!r})')
+            emit(f'{ind}sys.exit(1)')
+
+        elif op == OP_FORK:
+            if block_id is not None:
+                emit(f'{ind}# Блок #{block_id}: ветви выполняются по очереди')
+
+        elif op == OP_WATCH:
+            to_id, spec = instr[2], instr[3]
+            if to_id is None:
+                emit(f'{ind}# Блок #{block_id}: Ожидание экрана')
+            else:
+                emit(f'{ind}# Ожидание экрана на переходе #{block_id} → #{to_id}')
+            emit(f'{ind}if not wait_screen{spec!r}:')
+            emit(f'{ind}    sys.exit(1)')
+
+    return '\n'.join(lines) + '\n' + CODE_FOOTER
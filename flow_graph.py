@@ -0,0 +1,236 @@
+"""
+Модель графа потока, не зависящая от Tk.
+
+Узлы хранятся по id, соединения - по ключу (from_id, to_id).
+Для каждого узла есть прямой и обратный индексы смежности, поэтому
+поиск соединения, его задержки и всех связей блока - O(1) / O(степени).
+
+Файлы без поля version сохранены до появления слияний 'один раз';
+from_dict переводит их в текущий формат (upgrade), чтобы старые потоки
+выполнялись как раньше.
+"""
+
+FORMAT_VERSION = 2  # Версия формата vibe_click_config.json
+
+# До версии 2 задержка на соединении выполнялась только после этих блоков
+DELAYED_BLOCK_TYPES_V1 = ('coordinate', 'keyboard_input')
+
+
+class FlowNode:
+    """Узел графа (данные блока без отрисовки)"""
+    __slots__ = ('id', 'type', 'x', 'y', 'data')
+
+    def __init__(self, node_id, node_type, x=0, y=0, data=None):
+        self.id = node_id
+        self.type = node_type
+        self.x = x
+        self.y = y
+        self.data = data if data is not None else {}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'x': self.x,
+            'y': self.y,
+            'data': dict(self.data)
+        }
+
+
+class FlowEdge:
+    """Соединение между узлами"""
+    __slots__ = ('from_id', 'to_id', 'delay', 'watch')
+
+    def __init__(self, from_id, to_id, delay=0.0, watch=None):
+        self.from_id = from_id
+        self.to_id = to_id
+        self.delay = delay
+        self.watch = watch  # Ожидание области экрана после задержки (dict, см. screen_capture) или None
+
+    def to_dict(self):
+        data = {
+            'from': self.from_id,
+            'to': self.to_id,
+            'delay': self.delay
+        }
+        if self.watch:
+            data['watch'] = dict(self.watch)
+        return data
+
+
+class FlowGraph:
+    """Граф потока с индексами смежности"""
+    def __init__(self):
+        self.nodes = {}   # id -> FlowNode (в порядке добавления)
+        self.edges = {}   # (from_id, to_id) -> FlowEdge (в порядке добавления)
+        self.out = {}     # id -> {to_id: FlowEdge}
+        self.inc = {}     # id -> {from_id: FlowEdge}
+        self.timing = {}  # {"profile": ..., "custom": {...}} - см. flow_engine.TIMING_PROFILES
+        self.branch_mode = 'sequential'  # Режим ветвей - см. flow_engine.BRANCH_MODES
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # ----- узлы -----
+
+    def add_node(self, node_id, node_type, x=0, y=0, data=None):
+        """Добавление узла"""
+        node = FlowNode(node_id, node_type, x, y, data)
+        self.nodes[node_id] = node
+        self.out[node_id] = {}
+        self.inc[node_id] = {}
+        return node
+
+    def remove_node(self, node_id):
+        """Удаление узла вместе с его соединениями. Возвращает удаленные соединения"""
+        removed = list(self.out[node_id].values()) + list(self.inc[node_id].values())
+        for edge in removed:
+            self.remove_edge(edge.from_id, edge.to_id)
+        del self.nodes[node_id]
+        del self.out[node_id]
+        del self.inc[node_id]
+        return removed
+
+    def move_node(self, node_id, x, y):
+        """Обновление позиции узла"""
+        node = self.nodes[node_id]
+        node.x = x
+        node.y = y
+
+    # ----- соединения -----
+
+    def add_edge(self, from_id, to_id, delay=0.0, watch=None):
+        """Добавление соединения. Возвращает None, если оно уже есть"""
+        key = (from_id, to_id)
+        if key in self.edges or from_id not in self.nodes or to_id not in self.nodes:
+            return None
+        edge = FlowEdge(from_id, to_id, delay, watch)
+        self.edges[key] = edge
+        self.out[from_id][to_id] = edge
+        self.inc[to_id][from_id] = edge
+        return edge
+
+    def remove_edge(self, from_id, to_id):
+        """Удаление соединения"""
+        edge = self.edges.pop((from_id, to_id), None)
+        if edge is not None:
+            del self.out[from_id][to_id]
+            del self.inc[to_id][from_id]
+        return edge
+
+    def get_edge(self, from_id, to_id):
+        return self.edges.get((from_id, to_id))
+
+    def get_delay(self, from_id, to_id):
+        """Задержка на соединении (0.0, если соединения нет)"""
+        edge = self.edges.get((from_id, to_id))
+        return edge.delay if edge is not None else 0.0
+
+    def set_delay(self, from_id, to_id, delay):
+        self.edges[(from_id, to_id)].delay = delay
+
+    def get_watch(self, from_id, to_id):
+        """Ожидание экрана на соединении (None, если его нет)"""
+        edge = self.edges.get((from_id, to_id))
+        return edge.watch if edge is not None else None
+
+    def set_watch(self, from_id, to_id, watch):
+        self.edges[(from_id, to_id)].watch = watch
+
+    # ----- запросы -----
+
+    def successors(self, node_id):
+        """id следующих узлов в порядке создания соединений"""
+        return list(self.out[node_id])
+
+    def predecessors(self, node_id):
+        """id предыдущих узлов в порядке создания соединений"""
+        return list(self.inc[node_id])
+
+    def incident_edges(self, node_id):
+        """Все соединения узла (входящие и исходящие)"""
+        return list(self.out[node_id].values()) + list(self.inc[node_id].values())
+
+    def start_ids(self):
+        """Начальные узлы - без входящих соединений"""
+        return [node_id for node_id in self.nodes if not self.inc[node_id]]
+
+    def topological_order(self):
+        """Порядок Кана от начальных узлов: узел идет после всех предыдущих.
+
+        Узлы циклов и всё, что достижимо только через них, не попадают.
+        """
+        degree = {node_id: len(previous) for node_id, previous in self.inc.items()}
+        order = self.start_ids()
+        for node_id in order:
+            for next_id in self.out[node_id]:
+                degree[next_id] -= 1
+                if not degree[next_id]:
+                    order.append(next_id)
+        return order
+
+    def clear(self):
+        self.nodes.clear()
+        self.edges.clear()
+        self.out.clear()
+        self.inc.clear()
+        self.timing = {}
+        self.branch_mode = 'sequential'
+
+    # ----- сериализация -----
+
+    def to_dict(self):
+        """Формат vibe_click_config.json"""
+        data = {
+            'version': FORMAT_VERSION,
+            'blocks': [node.to_dict() for node in self.nodes.values()],
+            'connections': [edge.to_dict() for edge in self.edges.values()]
+        }
+        if self.timing:
+            data['timing'] = dict(self.timing)
+        if self.branch_mode != 'sequential':
+            data['branches'] = self.branch_mode
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Построение графа из формата vibe_click_config.json"""
+        graph = cls()
+        for block_data in data.get('blocks', []):
+            graph.add_node(
+                block_data['id'],
+                block_data['type'],
+                block_data.get('x', 0),
+                block_data.get('y', 0),
+                dict(block_data.get('data', {}))
+            )
+        for conn_data in data.get('connections', []):
+            graph.add_edge(
+                conn_data['from'], conn_data['to'], conn_data.get('delay', 0.0) or 0.0, conn_data.get('watch')
+            )
+        graph.timing = dict(data.get('timing', {}))
+        graph.branch_mode = data.get('branches', 'sequential')
+        if data.get('version', 1) < FORMAT_VERSION:
+            graph.upgrade()
+        return graph
+
+    def upgrade(self):
+        """Перевод потока без версии формата в текущий формат.
+
+        Раньше блок со многими входами выполнялся заново для каждого пути.
+        Слияние, вход которого идет через повторение ниже владельца, в режиме
+        'один раз' потеряло бы итерации цикла - такие слияния получают 'every'.
+
+        Задержки на соединениях раньше выполнялись только после блоков
+        координат и ввода текста, теперь - на любом соединении. Задержки
+        после остальных блоков никогда не выполнялись и обнуляются.
+        """
+        for edge in self.edges.values():
+            if self.nodes[edge.from_id].type not in DELAYED_BLOCK_TYPES_V1:
+                edge.delay = 0.0
+
+        # Импорт здесь: модель графа не зависит от движка при обычной работе
+        from flow_engine import join_owners, looped_joins
+        for join_id in looped_joins(self, join_owners(self)):
+            self.nodes[join_id].data['join'] = 'every'
+
@@ -0,0 +1,198 @@
+"""
+Журнал изменений потока (автосохранение).
+
+Рядом с файлом потока (vibe_click_config.json) лежит журнал
+vibe_click_config.json.journal - JSON по строке на каждое изменение:
+добавление, перемещение (по окончании перетаскивания), соединение,
+удаление блока, изменение параметров (блока, задержки или ожидания экрана
+на соединении). Запись в журнал стоит столько же, сколько само изменение,
+а не весь поток.
+
+Периодически (и при явном сохранении) журнал сжимается: весь поток
+атомарно записывается в файл потока (временный файл + os.replace),
+а журнал начинается заново. Загрузка = снимок + повтор журнала.
+
+Первая строка журнала - заголовок с номером поколения снимка. Снимок
+хранит свой номер в ключе journal_generation, поэтому журнал, уже
+вошедший в снимок (сбой между записью снимка и очисткой журнала),
+при загрузке пропускается. Недописанная последняя строка (сбой во время
+записи) тоже пропускается.
+"""
+import json
+import os
+import tempfile
+
+from flow_graph import FlowGraph
+
+
+JOURNAL_SUFFIX = '.journal'
+GENERATION_KEY = 'journal_generation'
+COMPACT_EVERY = 500  # Записей в журнале до автоматического сжатия
+
+
+def journal_path(path):
+    """Путь к журналу файла потока"""
+    return path + JOURNAL_SUFFIX
+
+
+def write_atomic(path, text):
+    """Атомарная запись файла: временный файл в той же папке + os.replace"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_journal(path):
+    """Чтение журнала. Возвращает (поколение, [записи]) или (None, [])"""
+    if not os.path.exists(path):
+        return None, []
+    generation = None
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Строка, недописанная при сбое
+            if entry.get('op') == 'start':
+                generation = entry.get('generation', 0)
+            else:
+                entries.append(entry)
+    return generation, entries
+
+
+def apply_entry(graph, entry):
+    """Повтор одной записи журнала на FlowGraph.
+
+    Записи применимы повторно: добавление существующего блока обновляет
+    его, соединение - не дублируется, удаление отсутствующего - пропускается.
+    """
+    op = entry['op']
+    nodes = graph.nodes
+    if op == 'add':
+        block = entry['block']
+        node = nodes.get(block['id'])
+        if node is None:
+            graph.add_node(block['id'], block['type'], block['x'], block['y'], dict(block.get('data', {})))
+        else:
+            node.type = block['type']
+            node.x, node.y = block['x'], block['y']
+            node.data = dict(block.get('data', {}))
+    elif op == 'move':
+        if entry['id'] in nodes:
+            graph.move_node(entry['id'], entry['x'], entry['y'])
+    elif op == 'data':
+        if entry['id'] in nodes:
+            nodes[entry['id']].data = dict(entry['data'])
+    elif op == 'delete':
+        if entry['id'] in nodes:
+            graph.remove_node(entry['id'])
+    elif op == 'connect':
+        graph.add_edge(entry['from'], entry['to'], entry.get('delay', 0.0))
+    elif op == 'delay':
+        if graph.get_edge(entry['from'], entry['to']) is not None:
+            graph.set_delay(entry['from'], entry['to'], entry['delay'])
+    elif op == 'watch':
+        if graph.get_edge(entry['from'], entry['to']) is not None:
+            graph.set_watch(entry['from'], entry['to'], entry.get('watch'))
+    elif op == 'settings':
+        graph.timing = dict(entry.get('timing', {}))
+        graph.branch_mode = entry.get('branches', 'sequential')
+    elif op == 'clear':
+        graph.clear()
+    else:
+        raise ValueError(f"Неизвестная запись журнала: {op}")
+
+
+class FlowJournal:
+    """Журнал изменений одного файла потока"""
+    def __init__(self, path):
+        self.path = path
+        self.journal_file = journal_path(path)
+        self.generation = 0  # Поколение снимка, к которому относится журнал
+        self.entries = 0     # Записей в журнале после снимка
+        self.file = None
+
+    def load(self):
+        """Снимок + журнал. Возвращает данные потока (dict) или None, если нет ни того, ни другого"""
+        data = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        self.generation = data.get(GENERATION_KEY, 0) if data else 0
+        generation, entries = read_journal(self.journal_file)
+        if generation != self.generation or not entries:
+            # Журнала нет или он уже вошел в снимок - первая запись начнет новый
+            self.entries = 0
+            return data
+
+        graph = FlowGraph.from_dict(data or {})
+        for entry in entries:
+            apply_entry(graph, entry)
+        self.entries = len(entries)
+        return graph.to_dict()
+
+    def header(self):
+        return json.dumps({'op': 'start', 'generation': self.generation}) + '\n'
+
+    def record(self, entry):
+        """Добавление записи ({'op': ..., ...}) в конец журнала"""
+        if self.file is None:
+            if self.entries:
+                self.file = open(self.journal_file, 'a', encoding='utf-8')
+                if not self.ends_with_newline():
+                    self.file.write('\n')  # Недописанная при сбое строка остается отдельной
+            else:
+                # Записей текущего поколения нет - старый журнал не нужен
+                self.file = open(self.journal_file, 'w', encoding='utf-8')
+                self.file.write(self.header())
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.entries += 1
+
+    def ends_with_newline(self):
+        with open(self.journal_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def needs_compaction(self):
+        return self.entries >= COMPACT_EVERY
+
+    def compact(self, data):
+        """Атомарный снимок всего потока и очистка журнала"""
+        self.close()
+        self.generation += 1
+        snapshot = dict(data)
+        snapshot[GENERATION_KEY] = self.generation
+        write_atomic(self.path, json.dumps(snapshot, indent=4, ensure_ascii=False))
+        # Сбой здесь не страшен: журнал старого поколения при загрузке пропускается
+        write_atomic(self.journal_file, self.header())
+        self.entries = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_flow(path):
+    """Данные потока с учетом журнала (None, если файла нет)"""
+    journal = FlowJournal(path)
+    try:
+        return journal.load()
+    finally:
+        journal.close()
@@ -0,0 +1,267 @@
+"""
+Оптимизация скомпилированного плана перед выполнением и экспортом.
+
+Проходы работают с FlowPlan.code (см. flow_engine) и не меняют
+поведение - только количество шагов интерпретатора:
+- удаление пустых операций: координаты (они уже подставлены в клики -
+  клик сам перемещает курсор), маркеры групп, нулевые паузы, повторения
+  1 раз, повторения 0 раз вместе с телом, развилки последовательного режима;
+- удаление мертвых блоков: недостижимые из начальных блоков в план не
+  попадают при компиляции, а в последовательном режиме отбрасывается всё
+  после первой ошибки (OP_FAIL прерывает выполнение);
+- свертка подряд идущих пауз (блоки задержки и задержки на соединениях)
+  в одну инструкцию.
+
+Адреса переходов (конец и тело повторения, диапазоны ветвей) после
+удаления инструкций пересчитываются. Паузы не сворачиваются через
+адрес перехода, поэтому в параллельном режиме паузы разных ветвей
+остаются раздельными.
+"""
+from flow_engine import (
+    OP_COORD, OP_CLICK, OP_DELAY, OP_WAIT, OP_LOOP, OP_NEXT, OP_GROUP, OP_TYPE, OP_FAIL, OP_FORK, OP_WATCH,
+    FlowPlan
+)
+from typing_engine import TypingEngine
+
+
+def rewrite(code, drop, replace=None):
+    """Новый список инструкций без pc из drop (replace - {pc: инструкция}).
+
+    Адрес удаленной инструкции переходит к следующей оставшейся.
+    """
+    size = len(code)
+    new_pc = [0] * (size + 1)
+    count = 0
+    for pc in range(size):
+        new_pc[pc] = count
+        if pc not in drop:
+            count += 1
+    new_pc[size] = count
+
+    result = []
+    for pc, instr in enumerate(code):
+        if pc in drop:
+            continue
+        if replace and pc in replace:
+            instr = replace[pc]
+        op = instr[0]
+        if op == OP_LOOP or op == OP_NEXT:
+            instr = (op, instr[1], instr[2], new_pc[instr[3]])
+        elif op == OP_FORK and instr[2] is not None:
+            instr = (OP_FORK, instr[1], tuple((new_pc[start], new_pc[end]) for start, end in instr[2]))
+        result.append(instr)
+    return result
+
+
+def jump_targets(code):
+    """Адреса, на которые возможен переход"""
+    targets = set()
+    for instr in code:
+        op = instr[0]
+        if op == OP_LOOP or op == OP_NEXT:
+            targets.add(instr[3])
+        elif op == OP_FORK and instr[2] is not None:
+            for start, end in instr[2]:
+                targets.add(start)
+                targets.add(end)
+    return targets
+
+
+def sleep_seconds(instr):
+    """Длительность паузы инструкции или None, если это не пауза"""
+    op = instr[0]
+    if op == OP_DELAY:
+        return instr[2]
+    if op == OP_WAIT:
+        return instr[3]
+    return None
+
+
+class OptimizeReport:
+    """Итог оптимизации: размер плана, шаги и оценка времени до и после"""
+    def __init__(self, before, after, dead_blocks):
+        self.ops_before = len(before)
+        self.ops_after = len(after)
+        self.seconds_before, self.steps_before = estimate_plan(before)
+        self.seconds_after, self.steps_after = estimate_plan(after)
+        self.dead_blocks = dead_blocks
+        self.removed = {}  # Причина -> количество удаленных инструкций
+        self.folded = 0    # Пауз, свернутых в соседние
+
+    @property
+    def ops_saved(self):
+        return self.ops_before - self.ops_after
+
+    @property
+    def steps_saved(self):
+        return self.steps_before - self.steps_after
+
+    def format(self):
+        """Текст отчета (несколько строк)"""
+        lines = [
+            f"⚙️ Оптимизация: инструкций {self.ops_before} → {self.ops_after}, "
+            f"шагов выполнения {self.steps_before} → {self.steps_after} (−{self.steps_saved})"
+        ]
+        details = [f"{reason}: {count}" for reason, count in self.removed.items() if count]
+        if self.folded:
+            details.append(f"свернуто пауз: {self.folded}")
+        if self.dead_blocks:
+            details.append(f"недостижимых блоков: {self.dead_blocks}")
+        if details:
+            lines.append("   " + ", ".join(details))
+        lines.append(f"   Оценка времени: {self.seconds_before:.2f} → {self.seconds_after:.2f} сек")
+        return '\n'.join(lines)
+
+
+def estimate_plan(plan):
+    """Оценка выполнения плана: (секунды, шаги интерпретатора).
+
+    Учитываются паузы, тайминги кликов и ввода и число итераций повторений.
+    Ожидание экрана считается по минимуму (для 'stable' - stable_ms).
+    Ветви считаются по очереди (для параллельного режима - верхняя оценка).
+    """
+    timing = plan.timing
+    typing = TypingEngine(None, timing)
+    sequential = plan.branch_mode != 'parallel'
+    seconds = 0.0
+    steps = 0
+    multiplier = 1
+    loops = []
+    for instr in plan.code:
+        op = instr[0]
+        steps += multiplier
+        if op == OP_LOOP:
+            loops.append(multiplier)
+            multiplier *= max(instr[2], 0)
+        elif op == OP_NEXT:
+            multiplier = loops.pop()
+        elif op == OP_DELAY or op == OP_WAIT:
+            seconds += multiplier * max(sleep_seconds(instr), 0)
+        elif op == OP_CLICK:
+            cost = timing['click_settle']
+            if instr[2] is not None:
+                cost += timing['input_pause']
+            seconds += multiplier * cost
+        elif op == OP_TYPE:
+            text = instr[2]
+            cost = typing.estimate(text, instr[4]) if text else 0.0
+            if instr[3]:
+                cost += timing['enter_before'] + timing['input_pause']
+            seconds += multiplier * (cost + timing['type_settle'])
+        elif op == OP_WATCH and instr[3][1] == 'stable':
+            seconds += multiplier * instr[3][3] / 1000
+        elif op == OP_FAIL and sequential and multiplier:
+            break
+    return seconds, steps
+
+
+def drop_dead_code(code, sequential, removed):
+    """Повторения 0 раз и (в последовательном режиме) всё после первой ошибки"""
+    drop = set()
+    pc = 0
+    while pc < len(code):
+        instr = code[pc]
+        op = instr[0]
+        if op == OP_LOOP and instr[2] <= 0:
+            # Тело никогда не выполняется - уходит вместе с OP_LOOP и OP_NEXT
+            drop.update(range(pc, instr[3]))
+            pc = instr[3]
+            continue
+        if op == OP_FAIL and sequential:
+            drop.update(range(pc + 1, len(code)))
+            break
+        pc += 1
+    removed['мертвый код'] = len(drop)
+    return rewrite(code, drop) if drop else code
+
+
+def drop_noops(code, sequential, removed):
+    """Инструкции, которые только показывают статус"""
+    drop = set()
+    counts = {'координаты': 0, 'группы': 0, 'нулевые паузы': 0, 'повторения 1 раз': 0, 'развилки': 0}
+    for pc, instr in enumerate(code):
+        op = instr[0]
+        if op == OP_COORD:
+            counts['координаты'] += 1
+        elif op == OP_GROUP:
+            counts['группы'] += 1
+        elif (op == OP_DELAY or op == OP_WAIT) and sleep_seconds(instr) <= 0:
+            counts['нулевые паузы'] += 1
+        elif op == OP_LOOP and instr[2] == 1:
+            if code[instr[3] - 1][0] != OP_NEXT:
+                continue  # Тело обрезано после ошибки - OP_NEXT уже нет
+            counts['повторения 1 раз'] += 1
+            drop.add(instr[3] - 1)  # Парный OP_NEXT
+        elif op == OP_FORK and sequential:
+            counts['развилки'] += 1
+        else:
+            continue
+        drop.add(pc)
+    removed.update(counts)
+    return rewrite(code, drop) if drop else code
+
+
+def drop_empty_loops(code, removed):
+    """Повторения, тело которых стало пустым (вложенные - до конца)"""
+    count = 0
+    while True:
+        drop = set()
+        for pc in range(len(code) - 1):
+            instr = code[pc]
+            if instr[0] == OP_LOOP and code[pc + 1][0] == OP_NEXT and code[pc + 1][3] == pc + 1:
+                drop.update((pc, pc + 1))
+        if not drop:
+            break
+        count += len(drop)
+        code = rewrite(code, drop)
+    removed['пустые повторения'] = count
+    return code
+
+
+def fold_sleeps(code):
+    """Свертка подряд идущих пауз. Возвращает (код, свернуто инструкций)"""
+    targets = jump_targets(code)
+    drop = set()
+    replace = {}
+    pc = 0
+    while pc < len(code):
+        if sleep_seconds(code[pc]) is None:
+            pc += 1
+            continue
+        end = pc + 1
+        while end < len(code) and end not in targets and sleep_seconds(code[end]) is not None:
+            end += 1
+        if end - pc > 1:
+            run = code[pc:end]
+            total = round(sum(sleep_seconds(instr) for instr in run), 6)
+            delays = [instr for instr in run if instr[0] == OP_DELAY]
+            if delays:
+                replace[pc] = (OP_DELAY, delays[0][1], total)
+            else:
+                replace[pc] = (OP_WAIT, run[0][1], run[0][2], total)
+            drop.update(range(pc + 1, end))
+        pc = end
+    if not drop:
+        return code, 0
+    return rewrite(code, drop, replace), len(drop)
+
+
+def optimize_plan(plan):
+    """Оптимизированная копия плана. Возвращает (FlowPlan, OptimizeReport)"""
+    sequential = plan.branch_mode != 'parallel'
+    removed = {}
+    code = list(plan.code)
+    code = drop_dead_code(code, sequential, removed)
+    code = drop_noops(code, sequential, removed)
+    code = drop_empty_loops(code, removed)
+    code, folded = fold_sleeps(code)
+
+    optimized = FlowPlan(code, plan.start_ids, plan.block_count, plan.timing, plan.branch_mode, plan.block_types)
+    # В план попадают только блоки, достижимые из начальных
+    compiled = {instr[1] for instr in plan.code if instr[0] != OP_WAIT}
+    compiled.update(instr[2] for instr in plan.code if instr[0] == OP_WAIT or instr[0] == OP_WATCH)
+    dead_blocks = sum(1 for block_id in plan.block_types if block_id not in compiled)
+    report = OptimizeReport(plan, optimized, dead_blocks)
+    report.removed = removed
+    report.folded = folded
+    return optimized, report
@@ -0,0 +1,262 @@
+"""
+Запуск сохраненного потока без редактора (без Tk).
+
+    python main.py run vibe_click_config.json [--profile fast] [--repeat 3] [--dry-run]
+    python flow_runner.py vibe_click_config.json ...
+    python main.py run vibe_click_config.json --export flow_script.py
+"""
+import time
+STARTUP_T0 = time.perf_counter()  # Начало отсчета для --startup-profile
+
+import argparse
+import sys
+import threading
+
+from flow_engine import (
+    compile_flow, FlowVM, FlowCompileError, StopToken, TIMING_PROFILES, DEFAULT_TIMING_PROFILE, BRANCH_MODES, OP_FIND
+)
+from flow_export import build_table_script
+from flow_graph import FlowGraph
+from flow_journal import load_flow
+from flow_optimizer import optimize_plan
+from flow_trace import Tracer
+from flow_validator import validate_flow
+from input_backends import create_backend, BACKENDS
+from screen_capture import FRAME_INTERVAL, FrameCache, SyntheticScreen
+from template_match import Template
+
+
+class DryRunToken(StopToken):
+    """Токен без реальных пауз - считает, сколько времени поток бы ждал"""
+    def __init__(self):
+        super().__init__()
+        self.waited = 0.0
+
+    def wait(self, seconds):
+        if seconds > 0:
+            self.waited += seconds
+        return not self.event.is_set()
+
+
+def dry_run_screen(plan, interval=FRAME_INTERVAL):
+    """Экран в памяти для --dry-run (через кэш кадров): образцы привязок стоят на сохраненных координатах"""
+    screen = SyntheticScreen()
+    for instr in plan.code:
+        if instr[0] != OP_FIND or instr[3] is None:
+            continue
+        template = Template(instr[2])
+        left, top = instr[3] - template.offset[0], instr[4] - template.offset[1]
+        width, height = screen.size()
+        if 0 <= left <= width - template.width and 0 <= top <= height - template.height:
+            screen.paste(left, top, template.frame)
+    return FrameCache(screen, interval)
+
+
+def load_flow_file(path):
+    """Загрузка потока из файла формата vibe_click_config.json (с изменениями из журнала автосохранения)"""
+    data = load_flow(path)
+    if data is None:
+        raise FileNotFoundError(f"файл не найден: {path}")
+    return FlowGraph.from_dict(data)
+
+
+def override_repeat(graph, repeat_count):
+    """Замена количества повторов во всех блоках повторений"""
+    for node in graph.nodes.values():
+        if node.type == 'repeat':
+            node.data['repeat_count'] = repeat_count
+
+
+def build_plan(graph, profile=None, branch_mode=None, optimize=True, on_report=None):
+    """Компиляция и (по умолчанию) оптимизация плана. on_report получает текст отчета оптимизации"""
+    plan = compile_flow(graph, profile, branch_mode)
+    if optimize:
+        plan, report = optimize_plan(plan)
+        if on_report is not None:
+            on_report(report.format())
+    return plan
+
+
+def run_flow(graph, profile=None, backend=None, token=None, on_status=None, branch_mode=None, tracer=None,
+             optimize=True, on_report=None, screen=None):
+    """Компиляция и выполнение потока в текущем потоке. Возвращает (результат, VM)"""
+    plan = build_plan(graph, profile, branch_mode, optimize, on_report)
+    return run_plan(plan, backend, token, on_status, tracer, screen)
+
+
+def run_plan(plan, backend=None, token=None, on_status=None, tracer=None, screen=None):
+    """Выполнение уже построенного плана в текущем потоке. Возвращает (результат, VM)"""
+    vm = FlowVM(
+        plan,
+        token=token,
+        backend=backend,
+        on_status=on_status,
+        on_error=lambda text: print(f"❌ {text}", file=sys.stderr),
+        on_warning=lambda text: print(f"⚠️  {text}", file=sys.stderr),
+        tracer=tracer,
+        screen=screen
+    )
+    return vm.run(), vm
+
+
+def save_trace(tracer, path):
+    """Запись трассы, если она включена"""
+    if tracer is None:
+        return
+    try:
+        tracer.save(path)
+        print(f"🧭 Трасса: {path} ({len(tracer.events)} событий)")
+    except OSError as e:
+        print(f"❌ Не удалось записать трассу {path}: {e}", file=sys.stderr)
+
+
+def print_vision_stats(vm):
+    """Статистика снимков экрана и поиска по изображению, если они были"""
+    for line in vm.vision_stats():
+        print(line)
+
+
+def export_script(graph, profile, path, optimize=True):
+    """Сохранение потока как Python скрипта с таблицей инструкций"""
+    try:
+        plan = build_plan(graph, profile, 'sequential', optimize, print)
+    except FlowCompileError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(build_table_script(plan, profile or graph.timing.get('profile', DEFAULT_TIMING_PROFILE)))
+    except OSError as e:
+        print(f"❌ Не удалось записать {path}: {e}", file=sys.stderr)
+        return 1
+    print(f"🐍 Скрипт: {path} ({len(plan)} инструкций)")
+    return 0
+
+
+def main(argv=None, started_at=None):
+    if started_at is None:
+        started_at = STARTUP_T0
+    parser = argparse.ArgumentParser(
+        prog='main.py run',
+        description='Выполнение сохраненного потока FlowClick Studio без редактора'
+    )
+    parser.add_argument('flow', help='файл потока (формат vibe_click_config.json)')
+    parser.add_argument('--profile', choices=list(TIMING_PROFILES), help='профиль таймингов (по умолчанию - из файла)')
+    parser.add_argument('--repeat', type=int, help='количество повторов для всех блоков повторений')
+    parser.add_argument('--branches', choices=BRANCH_MODES,
+                        help='выполнение ветвей: по очереди или параллельно (по умолчанию - из файла)')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='pyautogui', help='бэкенд ввода')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='показать план и действия без ввода и пауз (ветви - всегда по очереди)')
+    parser.add_argument('--quiet', action='store_true', help='не печатать статус каждого шага')
+    parser.add_argument('--trace', metavar='FILE', help='записать трассу выполнения (Chrome trace JSON, Perfetto)')
+    parser.add_argument('--startup-profile', action='store_true', help='напечатать время холодного запуска')
+    parser.add_argument('--export', metavar='FILE',
+                        help='не выполнять, а сохранить Python скрипт (таблица инструкций + интерпретатор)')
+    parser.add_argument('--no-optimize', action='store_true',
+                        help='выполнять план без оптимизации (координаты, группы и паузы - отдельными шагами)')
+    parser.add_argument('--frame-ms', type=float, default=FRAME_INTERVAL * 1000,
+                        help='сколько мс кадр экрана переиспользуется проверками (по умолчанию %(default).0f)')
+    args = parser.parse_args(argv)
+    frame_interval = max(0.0, args.frame_ms / 1000)
+
+    try:
+        graph = load_flow_file(args.flow)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Не удалось загрузить {args.flow}: {e}", file=sys.stderr)
+        return 1
+
+    if args.repeat is not None:
+        override_repeat(graph, args.repeat)
+
+    # Все проблемы потока сразу - до компиляции, экспорта и первого действия
+    report = validate_flow(graph)
+    if report.issues:
+        print(report.format(), file=sys.stderr)
+    if not report.ok:
+        return 1
+
+    on_status = None if args.quiet else print
+    tracer = Tracer() if args.trace else None
+    if args.startup_profile:
+        print(f"Профиль запуска: поток загружен за {(time.perf_counter() - started_at) * 1000:.1f} мс")
+
+    if args.export:
+        return export_script(graph, args.profile, args.export, not args.no_optimize)
+
+    if args.dry_run:
+        backend = create_backend('recording')
+        token = DryRunToken()
+        try:
+            plan = build_plan(graph, args.profile, 'sequential', not args.no_optimize, print)
+        except FlowCompileError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        if not args.quiet:
+            print(plan.dump())
+            print()
+        # Экран не снимается: ожидания экрана видят неизменный кадр, образцы находятся на своих координатах
+        result, vm = run_plan(plan, backend, token, tracer=tracer, screen=dry_run_screen(plan, frame_interval))
+        save_trace(tracer, args.trace)
+        for _, action, action_args in backend.events:
+            print(f"{action:<8} {', '.join(repr(a) for a in action_args)}")
+        print(f"\n{result}: {vm.steps} шагов, {len(backend.events)} действий, "
+              f"ожидание {token.waited:.2f} сек")
+        print_vision_stats(vm)
+        return 0 if result == 'done' else 1
+
+    backend = create_backend(args.backend)
+    if args.startup_profile:
+        print(f"Профиль запуска: готов к выполнению за {(time.perf_counter() - started_at) * 1000:.1f} мс")
+    token = StopToken()
+    outcome = {}
+
+    finished = threading.Event()
+
+    def worker():
+        try:
+            outcome['result'], outcome['vm'] = run_flow(
+                graph, args.profile, backend, token, on_status, args.branches, tracer,
+                not args.no_optimize, print, FrameCache(None, frame_interval)
+            )
+        except FlowCompileError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            outcome['result'] = 'failed'
+        except Exception as e:
+            print(f"❌ Ошибка выполнения: {e}", file=sys.stderr)
+            outcome['result'] = 'failed'
+        finally:
+            finished.set()
+
+    started = time.perf_counter()
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    # Основной поток только ждет - так Ctrl+C срабатывает сразу
+    while not finished.is_set():
+        try:
+            finished.wait(0.1)
+        except KeyboardInterrupt:
+            print("\n⏹️  Остановка...", file=sys.stderr)
+            token.stop()
+
+    result = outcome.get('result', 'failed')
+    elapsed = time.perf_counter() - started
+    save_trace(tracer, args.trace)
+    if 'vm' in outcome:
+        print_vision_stats(outcome['vm'])
+    if result == 'done':
+        print(f"✅ Выполнение завершено за {elapsed:.2f} сек")
+        vm = outcome['vm']
+        if vm.parallel:
+            print(f"⚡ Параллельные ветви сэкономили {vm.saved_time:.2f} сек")
+        return 0
+    if result == 'stopped':
+        latency = outcome['vm'].stop_latency
+        if latency is not None:
+            print(f"⚫ Выполнение остановлено за {latency * 1000:.1f} мс")
+        return 130
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Трассировка выполнения потока в формате Chrome trace-event JSON.
+
+Файл открывается в https://ui.perfetto.dev или chrome://tracing.
+Трассировка включается передачей Tracer в FlowVM. Без него обработчики
+инструкций и бэкенд не оборачиваются, поэтому выключенная трассировка
+ничего не стоит.
+"""
+import json
+import threading
+import time
+
+from input_backends import InputBackend
+
+
+class Tracer:
+    """Сбор интервалов (span) выполнения с монотонными отметками времени"""
+    def __init__(self):
+        self.events = []        # События trace-event (добавление в список потокобезопасно)
+        self.thread_names = {}  # tid -> имя потока
+        self.started_ns = time.perf_counter_ns()
+
+    def now(self):
+        """Время от начала трассировки (мкс)"""
+        return (time.perf_counter_ns() - self.started_ns) / 1000
+
+    def complete(self, name, category, start, end, args=None):
+        """Завершенный интервал [start, end] в мкс"""
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start,
+            'dur': end - start,
+            'pid': 1,
+            'tid': tid
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def to_dict(self):
+        """Трасса в формате Chrome trace-event"""
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'FlowClick Studio'}}]
+        for tid, name in self.thread_names.items():
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+        return {'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path):
+        """Запись трассы в файл"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+
+class TracingBackend(InputBackend):
+    """Обертка бэкенда ввода: каждый вызов записывается интервалом"""
+    def __init__(self, backend, tracer):
+        self.backend = backend
+        self.tracer = tracer
+        self.name = backend.name
+
+    def call(self, action, *args):
+        tracer = self.tracer
+        start = tracer.now()
+        try:
+            return getattr(self.backend, action)(*args)
+        finally:
+            tracer.complete(action, 'input', start, tracer.now(), {'args': [repr(a)[:80] for a in args]})
+
+    def click(self, x, y, button='left'):
+        self.call('click', x, y, button)
+
+    def drag(self, x, y, path, button='left'):
+        self.call('drag', x, y, path, button)
+
+    def hotkey(self, *keys):
+        self.call('hotkey', *keys)
+
+    def press(self, key):
+        self.call('press', key)
+
+    def write(self, text, interval=0.0):
+        self.call('write', text, interval)
+
+    def copy_to_clipboard(self, text):
+        self.call('copy_to_clipboard', text)
+
+    def position(self):
+        return self.call('position')
+
+    def set_pause(self, seconds):
+        self.backend.set_pause(seconds)
@@ -0,0 +1,245 @@
+"""
+Проверка потока перед выполнением и экспортом.
+
+Один проход O(V+E) по FlowGraph находит сразу все проблемы, а не первую
+встреченную при компиляции или выполнении:
+- циклы: блоки, не попавшие в топологический порядок, разбираются на
+  компоненты сильной связности (Тарьян без рекурсии);
+- блоки, недостижимые из начальных;
+- клики без источника координат хотя бы на одном пути к ним;
+- блоки координат без координат и с поврежденным образцом;
+- повторения 0 раз (тело не выполнится ни разу);
+- слияния 'every', после которых блоки выполняются больше JOIN_BLOWUP раз
+  за проход (каждый путь повторяет весь хвост - рост экспоненциальный);
+- слияния 'once' со входом через повторение ниже владельца (выполнятся
+  один раз после цикла, а не в каждой итерации);
+- ожидания экрана (блоки и соединения) без области.
+
+Ошибки запрещают запуск и экспорт, предупреждения только показываются.
+"""
+from flow_engine import join_mode, join_owners, looped_joins
+from template_match import anchor_key
+
+
+JOIN_BLOWUP = 16  # Выполнений блока за проход, после которых слияние 'every' - подозрительное
+
+
+class ValidationIssue:
+    """Одна проблема потока"""
+    __slots__ = ('level', 'message', 'block_ids')
+
+    def __init__(self, level, message, block_ids=()):
+        self.level = level          # 'error' или 'warning'
+        self.message = message
+        self.block_ids = tuple(block_ids)  # Блоки для подсветки на canvas
+
+    @property
+    def is_error(self):
+        return self.level == 'error'
+
+    def format(self):
+        return f"{'❌' if self.is_error else '⚠️ '} {self.message}"
+
+
+class ValidationReport:
+    """Итог проверки потока"""
+    def __init__(self, issues):
+        self.issues = issues
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue.is_error]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self.issues if not issue.is_error]
+
+    @property
+    def ok(self):
+        """Ошибок нет (предупреждения допустимы)"""
+        return not self.errors
+
+    def block_levels(self):
+        """id блока -> 'error' / 'warning' (ошибка важнее предупреждения)"""
+        levels = {}
+        for issue in self.issues:
+            for block_id in issue.block_ids:
+                if levels.get(block_id) != 'error':
+                    levels[block_id] = issue.level
+        return levels
+
+    def format(self, limit=None):
+        """Текст проблем (по строке на проблему, ошибки первыми)"""
+        issues = self.errors + self.warnings
+        lines = [issue.format() for issue in issues[:limit]]
+        if limit is not None and len(issues) > limit:
+            lines.append(f"... и еще {len(issues) - limit}")
+        return '\n'.join(lines)
+
+
+def find_cycles(graph, ids=None):
+    """Циклы графа (или его части ids): списки id блоков - компоненты сильной связности из 2+ блоков и петли"""
+    out_edges = graph.out
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    cycles = []
+    counter = 0
+    for root in (graph.nodes if ids is None else ids):
+        if root in index:
+            continue
+        # Явный стек обхода: (id, итератор по следующим блокам)
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(out_edges[root]))]
+        while work:
+            node_id, successors = work[-1]
+            for next_id in successors:
+                if next_id not in index:
+                    index[next_id] = low[next_id] = counter
+                    counter += 1
+                    stack.append(next_id)
+                    on_stack.add(next_id)
+                    work.append((next_id, iter(out_edges[next_id])))
+                    break
+                if next_id in on_stack:
+                    low[node_id] = min(low[node_id], index[next_id])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node_id])
+                if low[node_id] == index[node_id]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node_id:
+                            break
+                    if len(component) > 1 or node_id in out_edges[node_id]:
+                        cycles.append(component[::-1])
+    return cycles
+
+
+def reachable_ids(graph):
+    """Блоки, достижимые из начальных"""
+    seen = set(graph.start_ids())
+    queue = list(seen)
+    for node_id in queue:
+        for next_id in graph.out[node_id]:
+            if next_id not in seen:
+                seen.add(next_id)
+                queue.append(next_id)
+    return seen
+
+
+def has_point(node):
+    """Блок координат, из которого клик может взять точку"""
+    data = node.data
+    return node.type == 'coordinate' and (
+        bool(data.get('anchor')) or (data.get('x') is not None and data.get('y') is not None)
+    )
+
+
+def validate_flow(graph):
+    """Проверка графа потока (FlowGraph). Возвращает ValidationReport"""
+    issues = []
+    nodes = graph.nodes
+
+    order = graph.topological_order()
+    # Только блоки вне порядка могут лежать на цикле - обычно их нет
+    rest = []
+    if len(order) < len(nodes):
+        ordered = set(order)
+        rest = [node_id for node_id in nodes if node_id not in ordered]
+    for cycle in find_cycles(graph, rest):
+        path = ' → '.join(f"#{node_id}" for node_id in cycle + cycle[:1])
+        issues.append(ValidationIssue('error', f"Цикл в потоке: {path}", cycle))
+
+    if nodes and not graph.start_ids():
+        issues.append(ValidationIssue('error', "Нет начальных блоков (без входящих соединений)"))
+
+    reachable = reachable_ids(graph)
+    unreachable = [node_id for node_id in nodes if node_id not in reachable]
+    if unreachable:
+        listed = ', '.join(f"#{node_id}" for node_id in unreachable[:10])
+        if len(unreachable) > 10:
+            listed += ', ...'
+        issues.append(ValidationIssue(
+            'warning', f"Недостижимые блоки (не выполнятся): {listed}", unreachable
+        ))
+
+    # Точка для клика есть после блока на всех путях от начальных блоков.
+    # Порядок Кана идет от начальных блоков, поэтому все его блоки достижимы.
+    # Заодно считается, сколько раз блок выполнится за проход
+    carries = {}
+    runs = {}
+    owners = join_owners(graph)
+    for node_id in order:
+        node = nodes[node_id]
+        previous = graph.inc[node_id]
+        if node_id in owners:
+            owner = owners[node_id]
+            runs[node_id] = runs[owner] if owner is not None else 1
+        else:
+            runs[node_id] = sum(runs[prev_id] for prev_id in previous) or 1
+            if (runs[node_id] > JOIN_BLOWUP and len(previous) > 1 and join_mode(node) == 'every'
+                    and all(runs[prev_id] <= JOIN_BLOWUP for prev_id in previous)):
+                issues.append(ValidationIssue(
+                    'warning',
+                    f"Блок #{node_id}: слияние 'каждый путь' повторяет себя и блоки после него, "
+                    f"выполнений за проход: {runs[node_id]} (в режиме 'один раз' - 1)",
+                    (node_id,)
+                ))
+        carried = bool(previous) and all(carries[prev_id] for prev_id in previous)
+        if node.type == 'coordinate':
+            carried = True
+        elif node.type == 'click' and not carried:
+            # Как при компиляции: точку дает и любой входящий блок координат
+            carried = any(has_point(nodes[prev_id]) for prev_id in graph.inc[node_id])
+            if not carried:
+                issues.append(ValidationIssue(
+                    'error', f"Блок #{node_id}: клик без координат - перед ним нет блока координат", (node_id,)
+                ))
+        carries[node_id] = carried
+
+    for join_id, loop_id in looped_joins(graph, owners).items():
+        issues.append(ValidationIssue(
+            'warning',
+            f"Блок #{join_id}: слияние 'один раз' со входом из повторения #{loop_id} выполнится один раз "
+            f"после цикла, а не в каждой итерации (координаты - первого пути). Режим 'каждый путь' "
+            f"сохранит итерации",
+            (join_id, loop_id)
+        ))
+
+    for node_id, node in nodes.items():
+        data = node.data
+        if node.type == 'coordinate':
+            anchor = data.get('anchor')
+            if anchor:
+                try:
+                    anchor_key(anchor)
+                except (KeyError, TypeError, ValueError):
+                    issues.append(ValidationIssue(
+                        'error', f"Блок #{node_id}: поврежден образец привязки к изображению", (node_id,)
+                    ))
+            elif data.get('x') is None or data.get('y') is None:
+                issues.append(ValidationIssue('error', f"Блок #{node_id}: координаты не заданы", (node_id,)))
+        elif node.type == 'repeat' and data.get('repeat_count', 1) <= 0:
+            issues.append(ValidationIssue(
+                'warning', f"Блок #{node_id}: повторение 0 раз - следующие блоки не выполнятся", (node_id,)
+            ))
+        elif node.type == 'screen_wait' and not data.get('region'):
+            issues.append(ValidationIssue('error', f"Блок #{node_id}: область экрана не задана", (node_id,)))
+
+    for (from_id, to_id), edge in graph.edges.items():
+        if edge.watch and not edge.watch.get('region'):
+            issues.append(ValidationIssue(
+                'error', f"Соединение #{from_id} → #{to_id}: область экрана не задана", (from_id, to_id)
+            ))
+
+    return ValidationReport(issues)
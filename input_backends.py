@@ -0,0 +1,248 @@
+"""
+Бэкенды ввода для движка FlowClick Studio.
+
+Движок и захват координат работают через InputBackend, а не напрямую
+через pyautogui. Это позволяет заменить инжектор ввода и запускать
+потоки без рабочего стола (RecordingBackend).
+"""
+import time
+
+
+class InputBackend:
+    """Базовый интерфейс бэкенда ввода"""
+    name = 'base'
+
+    def click(self, x, y, button='left'):
+        """Клик в точке экрана"""
+        raise NotImplementedError
+
+    def drag(self, x, y, path, button='left'):
+        """Перетаскивание: нажатие в (x, y), движение по смещениям path [(dx, dy), ...], отпускание в последней точке"""
+        raise NotImplementedError
+
+    def hotkey(self, *keys):
+        """Сочетание клавиш, например hotkey('ctrl', 'v')"""
+        raise NotImplementedError
+
+    def press(self, key):
+        """Нажатие одной клавиши"""
+        raise NotImplementedError
+
+    def write(self, text, interval=0.0):
+        """Набор текста (одним вызовом)"""
+        raise NotImplementedError
+
+    def copy_to_clipboard(self, text):
+        """Копирование текста в буфер обмена"""
+        import pyperclip
+        pyperclip.copy(text)
+
+    def position(self):
+        """Текущая позиция курсора"""
+        raise NotImplementedError
+
+    def set_pause(self, seconds):
+        """Пауза после каждого вызова"""
+        pass
+
+
+class PyAutoGuiBackend(InputBackend):
+    """Ввод через pyautogui"""
+    name = 'pyautogui'
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+        pyautogui.FAILSAFE = True
+
+    def click(self, x, y, button='left'):
+        self.pyautogui.click(x, y, button=button)
+
+    def drag(self, x, y, path, button='left'):
+        pyautogui = self.pyautogui
+        pyautogui.moveTo(x, y, _pause=False)
+        pyautogui.mouseDown(button=button, _pause=False)
+        for dx, dy in path:
+            pyautogui.moveTo(x + dx, y + dy, _pause=False)
+        pyautogui.mouseUp(button=button)
+
+    def hotkey(self, *keys):
+        self.pyautogui.hotkey(*keys)
+
+    def press(self, key):
+        self.pyautogui.press(key)
+
+    def write(self, text, interval=0.0):
+        self.pyautogui.write(text, interval=interval)
+
+    def position(self):
+        x, y = self.pyautogui.position()
+        return x, y
+
+    def set_pause(self, seconds):
+        self.pyautogui.PAUSE = seconds
+
+
+class PynputBackend(InputBackend):
+    """Ввод через pynput (без встроенных пауз pyautogui)"""
+    name = 'pynput'
+
+    def __init__(self):
+        from pynput import mouse, keyboard
+        self.mouse = mouse.Controller()
+        self.keyboard = keyboard.Controller()
+        self.buttons = {
+            'left': mouse.Button.left,
+            'right': mouse.Button.right,
+            'middle': mouse.Button.middle
+        }
+        self.Key = keyboard.Key
+        self.pause = 0.0
+
+    def key(self, name):
+        """Имя клавиши в формате pyautogui -> клавиша pynput"""
+        aliases = {'control': 'ctrl', 'return': 'enter', 'escape': 'esc', 'win': 'cmd', 'command': 'cmd'}
+        name = aliases.get(name, name)
+        if len(name) == 1:
+            return name
+        return getattr(self.Key, name)
+
+    def click(self, x, y, button='left'):
+        self.mouse.position = (x, y)
+        self.mouse.click(self.buttons.get(button, self.buttons['left']))
+        self.after_call()
+
+    def drag(self, x, y, path, button='left'):
+        pressed = self.buttons.get(button, self.buttons['left'])
+        self.mouse.position = (x, y)
+        self.mouse.press(pressed)
+        for dx, dy in path:
+            self.mouse.position = (x + dx, y + dy)
+        self.mouse.release(pressed)
+        self.after_call()
+
+    def hotkey(self, *keys):
+        pressed = [self.key(k) for k in keys]
+        for k in pressed:
+            self.keyboard.press(k)
+        for k in reversed(pressed):
+            self.keyboard.release(k)
+        self.after_call()
+
+    def press(self, key):
+        k = self.key(key)
+        self.keyboard.press(k)
+        self.keyboard.release(k)
+        self.after_call()
+
+    def write(self, text, interval=0.0):
+        if interval > 0:
+            for char in text:
+                self.keyboard.type(char)
+                time.sleep(interval)
+        else:
+            self.keyboard.type(text)
+        self.after_call()
+
+    def position(self):
+        x, y = self.mouse.position
+        return int(x), int(y)
+
+    def set_pause(self, seconds):
+        self.pause = seconds
+
+    def after_call(self):
+        if self.pause > 0:
+            time.sleep(self.pause)
+
+
+class RecordingBackend(InputBackend):
+    """Бэкенд в памяти: записывает события с отметками времени, ничего не ждет.
+
+    Нужен для замера накладных расходов движка и запуска без рабочего стола.
+    """
+    name = 'recording'
+
+    def __init__(self, cursor=(0, 0)):
+        self.events = []  # (время от старта, действие, аргументы)
+        self.clipboard = ''
+        self.cursor = cursor
+        self.pause = 0.0
+        self.started_at = time.perf_counter()
+
+    def record(self, action, *args):
+        self.events.append((time.perf_counter() - self.started_at, action, args))
+
+    def click(self, x, y, button='left'):
+        self.cursor = (x, y)
+        self.record('click', x, y, button)
+
+    def drag(self, x, y, path, button='left'):
+        if path:
+            self.cursor = (x + path[-1][0], y + path[-1][1])
+        self.record('drag', x, y, path, button)
+
+    def hotkey(self, *keys):
+        self.record('hotkey', *keys)
+
+    def press(self, key):
+        self.record('press', key)
+
+    def write(self, text, interval=0.0):
+        self.record('write', text)
+
+    def copy_to_clipboard(self, text):
+        self.clipboard = text
+        self.record('copy', text)
+
+    def position(self):
+        return self.cursor
+
+    def set_pause(self, seconds):
+        # Пауза только запоминается - бэкенд никогда не спит
+        self.pause = seconds
+
+    def clear(self):
+        self.events = []
+        self.started_at = time.perf_counter()
+
+
+class NullBackend(InputBackend):
+    """Бэкенд, который ничего не делает - для замеров чистых накладных расходов движка"""
+    name = 'null'
+
+    def click(self, x, y, button='left'):
+        pass
+
+    def drag(self, x, y, path, button='left'):
+        pass
+
+    def hotkey(self, *keys):
+        pass
+
+    def press(self, key):
+        pass
+
+    def write(self, text, interval=0.0):
+        pass
+
+    def copy_to_clipboard(self, text):
+        pass
+
+    def position(self):
+        return 0, 0
+
+
+BACKENDS = {
+    'pyautogui': PyAutoGuiBackend,
+    'pynput': PynputBackend,
+    'recording': RecordingBackend,
+    'null': NullBackend,
+}
+
+
+def create_backend(name='pyautogui'):
+    """Создание бэкенда ввода по имени"""
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд ввода: {name} (доступны: {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
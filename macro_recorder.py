@@ -0,0 +1,278 @@
+"""
+Запись макроса: клики и ввод текста пользователя -> блоки потока.
+
+Обработчики pynput вызываются в потоках слушателей и только кладут
+событие в заранее выделенный кольцевой буфер EventRing - без блокировок,
+выделения списков и обращений к Tk, поэтому ввод пользователя не
+задерживается. Редактор периодически забирает события из буфера (drain).
+
+Движения мыши между действиями только считаются (клик сам перемещает
+курсор), а пока кнопка нажата - собираются в путь перетаскивания. При
+отпускании путь упрощается алгоритмом Рамера-Дугласа-Пекера с допуском
+PATH_TOLERANCE и сохраняется как смещения от точки нажатия - длинная
+запись остается компактной.
+
+build_macro превращает события в шаги: ('click', x, y, кнопка, пауза),
+('drag', x, y, кнопка, пауза, путь) и ('type', текст, enter, пауза), где
+пауза - время от предыдущего действия (в редакторе - задержка на соединении).
+"""
+import itertools
+import time
+
+
+RING_CAPACITY = 65536   # Событий в кольцевом буфере
+PATH_TOLERANCE = 3.0    # Допуск упрощения пути мыши (пиксели)
+PATH_COMPACT = 4096     # Точек пути, после которых он упрощается, не дожидаясь отпускания
+DRAG_MIN_DISTANCE = 5   # Ближе (пиксели) отпускание считается обычным кликом
+MIN_GAP = 0.05          # Паузы короче (сек) не записываются
+CLICK_BUTTONS = ('left', 'right', 'middle')
+
+# Модификаторы: пока нажат хотя бы один, клавиши - это сочетания, а не текст
+MODIFIER_KEYS = ('ctrl', 'ctrl_l', 'ctrl_r', 'alt', 'alt_l', 'alt_r', 'alt_gr', 'cmd', 'cmd_l', 'cmd_r')
+SHIFT_KEYS = ('shift', 'shift_l', 'shift_r')
+KEY_CHARS = {'space': ' ', 'tab': '\t'}
+
+
+class EventRing:
+    """Кольцевой буфер событий фиксированного размера.
+
+    Запись: номер слота берется из itertools.count (атомарно при GIL),
+    слот перезаписывается кортежем с этим номером. Чтение идет по номерам:
+    слот с меньшим номером еще не записан, с большим - уже перезаписан
+    (читатель отстал на целый круг, события считаются потерянными).
+    """
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.counter = itertools.count()
+        self.read_seq = 0  # Номер следующего события для чтения
+        self.lost = 0
+
+    def push(self, kind, a=None, b=None, c=None):
+        """Запись события (вызывается из потоков слушателей)"""
+        seq = next(self.counter)
+        self.slots[seq % self.capacity] = (seq, time.perf_counter(), kind, a, b, c)
+
+    def drain(self):
+        """События, записанные с прошлого чтения: [(время, тип, a, b, c), ...]"""
+        slots = self.slots
+        capacity = self.capacity
+        result = []
+        seq = self.read_seq
+        while True:
+            entry = slots[seq % capacity]
+            if entry is None or entry[0] < seq:
+                break  # Еще не записано
+            if entry[0] > seq:
+                # Слот перезаписан - пропускаем до самого старого сохранившегося события
+                oldest = entry[0] - capacity + 1
+                self.lost += oldest - seq
+                seq = oldest
+                continue
+            result.append(entry[1:])
+            seq += 1
+        self.read_seq = seq
+        return result
+
+
+def simplify_path(points, tolerance=PATH_TOLERANCE):
+    """Упрощение ломаной (Рамер-Дуглас-Пекер, явный стек вместо рекурсии)"""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    limit = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = points[first]
+        x2, y2 = points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        farthest, worst = None, limit
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length == 0:
+                distance = (px - x1) ** 2 + (py - y1) ** 2
+            else:
+                # Квадрат расстояния до прямой через концы участка
+                cross = dx * (py - y1) - dy * (px - x1)
+                distance = cross * cross / length
+            if distance > worst:
+                farthest, worst = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+class MacroRecorder:
+    """Запись событий мыши и клавиатуры через слушатели pynput"""
+    def __init__(self, capacity=RING_CAPACITY, tolerance=PATH_TOLERANCE):
+        self.ring = EventRing(capacity)
+        self.tolerance = tolerance
+        self.events = []  # Действия: (время, тип, a, b, c) без движений мыши
+        self.path = None  # Путь при нажатой кнопке: [(x, y), ...], иначе None
+        self.moves = 0    # Всего получено движений мыши
+        self.listeners = []
+        self.started = None
+
+    def start(self):
+        """Запуск слушателей (ImportError, если pynput не установлен)"""
+        from pynput import mouse, keyboard
+        push = self.ring.push
+
+        def on_move(x, y):
+            push('move', x, y)
+
+        def on_click(x, y, button, pressed):
+            push('click' if pressed else 'up', x, y, button.name)
+
+        def on_press(key):
+            push('key', key)
+
+        def on_release(key):
+            push('release', key)
+
+        self.started = time.perf_counter()
+        self.listeners = [
+            mouse.Listener(on_move=on_move, on_click=on_click),
+            keyboard.Listener(on_press=on_press, on_release=on_release),
+        ]
+        for listener in self.listeners:
+            listener.start()
+
+    def stop(self):
+        """Остановка слушателей и чтение оставшихся событий"""
+        for listener in self.listeners:
+            listener.stop()
+        self.listeners = []
+        self.drain()
+
+    def drain(self):
+        """Перенос событий из буфера: действия - в events, движения - в путь. Возвращает число действий"""
+        actions = 0
+        for event in self.ring.drain():
+            moment, kind, x, y, button = event
+            if kind == 'move':
+                self.moves += 1
+                if self.path is not None:
+                    self.path.append((x, y))
+                    if len(self.path) >= PATH_COMPACT:
+                        self.path = simplify_path(self.path, self.tolerance)
+                continue
+            if kind == 'click':
+                self.path = [(x, y)]
+            elif kind == 'up':
+                event = (moment, kind, x, y, (button, self.close_path(x, y)))
+            self.events.append(event)
+            actions += 1
+        return actions
+
+    def close_path(self, x, y):
+        """Упрощенный путь нажатой кнопки до точки (x, y): смещения [(dx, dy), ...] от точки нажатия"""
+        path = self.path
+        self.path = None
+        if not path:
+            return []
+        path.append((x, y))
+        x0, y0 = path[0]
+        return [(px - x0, py - y0) for px, py in simplify_path(path, self.tolerance)[1:]]
+
+
+def key_name(key):
+    """Имя специальной клавиши pynput (Key.enter -> 'enter') или None"""
+    name = getattr(key, 'name', None)
+    return name if isinstance(name, str) else None
+
+
+def is_drag(path):
+    """Путь уходит от точки нажатия хотя бы на DRAG_MIN_DISTANCE"""
+    limit = DRAG_MIN_DISTANCE * DRAG_MIN_DISTANCE
+    return any(dx * dx + dy * dy >= limit for dx, dy in path)
+
+
+def build_macro(events, exclude=None, min_gap=MIN_GAP):
+    """Шаги макроса из событий MacroRecorder.events.
+
+    exclude - прямоугольник экрана (x1, y1, x2, y2), клики в котором не
+    записываются (окно редактора). Возвращает (шаги, пропущено клавиш).
+    """
+    steps = []
+    text = []
+    text_gap = 0.0
+    last_time = None
+    held = set()  # Нажатые модификаторы - по физическим клавишам (ctrl_l и ctrl_r отдельно)
+    pressed = None  # Номер шага клика, кнопка которого еще не отпущена
+    skipped = 0
+
+    def gap_to(moment):
+        if last_time is None:
+            return 0.0
+        gap = round(moment - last_time, 2)
+        return gap if gap >= min_gap else 0.0
+
+    def flush_text(press_enter):
+        if text or press_enter:
+            steps.append(('type', ''.join(text), press_enter, text_gap))
+            del text[:]
+
+    for moment, kind, a, b, c in events:
+        if kind == 'click':
+            pressed = None
+            if c not in CLICK_BUTTONS:
+                continue
+            if exclude is not None and exclude[0] <= a <= exclude[2] and exclude[1] <= b <= exclude[3]:
+                continue
+            flush_text(False)
+            pressed = len(steps)
+            steps.append(('click', a, b, c, gap_to(moment)))
+            last_time = moment
+            continue
+        if kind == 'up':
+            button, path = c
+            if pressed == len(steps) - 1 and steps[pressed][3] == button and is_drag(path):
+                # Отпускание далеко от нажатия - клик становится перетаскиванием
+                steps[pressed] = ('drag',) + steps[pressed][1:] + (path,)
+            pressed = None
+            continue
+        if kind == 'move':
+            continue
+
+        name = key_name(a)
+        if kind == 'release':
+            held.discard(name)
+            continue
+        if name in MODIFIER_KEYS:
+            held.add(name)
+            continue
+        if name in SHIFT_KEYS:
+            continue  # Регистр уже учтен в символе
+        if held:
+            skipped += 1  # Сочетание клавиш (Ctrl+C и т.п.)
+            continue
+
+        if name == 'enter':
+            if not text:
+                text_gap = gap_to(moment)
+            flush_text(True)
+            last_time = moment
+            continue
+        if name == 'backspace':
+            if text:
+                text.pop()
+            else:
+                skipped += 1
+            continue
+        char = getattr(a, 'char', None) or KEY_CHARS.get(name)
+        if not char:
+            skipped += 1
+            continue
+        if not text:
+            text_gap = gap_to(moment)
+        text.append(char)
+        last_time = moment
+
+    flush_text(False)
+    return steps, skipped
@@ -1,16 +1,65 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, Canvas
-import pyautogui
-import threading
 import time
-import keyboard
-import json
-import os
-from pynput import mouse
+STARTUP_T0 = time.perf_counter()  # Начало отсчета для --startup-profile
+
+import threading
+import sys
 import math
+from flow_engine import (
+    compile_flow, resolve_timing, FlowVM, FlowCompileError, StopToken, ProgressChannel,
+    TIMING_PROFILES, BRANCH_MODES, watch_spec, join_mode
+)
+from flow_export import build_table_script, build_code_script
+from flow_graph import FlowGraph
+from flow_journal import FlowJournal
+from flow_optimizer import optimize_plan
+from flow_validator import validate_flow
+from flow_trace import Tracer
+from input_backends import create_backend
+from macro_recorder import MacroRecorder, build_macro
+from screen_capture import parse_color, create_screen
+from spatial_index import GridIndex
+from template_match import AnchorLocator, LookupStats, ANCHOR_SIZE, encode_template
+from typing_engine import TypingEngine
+from viewport import Viewport
+
+# Модули интерфейса загружаются в load_ui_modules(), чтобы запуск без
+# редактора (python main.py run ...) не импортировал tkinter
+tk = ttk = messagebox = Canvas = None
+
+# Период опроса прогресса выполнения интерфейсом (~30 кадров в секунду)
+PROGRESS_INTERVAL_MS = 33
+
+# Тег скрытого элемента-якоря: соединения держатся сразу под ним -
+# выше сетки и ниже всех блоков
+CONNECTION_LAYER = "connection_layer"
+
+# Форматы экспорта в Python: таблица инструкций + интерпретатор или код для каждого блока
+EXPORT_FORMATS = ('table', 'code')
+
+# Длительность одной порции отрисовки - между порциями Tk обрабатывает события
+RENDER_SLICE_SEC = 0.015
+
+# Прокрутка колесом мыши (экранные пиксели за щелчок колеса)
+WHEEL_STEP = 60
+
+# Запись макроса: период чтения буфера событий и раскладка созданных блоков
+RECORD_POLL_MS = 50
+RECORD_STEP_X = 130
+RECORD_STEP_Y = 140
+RECORD_COLUMNS = 8
+
+
+def load_ui_modules():
+    """Импорт tkinter (только для редактора)"""
+    global tk, ttk, messagebox, Canvas
+    import tkinter as tk
+    from tkinter import ttk, messagebox, Canvas
+
 
 class Block:
     """Базовый класс для блоков"""
+    COLOR = "#95a5a6"  # Цвет упрощенной отрисовки (мелкий масштаб)
+    
     def __init__(self, canvas, x, y, block_type, block_id):
         self.canvas = canvas
         self.x = x
@@ -20,39 +69,105 @@ class Block:
         self.shapes = []  # Список ID элементов canvas
         self.text_ids = []
         self.data = {}
-        self.connections_out = []  # Исходящие связи
-        self.connections_in = []   # Входящие связи
-        
+    
     def draw(self):
-        """Отрисовка блока"""
+        """Отрисовка блока, если он в видимой области (canvas.view - Viewport редактора)"""
+        view = self.canvas.view
+        if not view.visible(self.bounds()):
+            return
+        if view.detailed:
+            self.draw_detail()
+            if view.zoom != 1:
+                self.scale_items(view.zoom)
+        else:
+            self.draw_simple(view.zoom)
+    
+    def draw_detail(self):
+        """Полная отрисовка блока в мировых координатах"""
         pass
     
+    def draw_simple(self, zoom):
+        """Упрощенная отрисовка - один прямоугольник без текста и тени"""
+        x1, y1, x2, y2 = self.bounds()
+        rect = self.canvas.create_rectangle(
+            x1 * zoom, y1 * zoom, x2 * zoom, y2 * zoom,
+            fill=self.COLOR,
+            outline="",
+            tags=f"block_{self.id}"
+        )
+        self.shapes.append(rect)
+    
+    def scale_items(self, zoom):
+        """Масштабирование нарисованных элементов и шрифтов"""
+        canvas = self.canvas
+        for shape_id in self.shapes + self.text_ids:
+            canvas.scale(shape_id, 0, 0, zoom, zoom)
+        for text_id in self.text_ids:
+            family, size, *style = canvas.tk.splitlist(canvas.itemcget(text_id, 'font'))
+            canvas.itemconfig(text_id, font=(family, max(1, round(int(size) * zoom)), *style))
+    
+    def set_text(self, text_id, text):
+        """Изменение подписи (у блока вне видимой области подписей нет)"""
+        if text_id is not None:
+            self.canvas.itemconfig(text_id, text=text)
+    
+    def is_drawn(self):
+        """Есть ли у блока элементы на canvas"""
+        return bool(self.shapes)
+    
     def move(self, dx, dy):
         """Перемещение блока"""
         self.x += dx
         self.y += dy
+        if not self.shapes:
+            return
+        zoom = self.canvas.view.zoom
         for shape_id in self.shapes + self.text_ids:
-            self.canvas.move(shape_id, dx, dy)
+            self.canvas.move(shape_id, dx * zoom, dy * zoom)
         
     def contains_point(self, x, y):
         """Проверка попадания точки в блок"""
         return False
     
+    def bounds(self):
+        """Прямоугольник блока (x1, y1, x2, y2)"""
+        width = getattr(self, 'WIDTH', getattr(self, 'SIZE', 0))
+        height = getattr(self, 'HEIGHT', getattr(self, 'SIZE', 0))
+        return self.x, self.y, self.x + width, self.y + height
+    
+    def center(self):
+        """Центр блока - точка крепления стрелок"""
+        width = getattr(self, 'WIDTH', getattr(self, 'SIZE', 0))
+        height = getattr(self, 'HEIGHT', getattr(self, 'SIZE', 0))
+        return self.x + width // 2, self.y + height // 2
+    
     def delete(self):
         """Удаление блока"""
         for shape_id in self.shapes + self.text_ids:
             self.canvas.delete(shape_id)
+        self.shapes = []
+        self.text_ids = []
 
 class CoordinateBlock(Block):
     """Блок координат (квадрат)"""
     SIZE = 80
-    
+    COLOR = "#3498db"
+
     def __init__(self, canvas, x, y, block_id):
         super().__init__(canvas, x, y, 'coordinate', block_id)
         self.data = {'x': None, 'y': None}
+        self.coord_text = None
         self.draw()
-    
-    def draw(self):
+
+    def coord_label(self):
+        """Подпись с координатами (🎯 - точка ищется по изображению)"""
+        if self.data.get('anchor'):
+            return "🎯 по образцу"
+        if self.data['x'] is None:
+            return "Не задано"
+        return f"X:{self.data['x']}\nY:{self.data['y']}"
+    
+    def draw_detail(self):
         """Отрисовка квадрата"""
         # Тень
         shadow = self.canvas.create_rectangle(
@@ -96,7 +211,7 @@ class CoordinateBlock(Block):
         # Координаты
         self.coord_text = self.canvas.create_text(
             self.x + self.SIZE // 2, self.y + 65,
-            text="Не задано",
+            text=self.coord_label(),
             font=("Segoe UI", 7),
             fill="white",
             tags=f"block_{self.id}"
@@ -107,7 +222,15 @@ class CoordinateBlock(Block):
         """Обновление координат"""
         self.data['x'] = x
         self.data['y'] = y
-        self.canvas.itemconfig(self.coord_text, text=f"X:{x}\nY:{y}")
+        self.set_text(self.coord_text, self.coord_label())
+    
+    def set_anchor(self, anchor):
+        """Привязка к изображению (None - обычные координаты)"""
+        if anchor:
+            self.data['anchor'] = anchor
+        else:
+            self.data.pop('anchor', None)
+        self.set_text(self.coord_text, self.coord_label())
     
     def contains_point(self, x, y):
         """Проверка попадания точки в квадрат"""
@@ -117,13 +240,17 @@ class CoordinateBlock(Block):
 class ClickBlock(Block):
     """Блок клика (треугольник)"""
     SIZE = 80
+    COLOR = "#27ae60"
     
-    def __init__(self, canvas, x, y, block_id, click_type='left'):
+    def __init__(self, canvas, x, y, block_id, click_type='left', drag=None):
         super().__init__(canvas, x, y, 'click', block_id)
         self.data = {'click_type': click_type}
+        if drag:
+            # Перетаскивание: смещения [dx, dy] точек пути от точки нажатия
+            self.data['drag'] = [list(point) for point in drag]
         self.draw()
     
-    def draw(self):
+    def draw_detail(self):
         """Отрисовка треугольника"""
         # Цвета в зависимости от типа клика
         colors = {
@@ -162,7 +289,7 @@ class ClickBlock(Block):
         icons = {'left': "👆", 'right': "👉", 'middle': "☝️"}
         icon = self.canvas.create_text(
             self.x + self.SIZE // 2, self.y + 25,
-            text=icons.get(self.data['click_type'], "🖱️"),
+            text="✋" if self.data.get('drag') else icons.get(self.data['click_type'], "🖱️"),
             font=("Segoe UI", 16),
             fill="white",
             tags=f"block_{self.id}"
@@ -182,7 +309,7 @@ class ClickBlock(Block):
         
         click_text = self.canvas.create_text(
             self.x + self.SIZE // 2, self.y + 65,
-            text="клик",
+            text="перетаск." if self.data.get('drag') else "клик",
             font=("Segoe UI", 7),
             fill="white",
             tags=f"block_{self.id}"
@@ -197,33 +324,55 @@ class ClickBlock(Block):
 
 class Connection:
     """Соединение между блоками"""
-    def __init__(self, canvas, from_block, to_block, delay=0.0):
+    def __init__(self, canvas, from_block, to_block, delay=0.0, watch=None):
         self.canvas = canvas
         self.from_block = from_block
         self.to_block = to_block
         self.delay = delay  # Задержка на переходе
+        self.watch = watch  # Ожидание экрана после задержки (dict) или None
         self.line_id = None
         self.arrow_id = None
         self.text_id = None
         self.delay_circle_id = None  # ID желтого круга с задержкой
+        self.shown_delay = None  # Подпись, которая сейчас написана на стрелке
         self.draw()
     
-    def draw(self):
-        """Отрисовка стрелки"""
-        # Центры блоков (учитываем разные типы блоков)
-        if hasattr(self.from_block, 'SIZE'):
-            x1 = self.from_block.x + self.from_block.SIZE // 2
-            y1 = self.from_block.y + self.from_block.SIZE // 2
-        else:  # GroupBlock с WIDTH и HEIGHT
-            x1 = self.from_block.x + self.from_block.WIDTH // 2
-            y1 = self.from_block.y + self.from_block.HEIGHT // 2
-        
-        if hasattr(self.to_block, 'SIZE'):
-            x2 = self.to_block.x + self.to_block.SIZE // 2
-            y2 = self.to_block.y + self.to_block.SIZE // 2
-        else:  # GroupBlock с WIDTH и HEIGHT
-            x2 = self.to_block.x + self.to_block.WIDTH // 2
-            y2 = self.to_block.y + self.to_block.HEIGHT // 2
+    def endpoints(self):
+        """Концы стрелки - центры блоков (x1, y1, x2, y2)"""
+        return self.from_block.center() + self.to_block.center()
+    
+    def bounds(self, tolerance=10):
+        """Прямоугольник вокруг стрелки с запасом на точность клика"""
+        x1, y1, x2, y2 = self.endpoints()
+        return min(x1, x2) - tolerance, min(y1, y2) - tolerance, max(x1, x2) + tolerance, max(y1, y2) + tolerance
+    
+    def to_layer(self, item_id):
+        """Помещение элемента в слой соединений (выше сетки, ниже блоков)"""
+        self.canvas.tag_lower(item_id, CONNECTION_LAYER)
+    
+    def draw(self, lower=True):
+        """Отрисовка стрелки, если она в видимой области.
+
+        lower=False - не опускать элементы в слой соединений по одному
+        (при пакетной отрисовке слой восстанавливается один раз в конце)
+        """
+        view = self.canvas.view
+        if not view.visible(self.bounds()):
+            return
+        zoom = view.zoom
+        x1, y1, x2, y2 = (c * zoom for c in self.endpoints())
+        
+        if not view.detailed:
+            # Мелкий масштаб - тонкая линия без стрелки и задержки
+            self.line_id = self.canvas.create_line(
+                x1, y1, x2, y2,
+                fill="#7f8c8d",
+                width=1,
+                tags="connection"
+            )
+            if lower:
+                self.to_layer(self.line_id)
+            return
         
         # Рисуем линию
         self.line_id = self.canvas.create_line(
@@ -234,69 +383,102 @@ class Connection:
             arrowshape=(12, 15, 5),
             tags="connection"
         )
+        if lower:
+            self.to_layer(self.line_id)
+        
+        # Если есть задержка или ожидание экрана - показываем на стрелке
+        if self.delay_label():
+            self.draw_delay((x1 + x2) // 2, (y1 + y2) // 2, zoom, lower)
+    
+    def delay_label(self):
+        """Подпись на стрелке: задержка и значок ожидания экрана"""
+        label = f"{self.delay}s" if self.delay > 0 else ""
+        if self.watch:
+            label += "👁"
+        return label
+    
+    def draw_delay(self, mid_x, mid_y, zoom=1.0, lower=True):
+        """Круг с задержкой в середине стрелки"""
+        radius = 15 * zoom
+        # Фон для текста
+        self.delay_circle_id = self.canvas.create_oval(
+            mid_x - radius, mid_y - radius,
+            mid_x + radius, mid_y + radius,
+            fill="#ff9800",
+            outline="#f57c00",
+            width=2,
+            tags="connection"
+        )
+        if lower:
+            self.to_layer(self.delay_circle_id)
         
-        # Опускаем на задний план
-        self.canvas.tag_lower("connection")
-        
-        # Если есть задержка - показываем её на стрелке
-        if self.delay > 0:
-            mid_x = (x1 + x2) // 2
-            mid_y = (y1 + y2) // 2
-            
-            # Фон для текста
-            self.delay_circle_id = self.canvas.create_oval(
-                mid_x - 15, mid_y - 15,
-                mid_x + 15, mid_y + 15,
-                fill="#ff9800",
-                outline="#f57c00",
-                width=2,
-                tags="connection"
-            )
-            
-            # Текст с временем
-            self.text_id = self.canvas.create_text(
-                mid_x, mid_y,
-                text=f"{self.delay}s",
-                font=("Segoe UI", 8, "bold"),
-                fill="white",
-                tags="connection"
-            )
+        # Текст с временем
+        label = self.delay_label()
+        self.text_id = self.canvas.create_text(
+            mid_x, mid_y,
+            text=label,
+            font=("Segoe UI", max(1, round(8 * zoom)), "bold"),
+            fill="white",
+            tags="connection"
+        )
+        if lower:
+            self.to_layer(self.text_id)
+        self.shown_delay = label
     
-    def update(self):
-        """Обновление позиции стрелки"""
-        if self.line_id:
-            self.canvas.delete(self.line_id)
+    def delete_delay(self):
+        """Удаление круга с задержкой"""
         if self.text_id:
             self.canvas.delete(self.text_id)
         if self.delay_circle_id:
             self.canvas.delete(self.delay_circle_id)
-        self.draw()
+        self.text_id = None
+        self.delay_circle_id = None
+        self.shown_delay = None
+    
+    def update(self):
+        """Обновление стрелки: существующие элементы только перемещаются"""
+        view = self.canvas.view
+        if not view.visible(self.bounds()):
+            self.delete()
+            return
+        if self.line_id is None:
+            self.draw()
+            return
+        zoom = view.zoom
+        x1, y1, x2, y2 = (c * zoom for c in self.endpoints())
+        self.canvas.coords(self.line_id, x1, y1, x2, y2)
+        if not view.detailed:
+            return
+        
+        mid_x = (x1 + x2) // 2
+        mid_y = (y1 + y2) // 2
+        radius = 15 * zoom
+        label = self.delay_label()
+        if not label:
+            self.delete_delay()
+        elif self.delay_circle_id is None:
+            self.draw_delay(mid_x, mid_y, zoom)
+        else:
+            self.canvas.coords(self.delay_circle_id, mid_x - radius, mid_y - radius, mid_x + radius, mid_y + radius)
+            self.canvas.coords(self.text_id, mid_x, mid_y)
+            if self.shown_delay != label:
+                self.canvas.itemconfig(self.text_id, text=label)
+                self.shown_delay = label
+    
+    def is_drawn(self):
+        """Есть ли у стрелки элементы на canvas"""
+        return self.line_id is not None
     
     def delete(self):
         """Удаление соединения"""
         if self.line_id:
             self.canvas.delete(self.line_id)
-        if self.text_id:
-            self.canvas.delete(self.text_id)
-        if self.delay_circle_id:
-            self.canvas.delete(self.delay_circle_id)
+            self.line_id = None
+        self.delete_delay()
     
     def contains_point(self, x, y, tolerance=10):
         """Проверка попадания точки на линию"""
-        # Получаем координаты линии
-        if hasattr(self.from_block, 'SIZE'):
-            x1 = self.from_block.x + self.from_block.SIZE // 2
-            y1 = self.from_block.y + self.from_block.SIZE // 2
-        else:
-            x1 = self.from_block.x + self.from_block.WIDTH // 2
-            y1 = self.from_block.y + self.from_block.HEIGHT // 2
-        
-        if hasattr(self.to_block, 'SIZE'):
-            x2 = self.to_block.x + self.to_block.SIZE // 2
-            y2 = self.to_block.y + self.to_block.SIZE // 2
-        else:
-            x2 = self.to_block.x + self.to_block.WIDTH // 2
-            y2 = self.to_block.y + self.to_block.HEIGHT // 2
+        x1, y1, x2, y2 = self.endpoints()
         
         # Расстояние от точки до линии
         line_len = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
@@ -314,13 +496,15 @@ class Connection:
 class DelayBlock(Block):
     """Блок задержки (зеленый круг)"""
     SIZE = 80
+    COLOR = "#27ae60"
     
     def __init__(self, canvas, x, y, block_id, delay=1.0):
         super().__init__(canvas, x, y, 'delay', block_id)
         self.data = {'delay': delay}
+        self.delay_text = None
         self.draw()
     
-    def draw(self):
+    def draw_detail(self):
         """Отрисовка зеленого круга"""
         radius = self.SIZE // 2
         center_x = self.x + radius
@@ -380,7 +564,7 @@ class DelayBlock(Block):
         self.data['delay'] = delay
         center_x = self.x + self.SIZE // 2
         center_y = self.y + self.SIZE // 2
-        self.canvas.itemconfig(self.delay_text, text=f"{delay} сек")
+        self.set_text(self.delay_text, f"{delay} сек")
     
     def contains_point(self, x, y):
         """Проверка попадания точки в круг"""
@@ -393,13 +577,15 @@ class DelayBlock(Block):
 class RepeatBlock(Block):
     """Блок повторений (синий круг)"""
     SIZE = 80
+    COLOR = "#3498db"
     
     def __init__(self, canvas, x, y, block_id, repeat_count=1):
         super().__init__(canvas, x, y, 'repeat', block_id)
         self.data = {'repeat_count': repeat_count}
+        self.repeat_text = None
         self.draw()
     
-    def draw(self):
+    def draw_detail(self):
         """Отрисовка синего круга"""
         radius = self.SIZE // 2
         center_x = self.x + radius
@@ -459,7 +645,7 @@ class RepeatBlock(Block):
         self.data['repeat_count'] = count
         center_x = self.x + self.SIZE // 2
         center_y = self.y + self.SIZE // 2
-        self.canvas.itemconfig(self.repeat_text, text=f"{count}x")
+        self.set_text(self.repeat_text, f"{count}x")
     
     def contains_point(self, x, y):
         """Проверка попадания точки в круг"""
@@ -473,13 +659,15 @@ class GroupBlock(Block):
     """Блок группы/подпроцесса (прямоугольник с пунктиром)"""
     WIDTH = 150
     HEIGHT = 100
+    COLOR = "#9b59b6"
     
     def __init__(self, canvas, x, y, block_id, group_type='start'):
         super().__init__(canvas, x, y, 'group', block_id)
         self.data = {'group_type': group_type, 'name': 'Группа'}
+        self.name_text = None
         self.draw()
     
-    def draw(self):
+    def draw_detail(self):
         """Отрисовка прямоугольника группы"""
         # Цвет в зависимости от типа
         if self.data['group_type'] == 'start':
@@ -546,7 +734,7 @@ class GroupBlock(Block):
     def update_name(self, name):
         """Обновление названия группы"""
         self.data['name'] = name
-        self.canvas.itemconfig(self.name_text, text=name)
+        self.set_text(self.name_text, name)
     
     def contains_point(self, x, y):
         """Проверка попадания точки в прямоугольник"""
@@ -556,13 +744,15 @@ class GroupBlock(Block):
 class KeyboardInputBlock(Block):
     """Блок ввода текста с клавиатуры (ромб)"""
     SIZE = 90
+    COLOR = "#16a085"
     
     def __init__(self, canvas, x, y, block_id, text='', press_enter=True):
         super().__init__(canvas, x, y, 'keyboard_input', block_id)
         self.data = {'text': text, 'press_enter': press_enter}
+        self.text_display = None
         self.draw()
     
-    def draw(self):
+    def draw_detail(self):
         """Отрисовка ромба"""
         # Координаты ромба
         center_x = self.x + self.SIZE // 2
@@ -636,7 +826,7 @@ class KeyboardInputBlock(Block):
         if not display_text:
             display_text = "(пусто)"
         
-        self.canvas.itemconfig(self.text_display, text=display_text)
+        self.set_text(self.text_display, display_text)
     
     def contains_point(self, x, y):
         """Проверка попадания точки в ромб"""
@@ -647,6 +837,93 @@ class KeyboardInputBlock(Block):
         return (self.x <= x <= self.x + self.SIZE and 
                 self.y <= y <= self.y + self.SIZE)
 
+class ScreenWaitBlock(Block):
+    """Блок ожидания экрана (прямоугольник с глазом)"""
+    SIZE = 80
+    COLOR = "#0097a7"
+    MODE_LABELS = {'change': 'изменение', 'color': 'цвет', 'stable': 'стабильно'}
+    
+    def __init__(self, canvas, x, y, block_id, data=None):
+        super().__init__(canvas, x, y, 'screen_wait', block_id)
+        self.data = {
+            'region': None, 'mode': 'change', 'color': '#27ae60',
+            'stable_ms': 300, 'timeout': 10.0, 'on_timeout': 'continue'
+        }
+        if data:
+            self.data.update(data)
+        self.mode_text = None
+        self.draw()
+    
+    def mode_label(self):
+        """Подпись с режимом и таймаутом"""
+        if not self.data.get('region'):
+            return "Область не задана"
+        return f"{self.MODE_LABELS.get(self.data['mode'], self.data['mode'])}, ≤{self.data['timeout']}с"
+    
+    def draw_detail(self):
+        """Отрисовка прямоугольника"""
+        center_x = self.x + self.SIZE // 2
+        center_y = self.y + self.SIZE // 2
+        
+        # Тень
+        shadow = self.canvas.create_rectangle(
+            self.x + 3, self.y + 3,
+            self.x + self.SIZE + 3, self.y + self.SIZE + 3,
+            fill="#bdc3c7", outline=""
+        )
+        self.shapes.append(shadow)
+        
+        # Основной прямоугольник
+        rect = self.canvas.create_rectangle(
+            self.x, self.y,
+            self.x + self.SIZE, self.y + self.SIZE,
+            fill="#0097a7",
+            outline="#00838f",
+            width=3,
+            tags=f"block_{self.id}"
+        )
+        self.shapes.append(rect)
+        
+        # Иконка
+        icon = self.canvas.create_text(
+            center_x, center_y - 18,
+            text="👁",
+            font=("Segoe UI", 14),
+            fill="white",
+            tags=f"block_{self.id}"
+        )
+        self.text_ids.append(icon)
+        
+        # Текст
+        text = self.canvas.create_text(
+            center_x, center_y + 3,
+            text="Ждать экран",
+            font=("Segoe UI", 8, "bold"),
+            fill="white",
+            tags=f"block_{self.id}"
+        )
+        self.text_ids.append(text)
+        
+        # Режим и таймаут
+        self.mode_text = self.canvas.create_text(
+            center_x, center_y + 20,
+            text=self.mode_label(),
+            font=("Segoe UI", 6),
+            fill="white",
+            tags=f"block_{self.id}"
+        )
+        self.text_ids.append(self.mode_text)
+    
+    def update_spec(self, spec):
+        """Обновление параметров ожидания"""
+        self.data.update(spec)
+        self.set_text(self.mode_text, self.mode_label())
+    
+    def contains_point(self, x, y):
+        """Проверка попадания точки в прямоугольник"""
+        return (self.x <= x <= self.x + self.SIZE and 
+                self.y <= y <= self.y + self.SIZE)
+
 class FlowEditor:
     def __init__(self, root):
         self.root = root
@@ -656,30 +933,101 @@ class FlowEditor:
         
         # Переменные
         self.blocks = []
-        self.connections = []
+        self.block_map = {}     # id -> Block
+        self.connections = {}   # (from_id, to_id) -> Connection
+        self.graph = FlowGraph()  # Модель потока - источник истины для связей
+        self.block_index = GridIndex()       # id блока -> прямоугольник (поиск по клику)
+        self.connection_index = GridIndex()  # (from_id, to_id) -> прямоугольник стрелки
+        self.view = Viewport()  # Масштаб и видимая область canvas
+        self.live_blocks = set()       # id блоков, нарисованных на canvas
+        self.live_connections = set()  # Ключи нарисованных соединений
+        self.rendered_zoom = self.view.zoom  # Масштаб, в котором нарисованы элементы
+        self.render_pending = False
+        self.render_generation = 0  # Номер текущей отрисовки (старые порции пропускаются)
+        self.rendering = False      # Отрисовка идет порциями и еще не закончена
+        self.load_started = None    # Начало загрузки потока - для сообщения о времени
         self.next_block_id = 1
         self.selected_block = None
         self.drag_data = {"x": 0, "y": 0, "block": None}
         self.connection_mode = False
         self.connection_start_block = None
         self.is_running = False
+        self.stop_token = StopToken()  # Прерывает паузы выполняющегося потока
+        self.progress = None  # ProgressChannel текущего выполнения
+        self.shown_progress = (None, None)  # (статус, id блока), уже показанные в UI
+        self.run_highlight = None  # Рамка вокруг выполняющегося блока
+        self.problem_levels = {}  # id блока -> 'error' / 'warning' последней проверки потока
+        self.trace_file = None  # Файл трассы выполнения (python main.py --trace run.json)
         self.config_file = "vibe_click_config.json"
+        self.journal = None  # FlowJournal файла потока - подключается после загрузки
         self.batch_coordinate_mode = False
+        self.recorder = None  # MacroRecorder во время записи макроса
+        # Поиск по изображению: кэш образцов и прошлые находки сохраняются между запусками
+        self.anchor_locator = AnchorLocator(None)
         self.batch_coord_blocks = []
         self.batch_coord_index = 0
         self.current_code = "" 
         self.current_edited_block = None
         self.current_edited_connection = None  # Текущее редактируемое соединение
         
-        # Настройка pyautogui
-        pyautogui.FAILSAFE = True
+        # Бэкенд ввода создается при первом выполнении или захвате координат
+        self.input_backend_name = 'pyautogui'
+        self._input_backend = None
+        self.keyboard = None  # Модуль keyboard, загружается после показа окна
+        self.startup_profile = None  # {этап: сек} в режиме --startup-profile
+        self.startup_done = False
         
         self.create_widgets()
         
+        # Поток и горячие клавиши загружаются, когда окно уже отрисовано
+        self.root.bind("<Map>", self.on_first_map, add="+")
+    
+    @property
+    def input_backend(self):
+        """Бэкенд ввода (pyautogui и т.п. импортируются при первом обращении)"""
+        if self._input_backend is None:
+            self._input_backend = create_backend(self.input_backend_name)
+        return self._input_backend
+    
+    def on_first_map(self, event):
+        """Первое появление окна на экране"""
+        if event.widget is not self.root or self.startup_done:
+            return
+        self.startup_done = True
+        self.mark_startup('окно показано')
+        # after_idle - после первой отрисовки виджетов
+        self.root.after_idle(self.deferred_startup)
+    
+    def deferred_startup(self):
+        """Загрузка потока и горячих клавиш после показа окна"""
+        self.load_flow_silent()
+        self.mark_startup('поток загружен')
+        
         # Горячие клавиши
-        keyboard.add_hotkey('ctrl', self.start_coordinate_selection, suppress=False)
-        keyboard.add_hotkey('f6', self.toggle_execution)
-        keyboard.add_hotkey('q', self.emergency_stop)
+        try:
+            import keyboard
+            keyboard.add_hotkey('ctrl', self.start_coordinate_selection, suppress=False)
+            keyboard.add_hotkey('f6', self.toggle_execution)
+            keyboard.add_hotkey('q', self.emergency_stop)
+            self.keyboard = keyboard
+        except Exception as e:
+            print(f"Горячие клавиши недоступны: {e}")
+        self.mark_startup('горячие клавиши')
+        
+        if self.startup_profile is not None:
+            self.print_startup_profile()
+            self.root.after(0, self.on_closing)
+    
+    def mark_startup(self, stage):
+        """Отметка этапа запуска для --startup-profile"""
+        if self.startup_profile is not None:
+            self.startup_profile[stage] = time.perf_counter() - STARTUP_T0
+    
+    def print_startup_profile(self):
+        """Печать времени этапов холодного запуска"""
+        print("Профиль запуска (от старта main.py):")
+        for stage, seconds in self.startup_profile.items():
+            print(f"  {stage:<20} {seconds * 1000:8.1f} мс")
         
     def create_widgets(self):
         # Заголовок
@@ -818,6 +1166,35 @@ class FlowEditor:
         )
         self.connect_btn.grid(row=0, column=9, padx=5)
         
+        # Кнопка записи макроса
+        self.record_btn = tk.Button(
+            row1,
+            text="⏺ Запись",
+            command=self.toggle_recording,
+            bg="#c0392b",
+            fg="white",
+            font=("Segoe UI", 9, "bold"),
+            cursor="hand2",
+            padx=10,
+            pady=5,
+            relief="flat"
+        )
+        self.record_btn.grid(row=0, column=10, padx=5)
+        
+        # Кнопка блока ожидания экрана
+        tk.Button(
+            row1,
+            text="👁 Ждать экран",
+            command=self.add_screen_wait_block,
+            bg="#0097a7",
+            fg="white",
+            font=("Segoe UI", 9, "bold"),
+            cursor="hand2",
+            padx=10,
+            pady=5,
+            relief="flat"
+        ).grid(row=0, column=11, padx=5)
+        
         # ВТОРОЙ РЯД - Управляющие блоки и действия
         row2 = tk.Frame(toolbar_content, bg="#34495e")
         row2.pack(pady=2)
@@ -952,6 +1329,77 @@ class FlowEditor:
             relief="flat"
         ).grid(row=0, column=10, padx=5)
         
+        tk.Button(
+            row2,
+            text="🔀 Слияние",
+            command=self.toggle_join_mode,
+            bg="#16a085",
+            fg="white",
+            font=("Segoe UI", 9, "bold"),
+            cursor="hand2",
+            padx=10,
+            pady=5,
+            relief="flat"
+        ).grid(row=0, column=11, padx=5)
+        
+        # Профиль таймингов (паузы после кликов и ввода)
+        tk.Label(
+            row2,
+            text="Тайминг:",
+            bg="#34495e",
+            fg="white",
+            font=("Segoe UI", 9, "bold")
+        ).grid(row=0, column=11, padx=(15, 5))
+        
+        self.timing_var = tk.StringVar(value='safe')
+        timing_box = ttk.Combobox(
+            row2,
+            textvariable=self.timing_var,
+            values=list(TIMING_PROFILES),
+            state="readonly",
+            width=8
+        )
+        timing_box.grid(row=0, column=12, padx=5)
+        timing_box.bind("<<ComboboxSelected>>", self.on_timing_selected)
+        
+        # Режим ветвей: по очереди или параллельно (паузы ветвей перекрываются)
+        tk.Label(
+            row2,
+            text="Ветви:",
+            bg="#34495e",
+            fg="white",
+            font=("Segoe UI", 9, "bold")
+        ).grid(row=0, column=13, padx=(15, 5))
+        
+        self.branch_var = tk.StringVar(value='sequential')
+        branch_box = ttk.Combobox(
+            row2,
+            textvariable=self.branch_var,
+            values=list(BRANCH_MODES),
+            state="readonly",
+            width=10
+        )
+        branch_box.grid(row=0, column=14, padx=5)
+        branch_box.bind("<<ComboboxSelected>>", self.on_branch_mode_selected)
+        
+        # Формат экспорта: компактная таблица или читаемый код блоков
+        tk.Label(
+            row2,
+            text="Экспорт:",
+            bg="#34495e",
+            fg="white",
+            font=("Segoe UI", 9, "bold")
+        ).grid(row=0, column=15, padx=(15, 5))
+        
+        self.export_format_var = tk.StringVar(value='table')
+        ttk.Combobox(
+            row2,
+            textvariable=self.export_format_var,
+            values=list(EXPORT_FORMATS),
+            state="readonly",
+            width=6
+        ).grid(row=0, column=16, padx=5)
+        
         # Основной контейнер для Canvas и правой панели
         main_container = tk.Frame(self.root, bg="#2c3e50")
         main_container.pack(fill="both", expand=True, padx=10, pady=10)
@@ -963,9 +1411,11 @@ class FlowEditor:
         self.canvas = Canvas(
             canvas_frame,
             bg="#ffffff",
-            highlightthickness=0
+            highlightthickness=0,
+            confine=False  # Прокрутка без ограничений - поток может быть любого размера
         )
         self.canvas.pack(fill="both", expand=True)
+        self.canvas.view = self.view  # Блоки и соединения рисуют себя с учетом масштаба
         
         # Правая панель для кода
         self.code_panel_frame = tk.Frame(main_container, bg="#2c3e50", width=400, relief="solid", bd=2)
@@ -1051,6 +1501,9 @@ class FlowEditor:
         # Сетка на canvas
         self.draw_grid()
         
+        # Якорь слоя соединений - создается до блоков, поэтому ниже всех них
+        self.canvas.create_line(0, 0, 0, 0, state="hidden", tags=CONNECTION_LAYER)
+        
         # Статус бар
         status_frame = tk.Frame(self.root, bg="#34495e", height=35)
         status_frame.pack(fill="x")
@@ -1072,40 +1525,275 @@ class FlowEditor:
         self.canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
         self.canvas.bind("<Button-3>", self.on_right_click)  # Правый клик для удаления
         
-        # Загрузка сохраненного потока
-        self.load_flow_silent()
+        # Панорамирование и масштаб
+        self.canvas.bind("<Button-2>", self.on_pan_start)
+        self.canvas.bind("<B2-Motion>", self.on_pan_drag)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)  # Windows / macOS
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)    # Linux
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        self.canvas.bind("<Configure>", lambda event: self.schedule_render())
     
     def draw_grid(self):
-        """Рисование сетки на canvas"""
-        width = self.canvas.winfo_width()
-        height = self.canvas.winfo_height()
-        
-        if width <= 1:
-            width = 1200
-        if height <= 1:
-            height = 700
+        """Рисование сетки в видимой области canvas"""
+        self.canvas.delete("grid")
+        view = self.view
+        zoom = view.zoom
+        step = view.grid_step()
+        x1, y1, x2, y2 = view.world_rect(margin=0)
+        top = view.top
+        bottom = view.top + view.height
+        left = view.left
+        right = view.left + view.width
         
         # Вертикальные линии
-        for i in range(0, width, 40):
-            self.canvas.create_line(i, 0, i, height, fill="#ecf0f1", tags="grid")
+        for i in range(int(x1 // step) * step, int(x2) + step, step):
+            self.canvas.create_line(i * zoom, top, i * zoom, bottom, fill="#ecf0f1", tags="grid")
         
         # Горизонтальные линии
-        for i in range(0, height, 40):
-            self.canvas.create_line(0, i, width, i, fill="#ecf0f1", tags="grid")
+        for i in range(int(y1 // step) * step, int(y2) + step, step):
+            self.canvas.create_line(left, i * zoom, right, i * zoom, fill="#ecf0f1", tags="grid")
         
         self.canvas.tag_lower("grid")
     
+    def schedule_render(self):
+        """Перерисовка видимой области, когда Tk освободится (несколько событий - одна перерисовка)"""
+        if not self.render_pending:
+            self.render_pending = True
+            self.root.after_idle(self.render_viewport)
+    
+    def render_viewport(self):
+        """Отрисовка только блоков и соединений в видимой области"""
+        self.render_pending = False
+        canvas = self.canvas
+        view = self.view
+        view.set_window(canvas.canvasx(0), canvas.canvasy(0), canvas.winfo_width(), canvas.winfo_height())
+        rect = view.world_rect()
+        wanted_blocks = self.block_index.query_rect(*rect)
+        wanted_connections = self.connection_index.query_rect(*rect)
+        
+        # Смена масштаба - все элементы рисуются заново
+        if view.zoom != self.rendered_zoom:
+            self.rendered_zoom = view.zoom
+            for block_id in self.live_blocks:
+                self.block_map[block_id].delete()
+            for key in self.live_connections:
+                self.connections[key].delete()
+            self.live_blocks.clear()
+            self.live_connections.clear()
+        
+        # Убираем ушедшие из видимой области
+        for block_id in self.live_blocks - wanted_blocks:
+            self.block_map[block_id].delete()
+        for key in self.live_connections - wanted_connections:
+            self.connections[key].delete()
+        self.live_blocks &= wanted_blocks
+        self.live_connections &= wanted_connections
+        
+        self.draw_grid()
+        
+        # Появившиеся рисуются порциями: сначала соединения, затем блоки
+        # в порядке добавления (верхние блоки остаются сверху)
+        connection_order = self.connection_index.order
+        block_order = self.block_index.order
+        jobs = [(False, key) for key in sorted(wanted_connections - self.live_connections, key=connection_order.get)]
+        jobs += [(True, block_id) for block_id in sorted(wanted_blocks - self.live_blocks, key=block_order.get)]
+        self.render_generation += 1
+        self.render_slice(self.render_generation, jobs, 0)
+    
+    def render_slice(self, generation, jobs, start):
+        """Порция отрисовки не дольше RENDER_SLICE_SEC, остальное - в следующем цикле Tk"""
+        if generation != self.render_generation:
+            return  # Видимая область изменилась - эту отрисовку заменила новая
+        deadline = time.perf_counter() + RENDER_SLICE_SEC
+        index = start
+        while index < len(jobs):
+            is_block, key = jobs[index]
+            index += 1
+            if is_block:
+                block = self.block_map.get(key)
+                if block is not None and not block.is_drawn():
+                    block.draw()
+                    if block.is_drawn():
+                        self.live_blocks.add(key)
+            else:
+                connection = self.connections.get(key)
+                if connection is not None and not connection.is_drawn():
+                    connection.draw(lower=False)
+                    if connection.is_drawn():
+                        self.live_connections.add(key)
+            if index % 64 == 0 and time.perf_counter() > deadline:
+                break
+        
+        # Слой соединений восстанавливается одной операцией на порцию
+        self.canvas.tag_lower("connection", CONNECTION_LAYER)
+        if index < len(jobs):
+            self.rendering = True
+            self.root.after(1, lambda: self.render_slice(generation, jobs, index))
+            return
+        self.rendering = False
+        if self.run_highlight is not None:
+            self.highlight_running_block(self.block_map.get(self.shown_progress[1]))
+        if self.problem_levels:
+            self.draw_problem_marks()
+        if self.load_started is not None:
+            elapsed = time.perf_counter() - self.load_started
+            self.load_started = None
+            self.status_label.config(
+                text=f"✅ Загружено: {len(self.blocks)} блоков, {len(self.connections)} соединений за {elapsed * 1000:.0f} мс"
+            )
+    
+    def event_point(self, event):
+        """Мировые координаты события мыши"""
+        return self.view.to_world(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+    
+    def on_pan_start(self, event):
+        """Начало панорамирования (средняя кнопка мыши)"""
+        self.canvas.scan_mark(event.x, event.y)
+    
+    def on_pan_drag(self, event):
+        """Панорамирование"""
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.schedule_render()
+    
+    def on_mouse_wheel(self, event):
+        """Колесо: прокрутка, Shift - по горизонтали, Ctrl - масштаб"""
+        direction = -1 if event.num == 5 or event.delta < 0 else 1
+        if event.state & 0x0004:  # Ctrl
+            self.zoom_at(event.x, event.y, direction)
+        elif event.state & 0x0001:  # Shift
+            self.scroll_view(direction * WHEEL_STEP, 0)
+        else:
+            self.scroll_view(0, direction * WHEEL_STEP)
+    
+    def scroll_view(self, dx, dy):
+        """Сдвиг содержимого canvas на (dx, dy) экранных пикселей"""
+        self.canvas.scan_mark(0, 0)
+        self.canvas.scan_dragto(dx, dy, gain=1)
+        self.schedule_render()
+    
+    def zoom_at(self, screen_x, screen_y, direction):
+        """Изменение масштаба с сохранением точки под курсором"""
+        view = self.view
+        zoom = view.next_zoom(direction)
+        if zoom == view.zoom:
+            return
+        canvas_x = self.canvas.canvasx(screen_x)
+        canvas_y = self.canvas.canvasy(screen_y)
+        world_x, world_y = view.to_world(canvas_x, canvas_y)
+        # Новое положение окна: мировая точка снова оказывается под курсором
+        shift_x = world_x * zoom - screen_x - self.canvas.canvasx(0)
+        shift_y = world_y * zoom - screen_y - self.canvas.canvasy(0)
+        view.zoom = zoom
+        self.canvas.scan_mark(0, 0)
+        self.canvas.scan_dragto(-round(shift_x), -round(shift_y), gain=1)
+        self.render_viewport()
+        self.status_label.config(text=f"🔍 Масштаб: {round(zoom * 100)}%")
+    
+    def on_timing_selected(self, event=None):
+        """Выбор профиля таймингов"""
+        self.graph.timing['profile'] = self.timing_var.get()
+        self.record_settings()
+        self.status_label.config(text=f"⏱️ Профиль таймингов: {self.timing_var.get()}")
+        if self.current_edited_block:
+            self.update_code_panel(self.current_edited_block)
+    
+    def on_branch_mode_selected(self, event=None):
+        """Выбор режима выполнения ветвей"""
+        self.graph.branch_mode = self.branch_var.get()
+        self.record_settings()
+        self.status_label.config(text=f"🔀 Ветви: {self.branch_var.get()}")
+    
+    def update_timing_selector(self):
+        """Синхронизация выпадающих списков с настройками потока"""
+        if hasattr(self, 'timing_var'):
+            self.timing_var.set(self.graph.timing.get('profile', 'safe'))
+        if hasattr(self, 'branch_var'):
+            self.branch_var.set(self.graph.branch_mode)
+    
+    def get_timing(self):
+        """Значения таймингов текущего потока"""
+        try:
+            return resolve_timing(self.graph.timing)
+        except FlowCompileError as e:
+            print(f"Ошибка таймингов: {e}")
+            return resolve_timing()
+    
+    def attach_block(self, block):
+        """Добавление блока в список и индекс (узел графа добавляется отдельно)"""
+        self.blocks.append(block)
+        self.block_map[block.id] = block
+        self.block_index.insert(block.id, block.bounds())
+        if block.is_drawn():
+            self.live_blocks.add(block.id)
+    
+    def attach_connection(self, from_block, to_block, delay, watch=None):
+        """Создание соединения на canvas и в индексе (ребро графа добавляется отдельно)"""
+        connection = Connection(self.canvas, from_block, to_block, delay, watch)
+        self.connections[(from_block.id, to_block.id)] = connection
+        self.index_connection(connection)
+        if connection.is_drawn():
+            self.live_connections.add((from_block.id, to_block.id))
+        return connection
+    
+    def register_block(self, block):
+        """Добавление блока в список, индекс и модель графа"""
+        self.attach_block(block)
+        # Узел разделяет словарь data с блоком
+        node = self.graph.add_node(block.id, block.type, block.x, block.y, block.data)
+        self.record({'op': 'add', 'block': node.to_dict()})
+    
+    def add_connection(self, from_block, to_block, delay=0.0):
+        """Создание соединения в модели и на canvas"""
+        if self.graph.add_edge(from_block.id, to_block.id, delay) is None:
+            return None
+        connection = self.attach_connection(from_block, to_block, delay)
+        self.record({'op': 'connect', 'from': from_block.id, 'to': to_block.id, 'delay': delay})
+        return connection
+    
+    def set_connection_delay(self, connection, delay):
+        """Изменение задержки на соединении"""
+        connection.delay = delay
+        self.graph.set_delay(connection.from_block.id, connection.to_block.id, delay)
+        connection.update()
+        self.record({'op': 'delay', 'from': connection.from_block.id, 'to': connection.to_block.id, 'delay': delay})
+    
+    def set_connection_watch(self, connection, watch):
+        """Ожидание экрана на соединении (None - без ожидания)"""
+        connection.watch = watch
+        self.graph.set_watch(connection.from_block.id, connection.to_block.id, watch)
+        connection.update()
+        self.record({'op': 'watch', 'from': connection.from_block.id, 'to': connection.to_block.id, 'watch': watch})
+    
+    def record(self, entry):
+        """Запись изменения в журнал автосохранения"""
+        if self.journal is None:
+            return
+        try:
+            self.journal.record(entry)
+            if self.journal.needs_compaction():
+                self.journal.compact(self.serialize_flow())
+        except OSError as e:
+            print(f"Ошибка автосохранения: {e}")
+    
+    def record_block_data(self, block):
+        """Журнал: новые параметры блока"""
+        self.record({'op': 'data', 'id': block.id, 'data': dict(block.data)})
+    
+    def record_settings(self):
+        """Журнал: профиль таймингов и режим ветвей"""
+        self.record({'op': 'settings', 'timing': dict(self.graph.timing), 'branches': self.graph.branch_mode})
+    
     def add_coordinate_block(self):
         """Добавление блока координат"""
         block = CoordinateBlock(self.canvas, 100 + len(self.blocks) * 20, 100 + len(self.blocks) * 20, self.next_block_id)
-        self.blocks.append(block)
+        self.register_block(block)
         self.next_block_id += 1
         self.status_label.config(text=f"✅ Добавлен блок координат #{block.id}")
     
     def add_click_block(self, click_type):
         """Добавление блока клика"""
         block = ClickBlock(self.canvas, 300 + len(self.blocks) * 20, 100 + len(self.blocks) * 20, self.next_block_id, click_type)
-        self.blocks.append(block)
+        self.register_block(block)
         self.next_block_id += 1
         labels = {'left': 'левый', 'right': 'правый', 'middle': 'средний'}
         self.status_label.config(text=f"✅ Добавлен блок {labels[click_type]} клик #{block.id}")
@@ -1142,7 +1830,7 @@ class FlowEditor:
         def on_ok():
             count = repeat_var.get()
             block = RepeatBlock(self.canvas, 100 + len(self.blocks) * 20, 200 + len(self.blocks) * 20, self.next_block_id, count)
-            self.blocks.append(block)
+            self.register_block(block)
             self.next_block_id += 1
             self.status_label.config(text=f"✅ Добавлен блок повторений ({count}x) #{block.id}")
             dialog.destroy()
@@ -1192,7 +1880,7 @@ class FlowEditor:
         def on_ok():
             delay = delay_var.get()
             block = DelayBlock(self.canvas, 300 + len(self.blocks) * 20, 200 + len(self.blocks) * 20, self.next_block_id, delay)
-            self.blocks.append(block)
+            self.register_block(block)
             self.next_block_id += 1
             self.status_label.config(text=f"✅ Добавлен блок задержки ({delay} сек) #{block.id}")
             dialog.destroy()
@@ -1212,7 +1900,7 @@ class FlowEditor:
     def add_group_block(self, group_type):
         """Добавление блока группы"""
         block = GroupBlock(self.canvas, 100 + len(self.blocks) * 20, 150 + len(self.blocks) * 20, self.next_block_id, group_type)
-        self.blocks.append(block)
+        self.register_block(block)
         self.next_block_id += 1
         label = "начало" if group_type == 'start' else "конец"
         self.status_label.config(text=f"✅ Добавлен блок {label} группы #{block.id}")
@@ -1258,7 +1946,7 @@ class FlowEditor:
             text = text_var.get()
             press_enter = enter_var.get()
             block = KeyboardInputBlock(self.canvas, 200 + len(self.blocks) * 20, 100 + len(self.blocks) * 20, self.next_block_id, text, press_enter)
-            self.blocks.append(block)
+            self.register_block(block)
             self.next_block_id += 1
             self.status_label.config(text=f"✅ Добавлен блок ввода текста #{block.id}")
             dialog.destroy()
@@ -1275,8 +1963,228 @@ class FlowEditor:
             pady=5
         ).pack(pady=10)
     
+    def capture_anchor(self, block, on_miss):
+        """Снимок образца вокруг координат блока (окно редактора на время снимка сворачивается)"""
+        x, y = block.data.get('x'), block.data.get('y')
+        if x is None or y is None:
+            messagebox.showwarning("Предупреждение", "Сначала задайте координаты блока - образец снимается вокруг них")
+            return
+        try:
+            screen = create_screen()
+        except ImportError:
+            messagebox.showerror("Ошибка", "Для привязки к изображению установите Pillow (pip install pillow)")
+            return
+        
+        def snap():
+            try:
+                width, height = screen.size()
+                left = max(0, min(x - ANCHOR_SIZE // 2, width - ANCHOR_SIZE))
+                top = max(0, min(y - ANCHOR_SIZE // 2, height - ANCHOR_SIZE))
+                frame = screen.grab((left, top, ANCHOR_SIZE, ANCHOR_SIZE))
+            except OSError as e:
+                messagebox.showerror("Ошибка", f"Не удалось снять экран: {e}")
+                return
+            finally:
+                self.root.deiconify()
+            anchor = encode_template(frame)
+            anchor['offset'] = [x - left, y - top]
+            anchor['on_miss'] = on_miss
+            block.set_anchor(anchor)
+            self.record_block_data(block)
+            self.selected_block = block
+            self.status_label.config(
+                text=f"🎯 Блок #{block.id}: образец {frame.width}x{frame.height} снят, точка будет искаться на экране"
+            )
+            self.update_code_panel(block)
+        
+        self.root.iconify()
+        self.root.after(500, snap)
+    
+    def toggle_join_mode(self):
+        """Режим слияния выбранного блока: 'один раз' <-> 'каждый путь'"""
+        block = self.selected_block
+        if block is None:
+            messagebox.showwarning("Предупреждение", "Сначала выберите блок, в который входят несколько соединений")
+            return
+        if join_mode(block) == 'once':
+            block.data['join'] = 'every'
+            text = "'каждый путь' - блок и всё после него выполняются для каждого входящего пути"
+        else:
+            block.data.pop('join', None)
+            text = "'один раз' - блок выполняется, когда пройдены все входящие пути"
+        self.record_block_data(block)
+        self.update_code_panel(block)
+        note = "" if len(self.graph.inc[block.id]) > 1 else " (пока у блока одно входящее соединение)"
+        self.status_label.config(text=f"🔀 Блок #{block.id}: слияние {text}{note}")
+    
+    def add_screen_wait_block(self):
+        """Добавление блока ожидания экрана"""
+        def on_save(spec):
+            block = ScreenWaitBlock(self.canvas, 300 + len(self.blocks) * 20, 200 + len(self.blocks) * 20, self.next_block_id, spec)
+            self.register_block(block)
+            self.next_block_id += 1
+            self.status_label.config(text=f"✅ Добавлен блок ожидания экрана #{block.id}")
+        
+        self.open_screen_wait_dialog("Ожидание экрана", {}, on_save)
+    
+    def open_screen_wait_dialog(self, title, spec, on_save, on_remove=None):
+        """Диалог параметров ожидания экрана (блок или соединение).
+
+        on_save получает dict: region, mode, color, stable_ms, timeout, on_timeout.
+        """
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("420x360")
+        dialog.configure(bg="#ecf0f1")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        tk.Label(
+            dialog,
+            text="Область экрана (X, Y, ширина, высота):",
+            font=("Segoe UI", 10, "bold"),
+            bg="#ecf0f1"
+        ).pack(pady=(10, 5))
+        
+        region_frame = tk.Frame(dialog, bg="#ecf0f1")
+        region_frame.pack()
+        region = spec.get('region') or [0, 0, 100, 100]
+        region_vars = []
+        for column, value in enumerate(region):
+            var = tk.IntVar(value=value)
+            tk.Spinbox(
+                region_frame,
+                from_=0,
+                to=10000,
+                textvariable=var,
+                width=6,
+                font=("Segoe UI", 10)
+            ).grid(row=0, column=column, padx=3)
+            region_vars.append(var)
+        
+        # Захват углов области позицией мыши (с отсчетом, чтобы успеть навести курсор)
+        def capture_region(corner=0, countdown=3):
+            if not dialog.winfo_exists():
+                return
+            if countdown > 0:
+                name = "левый верхний" if corner == 0 else "правый нижний"
+                capture_btn.config(text=f"Наведите на {name} угол... {countdown}")
+                self.root.after(1000, capture_region, corner, countdown - 1)
+                return
+            x, y = self.input_backend.position()
+            if corner == 0:
+                region_vars[0].set(x)
+                region_vars[1].set(y)
+                capture_region(1)
+            else:
+                region_vars[2].set(max(1, x - region_vars[0].get()))
+                region_vars[3].set(max(1, y - region_vars[1].get()))
+                capture_btn.config(text="📍 Захватить область мышью")
+        
+        capture_btn = tk.Button(
+            dialog,
+            text="📍 Захватить область мышью",
+            command=capture_region,
+            bg="#3498db",
+            fg="white",
+            font=("Segoe UI", 9, "bold"),
+            cursor="hand2",
+            padx=10,
+            pady=3
+        )
+        capture_btn.pack(pady=5)
+        
+        options = tk.Frame(dialog, bg="#ecf0f1")
+        options.pack(pady=5)
+        
+        tk.Label(options, text="Ждать:", bg="#ecf0f1", font=("Segoe UI", 10)).grid(row=0, column=0, sticky="e", pady=2)
+        mode_var = tk.StringVar(value=spec.get('mode', 'change'))
+        ttk.Combobox(
+            options,
+            textvariable=mode_var,
+            values=list(ScreenWaitBlock.MODE_LABELS),
+            state="readonly",
+            width=10
+        ).grid(row=0, column=1, sticky="w", padx=5)
+        
+        tk.Label(options, text="Цвет (#rrggbb):", bg="#ecf0f1", font=("Segoe UI", 10)).grid(row=1, column=0, sticky="e", pady=2)
+        color_var = tk.StringVar(value=spec.get('color', '#27ae60'))
+        tk.Entry(options, textvariable=color_var, width=10).grid(row=1, column=1, sticky="w", padx=5)
+        
+        tk.Label(options, text="Стабильно (мс):", bg="#ecf0f1", font=("Segoe UI", 10)).grid(row=2, column=0, sticky="e", pady=2)
+        stable_var = tk.IntVar(value=spec.get('stable_ms', 300))
+        tk.Spinbox(options, from_=50, to=10000, increment=50, textvariable=stable_var, width=8).grid(row=2, column=1, sticky="w", padx=5)
+        
+        tk.Label(options, text="Таймаут (сек):", bg="#ecf0f1", font=("Segoe UI", 10)).grid(row=3, column=0, sticky="e", pady=2)
+        timeout_var = tk.DoubleVar(value=spec.get('timeout', 10.0))
+        tk.Spinbox(options, from_=0.5, to=600.0, increment=0.5, textvariable=timeout_var, width=8).grid(row=3, column=1, sticky="w", padx=5)
+        
+        fail_var = tk.BooleanVar(value=spec.get('on_timeout') == 'fail')
+        tk.Checkbutton(
+            dialog,
+            text="Остановить поток, если таймаут истек",
+            variable=fail_var,
+            font=("Segoe UI", 10),
+            bg="#ecf0f1"
+        ).pack(pady=5)
+        
+        def on_ok():
+            try:
+                values = [var.get() for var in region_vars]
+                new_spec = {
+                    'region': values,
+                    'mode': mode_var.get(),
+                    'color': color_var.get().strip(),
+                    'stable_ms': stable_var.get(),
+                    'timeout': timeout_var.get(),
+                    'on_timeout': 'fail' if fail_var.get() else 'continue'
+                }
+                if values[2] <= 0 or values[3] <= 0:
+                    raise ValueError("Ширина и высота области должны быть больше 0")
+                if new_spec['mode'] == 'color':
+                    parse_color(new_spec['color'])
+            except (ValueError, tk.TclError) as e:
+                messagebox.showerror("Ошибка", f"Неверные параметры: {e}", parent=dialog)
+                return
+            on_save(new_spec)
+            dialog.destroy()
+        
+        buttons = tk.Frame(dialog, bg="#ecf0f1")
+        buttons.pack(pady=10)
+        tk.Button(
+            buttons,
+            text="✅ Сохранить",
+            command=on_ok,
+            bg="#27ae60",
+            fg="white",
+            font=("Segoe UI", 10, "bold"),
+            cursor="hand2",
+            padx=20,
+            pady=5
+        ).grid(row=0, column=0, padx=5)
+        if on_remove is not None:
+            def remove():
+                on_remove()
+                dialog.destroy()
+            
+            tk.Button(
+                buttons,
+                text="🗑️ Без ожидания",
+                command=remove,
+                bg="#e74c3c",
+                fg="white",
+                font=("Segoe UI", 10, "bold"),
+                cursor="hand2",
+                padx=10,
+                pady=5
+            ).grid(row=0, column=1, padx=5)
+    
     def start_coordinate_selection(self):
         """Захват координат по Ctrl - одним нажатием"""
+        # Во время записи макроса Ctrl - часть записываемых сочетаний
+        if self.recorder is not None:
+            return
+        
         # Если в режиме пакетного задания координат
         if self.batch_coordinate_mode:
             self.capture_next_batch_coordinate()
@@ -1285,21 +2193,23 @@ class FlowEditor:
         # Проверяем есть ли выбранный блок координат
         if self.selected_block and isinstance(self.selected_block, CoordinateBlock):
             # Сразу получаем текущие координаты курсора
-            x, y = pyautogui.position()
+            x, y = self.input_backend.position()
             self.selected_block.update_coordinates(x, y)
+            self.record_block_data(self.selected_block)
             self.status_label.config(text=f"✅ Координаты установлены: X={x}, Y={y} для блока #{self.selected_block.id}")
         else:
             self.status_label.config(text="⚠️ Сначала выберите блок координат (кликните на синий квадрат 📍)")
     
     def on_canvas_double_click(self, event):
         """Двойной клик - быстрый захват координат или редактирование параметров"""
+        x, y = self.event_point(event)
         # Сначала проверяем клик по соединению (стрелке)
-        clicked_connection = self.get_connection_at_position(event.x, event.y)
+        clicked_connection = self.get_connection_at_position(x, y)
         if clicked_connection:
             # Редактирование задержки на соединении
             dialog = tk.Toplevel(self.root)
             dialog.title("Задержка на переходе")
-            dialog.geometry("300x150")
+            dialog.geometry("360x170")
             dialog.configure(bg="#ecf0f1")
             dialog.transient(self.root)
             dialog.grab_set()
@@ -1325,13 +2235,33 @@ class FlowEditor:
             spinbox.focus()
             
             def on_ok():
-                clicked_connection.delay = delay_var.get()
-                clicked_connection.update()
+                self.set_connection_delay(clicked_connection, delay_var.get())
                 self.status_label.config(text=f"✅ Задержка установлена: {delay_var.get()} сек")
                 dialog.destroy()
             
+            # Ожидание экрана выполняется после задержки соединения
+            def edit_watch():
+                dialog.destroy()
+                
+                def on_save(spec):
+                    self.set_connection_watch(clicked_connection, spec)
+                    self.status_label.config(text="✅ На соединении установлено ожидание экрана")
+                
+                def on_remove():
+                    self.set_connection_watch(clicked_connection, None)
+                    self.status_label.config(text="✅ Ожидание экрана на соединении удалено")
+                
+                self.open_screen_wait_dialog(
+                    "Ожидание экрана на переходе",
+                    clicked_connection.watch or {},
+                    on_save,
+                    on_remove if clicked_connection.watch else None
+                )
+            
+            buttons = tk.Frame(dialog, bg="#ecf0f1")
+            buttons.pack(pady=10)
             tk.Button(
-                dialog,
+                buttons,
                 text="✅ Сохранить",
                 command=on_ok,
                 bg="#27ae60",
@@ -1340,17 +2270,28 @@ class FlowEditor:
                 cursor="hand2",
                 padx=20,
                 pady=5
-            ).pack(pady=10)
+            ).grid(row=0, column=0, padx=5)
+            tk.Button(
+                buttons,
+                text="👁 Ожидание экрана...",
+                command=edit_watch,
+                bg="#0097a7",
+                fg="white",
+                font=("Segoe UI", 10, "bold"),
+                cursor="hand2",
+                padx=10,
+                pady=5
+            ).grid(row=0, column=1, padx=5)
             return
         
         # Проверяем клик по блокам
-        clicked_block = self.get_block_at_position(event.x, event.y)
+        clicked_block = self.get_block_at_position(x, y)
         
         if clicked_block and isinstance(clicked_block, CoordinateBlock):
             # Диалог с выбором: автозахват или ручной ввод
             dialog = tk.Toplevel(self.root)
             dialog.title(f"Редактировать координаты #{clicked_block.id}")
-            dialog.geometry("400x250")
+            dialog.geometry("400x380")
             dialog.configure(bg="#ecf0f1")
             dialog.transient(self.root)
             dialog.grab_set()
@@ -1364,8 +2305,9 @@ class FlowEditor:
             
             # Кнопка автозахвата
             def auto_capture():
-                x, y = pyautogui.position()
+                x, y = self.input_backend.position()
                 clicked_block.update_coordinates(x, y)
+                self.record_block_data(clicked_block)
                 self.selected_block = clicked_block
                 self.status_label.config(text=f"✅ Автозахват! Координаты: X={x}, Y={y} для блока #{clicked_block.id}")
                 # Обновляем панель кода
@@ -1436,8 +2378,15 @@ class FlowEditor:
             )
             y_entry.grid(row=0, column=3, padx=5)
             
+            # Привязка к изображению: при промахе - ошибка или клик по сохраненным координатам
+            anchor = clicked_block.data.get('anchor')
+            fallback_var = tk.BooleanVar(value=bool(anchor) and anchor.get('on_miss') == 'fallback')
+            
             def manual_ok():
                 clicked_block.update_coordinates(x_var.get(), y_var.get())
+                if anchor:
+                    clicked_block.set_anchor(dict(anchor, on_miss='fallback' if fallback_var.get() else 'fail'))
+                self.record_block_data(clicked_block)
                 self.selected_block = clicked_block
                 self.status_label.config(text=f"✅ Координаты установлены: X={x_var.get()}, Y={y_var.get()} для блока #{clicked_block.id}")
                 # Обновляем панель кода
@@ -1455,6 +2404,54 @@ class FlowEditor:
                 padx=20,
                 pady=5
             ).pack(pady=10)
+            
+            anchor_frame = tk.Frame(dialog, bg="#ecf0f1")
+            anchor_frame.pack(pady=5)
+            
+            def capture_anchor():
+                on_miss = 'fallback' if fallback_var.get() else 'fail'
+                dialog.destroy()
+                self.capture_anchor(clicked_block, on_miss)
+            
+            tk.Button(
+                anchor_frame,
+                text="🎯 Привязать к изображению",
+                command=capture_anchor,
+                bg="#8e44ad",
+                fg="white",
+                font=("Segoe UI", 9, "bold"),
+                cursor="hand2",
+                padx=10,
+                pady=3
+            ).grid(row=0, column=0, padx=5)
+            
+            if anchor:
+                def remove_anchor():
+                    clicked_block.set_anchor(None)
+                    self.record_block_data(clicked_block)
+                    self.status_label.config(text=f"✅ Блок #{clicked_block.id}: привязка к изображению удалена")
+                    self.update_code_panel(clicked_block)
+                    dialog.destroy()
+                
+                tk.Button(
+                    anchor_frame,
+                    text="Убрать привязку",
+                    command=remove_anchor,
+                    bg="#95a5a6",
+                    fg="white",
+                    font=("Segoe UI", 9, "bold"),
+                    cursor="hand2",
+                    padx=10,
+                    pady=3
+                ).grid(row=0, column=1, padx=5)
+            
+            tk.Checkbutton(
+                dialog,
+                text="Если образец не найден - клик по сохраненным координатам",
+                variable=fallback_var,
+                font=("Segoe UI", 9),
+                bg="#ecf0f1"
+            ).pack()
         
         elif clicked_block and isinstance(clicked_block, RepeatBlock):
             # Редактирование количества повторов
@@ -1487,6 +2484,7 @@ class FlowEditor:
             
             def on_ok():
                 clicked_block.update_repeat_count(repeat_var.get())
+                self.record_block_data(clicked_block)
                 self.status_label.config(text=f"✅ Блок #{clicked_block.id} обновлен: {repeat_var.get()} повторов")
                 # Обновляем панель кода
                 self.update_code_panel(clicked_block)
@@ -1536,6 +2534,7 @@ class FlowEditor:
             
             def on_ok():
                 clicked_block.update_delay(delay_var.get())
+                self.record_block_data(clicked_block)
                 self.status_label.config(text=f"✅ Блок #{clicked_block.id} обновлен: {delay_var.get()} сек")
                 # Обновляем панель кода
                 self.update_code_panel(clicked_block)
@@ -1553,6 +2552,16 @@ class FlowEditor:
                 pady=5
             ).pack(pady=10)
         
+        elif clicked_block and isinstance(clicked_block, ScreenWaitBlock):
+            # Редактирование области и условия ожидания
+            def on_save(spec):
+                clicked_block.update_spec(spec)
+                self.record_block_data(clicked_block)
+                self.status_label.config(text=f"✅ Блок #{clicked_block.id} обновлен: {clicked_block.mode_label()}")
+                self.update_code_panel(clicked_block)
+            
+            self.open_screen_wait_dialog(f"Ожидание экрана #{clicked_block.id}", clicked_block.data, on_save)
+        
         elif clicked_block and isinstance(clicked_block, GroupBlock):
             # Редактирование названия группы
             dialog = tk.Toplevel(self.root)
@@ -1582,6 +2591,7 @@ class FlowEditor:
             
             def on_ok():
                 clicked_block.update_name(name_var.get())
+                self.record_block_data(clicked_block)
                 self.status_label.config(text=f"✅ Группа #{clicked_block.id} переименована: {name_var.get()}")
                 # Обновляем панель кода
                 self.update_code_panel(clicked_block)
@@ -1650,6 +2660,7 @@ class FlowEditor:
             def on_ok():
                 new_text = text_widget.get("1.0", "end-1c")  # Получаем весь текст
                 clicked_block.update_text(new_text, enter_var.get())
+                self.record_block_data(clicked_block)
                 self.status_label.config(text=f"✅ Блок #{clicked_block.id} обновлен")
                 # Обновляем панель кода
                 self.update_code_panel(clicked_block)
@@ -1732,8 +2743,9 @@ class FlowEditor:
         """Захват координат для следующего блока в пакетном режиме"""
         if self.batch_coord_index < len(self.batch_coord_blocks):
             current_block = self.batch_coord_blocks[self.batch_coord_index]
-            x, y = pyautogui.position()
+            x, y = self.input_backend.position()
             current_block.update_coordinates(x, y)
+            self.record_block_data(current_block)
             
             self.batch_coord_index += 1
             
@@ -1758,6 +2770,97 @@ class FlowEditor:
         self.batch_coord_blocks = []
         self.batch_coord_index = 0
     
+    def toggle_recording(self):
+        """Включение и выключение записи макроса"""
+        if self.recorder is None:
+            self.start_recording()
+        else:
+            self.stop_recording()
+    
+    def start_recording(self):
+        """Запуск записи кликов и ввода текста"""
+        if self.is_running:
+            messagebox.showwarning("Предупреждение", "Остановите выполнение потока перед записью")
+            return
+        recorder = MacroRecorder()
+        try:
+            recorder.start()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Запись недоступна (нужен pynput): {e}")
+            return
+        self.recorder = recorder
+        self.record_btn.config(text="⏹ Стоп записи", bg="#e74c3c")
+        self.status_label.config(text="⏺ Запись: кликайте и вводите текст, затем нажмите \"⏹ Стоп записи\"")
+        self.root.after(RECORD_POLL_MS, self.poll_recording, recorder)
+    
+    def poll_recording(self, recorder):
+        """Периодическое чтение буфера событий записи"""
+        if recorder is not self.recorder:
+            return
+        recorder.drain()
+        self.status_label.config(
+            text=f"⏺ Запись: действий {len(recorder.events)}, движений мыши {recorder.moves}"
+        )
+        self.root.after(RECORD_POLL_MS, self.poll_recording, recorder)
+    
+    def stop_recording(self):
+        """Остановка записи и создание блоков"""
+        recorder = self.recorder
+        self.recorder = None
+        recorder.stop()
+        self.record_btn.config(text="⏺ Запись", bg="#c0392b")
+        
+        # Клики по самому редактору (в том числе по кнопке остановки) не записываются
+        root = self.root
+        window = (
+            root.winfo_rootx(), root.winfo_rooty(),
+            root.winfo_rootx() + root.winfo_width(), root.winfo_rooty() + root.winfo_height()
+        )
+        steps, skipped = build_macro(recorder.events, exclude=window)
+        if not steps:
+            self.status_label.config(text="⚫ Запись остановлена: действий не записано")
+            return
+        blocks = self.add_recorded_steps(steps)
+        text = f"✅ Записано шагов: {len(steps)}, блоков: {blocks}"
+        if skipped:
+            text += f", пропущено клавиш: {skipped}"
+        if recorder.ring.lost:
+            text += f", потеряно событий: {recorder.ring.lost}"
+        self.status_label.config(text=text)
+    
+    def add_recorded_steps(self, steps):
+        """Блоки и соединения для шагов записанного макроса. Возвращает количество блоков"""
+        top = max((block.bounds()[3] for block in self.blocks), default=0) + 60
+        created = []
+        previous = None
+        
+        def place(block_class, *args):
+            index = len(created)
+            x = 100 + (index % RECORD_COLUMNS) * RECORD_STEP_X
+            y = top + (index // RECORD_COLUMNS) * RECORD_STEP_Y
+            block = block_class(self.canvas, x, y, self.next_block_id, *args)
+            self.next_block_id += 1
+            created.append(block)
+            return block
+        
+        for step in steps:
+            if step[0] in ('click', 'drag'):
+                _, x, y, button, gap = step[:5]
+                first = place(CoordinateBlock)
+                first.update_coordinates(x, y)
+                self.register_block(first)
+                last = place(ClickBlock, button, step[5] if step[0] == 'drag' else None)
+                self.register_block(last)
+                self.add_connection(first, last)
+            else:
+                _, text, press_enter, gap = step
+                first = last = place(KeyboardInputBlock, text, press_enter)
+                self.register_block(first)
+            if previous is not None:
+                self.add_connection(previous, first, gap)
+            previous = last
+        return len(created)
+    
     def toggle_connection_mode(self):
         """Переключение режима соединения"""
         self.connection_mode = not self.connection_mode
@@ -1772,9 +2875,10 @@ class FlowEditor:
     
     def on_canvas_click(self, event):
         """Клик на canvas"""
+        x, y = self.event_point(event)
         # Проверяем режим соединения
         if self.connection_mode:
-            clicked_block = self.get_block_at_position(event.x, event.y)
+            clicked_block = self.get_block_at_position(x, y)
             if clicked_block:
                 if self.connection_start_block is None:
                     self.connection_start_block = clicked_block
@@ -1782,29 +2886,28 @@ class FlowEditor:
                 else:
                     # Создаем соединение
                     if self.connection_start_block != clicked_block:
-                        connection = Connection(self.canvas, self.connection_start_block, clicked_block)
-                        self.connections.append(connection)
-                        self.connection_start_block.connections_out.append(clicked_block)
-                        clicked_block.connections_in.append(self.connection_start_block)
-                        self.status_label.config(text=f"✅ Соединение создано: #{self.connection_start_block.id} → #{clicked_block.id}")
+                        if self.add_connection(self.connection_start_block, clicked_block):
+                            self.status_label.config(text=f"✅ Соединение создано: #{self.connection_start_block.id} → #{clicked_block.id}")
+                        else:
+                            self.status_label.config(text=f"⚠️ Соединение #{self.connection_start_block.id} → #{clicked_block.id} уже существует")
                     self.connection_start_block = None
                     self.connection_mode = False
                     self.connect_btn.config(bg="#9b59b6", text="🔗 Соединить")
             return
         
 
-        clicked_connection = self.get_connection_at_position(event.x, event.y)
+        clicked_connection = self.get_connection_at_position(x, y)
         if clicked_connection:
             self.update_code_panel_connection(clicked_connection)
             self.status_label.config(text=f"🔗 Выбрано соединение: #{clicked_connection.from_block.id} → #{clicked_connection.to_block.id}")
             return
         
         # Обычный режим - выбор блока
-        clicked_block = self.get_block_at_position(event.x, event.y)
+        clicked_block = self.get_block_at_position(x, y)
         if clicked_block:
             self.selected_block = clicked_block
-            self.drag_data["x"] = event.x
-            self.drag_data["y"] = event.y
+            self.drag_data["x"] = x
+            self.drag_data["y"] = y
             self.drag_data["block"] = clicked_block
             
             block_type = "Координата" if isinstance(clicked_block, CoordinateBlock) else "Клик"
@@ -1817,59 +2920,98 @@ class FlowEditor:
     def on_canvas_drag(self, event):
         """Перетаскивание блока"""
         if self.drag_data["block"]:
-            dx = event.x - self.drag_data["x"]
-            dy = event.y - self.drag_data["y"]
+            x, y = self.event_point(event)
+            # Целые мировые координаты блока; остаток сдвига переходит в следующий шаг
+            dx = round(x - self.drag_data["x"])
+            dy = round(y - self.drag_data["y"])
             self.drag_data["block"].move(dx, dy)
-            self.drag_data["x"] = event.x
-            self.drag_data["y"] = event.y
+            self.drag_data["x"] += dx
+            self.drag_data["y"] += dy
             
-            # Обновляем соединения
-            self.update_connections()
+            # Обновляем только соединения перемещаемого блока
+            self.update_connections(self.drag_data["block"])
     
     def on_canvas_release(self, event):
         """Отпускание кнопки мыши"""
+        block = self.drag_data["block"]
+        if block:
+            node = self.graph.nodes[block.id]
+            if (node.x, node.y) != (block.x, block.y):
+                self.graph.move_node(block.id, block.x, block.y)
+                self.reindex_block(block)
+                self.record({'op': 'move', 'id': block.id, 'x': block.x, 'y': block.y})
+                if block.id in self.problem_levels:
+                    self.draw_problem_marks()
         self.drag_data["block"] = None
     
     def on_right_click(self, event):
         """Правый клик - удаление блока"""
-        clicked_block = self.get_block_at_position(event.x, event.y)
+        clicked_block = self.get_block_at_position(*self.event_point(event))
         if clicked_block:
             # Удаляем все соединения связанные с блоком
-            connections_to_remove = []
-            for conn in self.connections:
-                if conn.from_block == clicked_block or conn.to_block == clicked_block:
-                    conn.delete()
-                    connections_to_remove.append(conn)
-            
-            for conn in connections_to_remove:
-                self.connections.remove(conn)
+            for edge in self.graph.remove_node(clicked_block.id):
+                self.connections.pop((edge.from_id, edge.to_id)).delete()
+                self.connection_index.remove((edge.from_id, edge.to_id))
+                self.live_connections.discard((edge.from_id, edge.to_id))
             
             # Удаляем блок
             clicked_block.delete()
             self.blocks.remove(clicked_block)
+            del self.block_map[clicked_block.id]
+            self.block_index.remove(clicked_block.id)
+            self.live_blocks.discard(clicked_block.id)
+            self.record({'op': 'delete', 'id': clicked_block.id})
             self.status_label.config(text=f"🗑️ Блок #{clicked_block.id} удален")
             
             if self.selected_block == clicked_block:
                 self.selected_block = None
     
     def get_block_at_position(self, x, y):
-        """Получение блока в позиции"""
-        for block in reversed(self.blocks):  # Проверяем с конца (верхние блоки)
-            if block.contains_point(x, y):
-                return block
-        return None
+        """Получение блока в позиции (верхнего - добавленного последним)"""
+        order = self.block_index.order
+        hits = [
+            block_id for block_id in self.block_index.query_point(x, y)
+            if self.block_map[block_id].contains_point(x, y)
+        ]
+        if not hits:
+            return None
+        return self.block_map[max(hits, key=order.get)]
     
     def get_connection_at_position(self, x, y):
-        """Получение соединения в позиции"""
-        for conn in self.connections:
-            if conn.contains_point(x, y):
-                return conn
-        return None
-    
-    def update_connections(self):
-        """Обновление всех соединений"""
-        for conn in self.connections:
+        """Получение соединения в позиции (первого из созданных)"""
+        order = self.connection_index.order
+        hits = [
+            key for key in self.connection_index.query_point(x, y)
+            if self.connections[key].contains_point(x, y)
+        ]
+        if not hits:
+            return None
+        return self.connections[min(hits, key=order.get)]
+    
+    def reindex_block(self, block):
+        """Обновление индекса после перемещения блока"""
+        self.block_index.update(block.id, block.bounds())
+        for edge in self.graph.incident_edges(block.id):
+            self.index_connection(self.connections[(edge.from_id, edge.to_id)])
+    
+    def index_connection(self, connection):
+        """Индексация стрелки по ячейкам вдоль линии, а не по всему прямоугольнику"""
+        cells = self.connection_index.segment_cells(*connection.endpoints(), pad=10)
+        self.connection_index.insert((connection.from_block.id, connection.to_block.id), connection.bounds(), cells)
+    
+    def update_connections(self, block=None):
+        """Обновление соединений блока (или всех, если блок не указан)"""
+        if block is None:
+            connections = self.connections.values()
+        else:
+            connections = [self.connections[(edge.from_id, edge.to_id)] for edge in self.graph.incident_edges(block.id)]
+        for conn in connections:
             conn.update()
+            key = (conn.from_block.id, conn.to_block.id)
+            if conn.is_drawn():
+                self.live_connections.add(key)
+            else:
+                self.live_connections.discard(key)
     
     def clear_canvas(self):
         """Очистка canvas"""
@@ -1883,17 +3025,15 @@ class FlowEditor:
         )
         
         if result:
-            for block in self.blocks:
-                block.delete()
-            for conn in self.connections:
-                conn.delete()
-            self.blocks.clear()
-            self.connections.clear()
+            self.reset_flow()
+            self.record({'op': 'clear'})
             self.selected_block = None
             self.status_label.config(text="🗑️ Canvas очищен")
     
     def toggle_execution(self):
         """Переключение выполнения"""
+        if self.recorder is not None:
+            return
         if not self.is_running:
             self.start_execution()
         else:
@@ -1906,22 +3046,115 @@ class FlowEditor:
             return
         
         # Находим начальные блоки (без входящих соединений)
-        start_blocks = [block for block in self.blocks if not block.connections_in]
-        
-        if not start_blocks:
+        if not self.graph.start_ids():
             messagebox.showwarning("Предупреждение", "Нет начальных блоков! Добавьте блок без входящих соединений.")
             return
         
+        # Все проблемы потока - до первого клика
+        if not self.check_flow("Запуск"):
+            return
+        
+        # Компилируем снимок потока - правки на canvas не влияют на запуск
+        try:
+            plan = compile_flow(self.graph)
+        except FlowCompileError as e:
+            messagebox.showwarning("Предупреждение", str(e))
+            return
+        
+        # Пустые операции и лишние шаги убираются до запуска (см. flow_optimizer)
+        plan, report = optimize_plan(plan)
+        print(report.format())
+        
         self.is_running = True
+        self.stop_token = StopToken()
+        self.progress = ProgressChannel()
+        self.shown_progress = (None, None)
         self.run_btn.config(text="⏸ Остановить", bg="#e74c3c")
         self.status_label.config(text="🟢 Выполнение запущено...")
         
         # Запускаем в отдельном потоке
-        thread = threading.Thread(target=self.execute_flow, args=(start_blocks,), daemon=True)
+        thread = threading.Thread(
+            target=self.execute_flow,
+            args=(plan, self.stop_token, self.progress),
+            daemon=True
+        )
         thread.start()
+        self.root.after(PROGRESS_INTERVAL_MS, self.poll_progress, self.progress)
+    
+    def poll_progress(self, progress):
+        """Показ прогресса выполнения - один раз за кадр, а не на каждый шаг"""
+        if progress is not self.progress or not self.is_running:
+            return
+        self.show_progress(progress)
+        self.root.after(PROGRESS_INTERVAL_MS, self.poll_progress, progress)
+    
+    def show_progress(self, progress):
+        """Обновление статуса и подсветки, только если они изменились"""
+        status, block_id = progress.status, progress.block_id
+        shown_status, shown_block_id = self.shown_progress
+        if status is not None and status != shown_status:
+            self.status_label.config(text=status)
+        if block_id != shown_block_id:
+            self.highlight_running_block(self.block_map.get(block_id))
+        self.shown_progress = (status, block_id)
+    
+    def highlight_running_block(self, block):
+        """Рамка вокруг выполняющегося блока (None - убрать)"""
+        if block is None:
+            if self.run_highlight is not None:
+                self.canvas.delete(self.run_highlight)
+                self.run_highlight = None
+            return
+        zoom = self.view.zoom
+        x1, y1, x2, y2 = (c * zoom for c in block.bounds())
+        coords = (x1 - 6, y1 - 6, x2 + 6, y2 + 6)
+        if self.run_highlight is None:
+            self.run_highlight = self.canvas.create_rectangle(
+                *coords,
+                outline="#f1c40f", width=3, dash=(6, 3)
+            )
+        else:
+            self.canvas.coords(self.run_highlight, *coords)
+        self.canvas.tag_raise(self.run_highlight)
+    
+    def check_flow(self, action):
+        """Проверка потока перед запуском или экспортом. False - есть ошибки (они подсвечены на canvas)"""
+        report = validate_flow(self.graph)
+        self.show_problems(report.block_levels())
+        if report.issues:
+            print(report.format())
+        if not report.ok:
+            messagebox.showerror(
+                "Ошибка",
+                f"{action} невозможен - в потоке есть ошибки (подсвечены на canvas):\n\n{report.format(limit=12)}"
+            )
+            self.status_label.config(text=f"❌ Ошибок в потоке: {len(report.errors)}")
+            return False
+        return True
+    
+    def show_problems(self, levels):
+        """Подсветка блоков с проблемами (пустой словарь - убрать)"""
+        self.problem_levels = levels
+        self.draw_problem_marks()
+    
+    def draw_problem_marks(self):
+        """Рамки проблемных блоков: красные - ошибки, оранжевые - предупреждения"""
+        self.canvas.delete("problem")
+        zoom = self.view.zoom
+        for block_id, level in self.problem_levels.items():
+            block = self.block_map.get(block_id)
+            if block is None:
+                continue
+            x1, y1, x2, y2 = (c * zoom for c in block.bounds())
+            self.canvas.create_rectangle(
+                x1 - 5, y1 - 5, x2 + 5, y2 + 5,
+                outline="#e74c3c" if level == 'error' else "#f39c12", width=3, tags="problem"
+            )
     
     def stop_execution(self):
         """Остановка выполнения"""
+        self.stop_token.stop()
+        self.highlight_running_block(None)
         self.is_running = False
         self.run_btn.config(text="▶ Запустить", bg="#27ae60")
         self.status_label.config(text="⚫ Выполнение остановлено")
@@ -1932,358 +3165,188 @@ class FlowEditor:
             self.stop_execution()
             messagebox.showinfo("Остановка", "Выполнение экстренно остановлено!")
     
-    def execute_flow(self, start_blocks):
-        """Выполнение потока"""
+    def finish_execution(self, token, result, stop_latency=None, saved_time=None):
+        """Завершение выполнения (вызывается в потоке Tk)"""
+        if token is not self.stop_token:
+            return  # Уже запущено новое выполнение
+        self.is_running = False
+        self.highlight_running_block(None)
+        self.run_btn.config(text="▶ Запустить", bg="#27ae60")
+        if result == 'done' and saved_time is not None:
+            self.status_label.config(text=f"✅ Выполнение завершено! Параллельные ветви сэкономили {saved_time:.2f} сек")
+        elif result == 'done':
+            self.status_label.config(text="✅ Выполнение завершено!")
+        elif result == 'stopped' and stop_latency is not None:
+            self.status_label.config(text=f"⚫ Выполнение остановлено за {stop_latency * 1000:.1f} мс")
+    
+    def execute_flow(self, plan, token, progress):
+        """Выполнение скомпилированного плана потока"""
         try:
-            def get_connection_delay(from_block, to_block):
-                """Получить задержку на соединении между блоками"""
-                for conn in self.connections:
-                    if conn.from_block == from_block and conn.to_block == to_block:
-                        return conn.delay
-                return 0.0
-            
-            def execute_block(block, context=None):
-                if not self.is_running:
-                    return
-                
-                if context is None:
-                    context = {'coordinates': None, 'repeat_count': 1}
-                
-                # Выполняем действие в зависимости от типа блока
-                if isinstance(block, CoordinateBlock):
-                    # Блок координат - сохраняем координаты в контекст
-                    x, y = block.data.get('x'), block.data.get('y')
-                    if x is None or y is None:
-                        self.root.after(0, lambda b=block: messagebox.showerror(
-                "Ошибка",
-                            f"Блок #{b.id}: координаты не заданы!"
-                        ))
-                        self.stop_execution()
-                        return
-                    
-                    context['coordinates'] = (x, y)
-                    self.root.after(0, lambda b=block: self.status_label.config(
-                        text=f"📍 Блок #{b.id}: координаты установлены ({x}, {y})"
-                    ))
-                    
-                    # Выполняем следующие блоки с задержкой на соединении
-                    for next_block in block.connections_out:
-                        if not self.is_running:
-                            break
-                        # Применяем задержку из соединения
-                        delay = get_connection_delay(block, next_block)
-                        if delay > 0:
-                            time.sleep(delay)
-                        execute_block(next_block, context.copy())
-                
-                elif isinstance(block, ClickBlock):
-                    # Блок клика - выполняем клик по координатам из контекста
-                    coords = context.get('coordinates')
-                    if coords:
-                        x, y = coords
-                        click_type = block.data['click_type']
-                        pyautogui.click(x, y, button=click_type)
-                        self.root.after(0, lambda b=block: self.status_label.config(
-                            text=f"🖱️ Блок #{b.id}: {click_type} клик в ({x}, {y})"
-                        ))
-                    else:
-                        # Ищем координаты из входящих блоков
-                        for in_block in block.connections_in:
-                            if isinstance(in_block, CoordinateBlock):
-                                x, y = in_block.data.get('x'), in_block.data.get('y')
-                                if x is not None and y is not None:
-                                    click_type = block.data['click_type']
-                                    pyautogui.click(x, y, button=click_type)
-                                    context['coordinates'] = (x, y)
-                                    self.root.after(0, lambda b=block: self.status_label.config(
-                                        text=f"🖱️ Блок #{b.id}: {click_type} клик в ({x}, {y})"
-                                    ))
-                                    break
-                    
-                    time.sleep(0.3)
-                    
-                    # Выполняем следующие блоки
-                    for next_block in block.connections_out:
-                        if not self.is_running:
-                            break
-                        execute_block(next_block, context.copy())
-                
-                elif isinstance(block, DelayBlock):
-                    # Блок задержки - ждем указанное время
-                    delay = block.data['delay']
-                    self.root.after(0, lambda b=block, d=delay: self.status_label.config(
-                        text=f"⏱️ Блок #{b.id}: задержка {d} сек..."
-                    ))
-                    time.sleep(delay)
-                    
-                    # Выполняем следующие блоки
-                    for next_block in block.connections_out:
-                        if not self.is_running:
-                            break
-                        execute_block(next_block, context.copy())
-                
-                elif isinstance(block, RepeatBlock):
-                    # Блок повторений - повторяем следующие блоки N раз
-                    repeat_count = block.data['repeat_count']
-                    self.root.after(0, lambda b=block, r=repeat_count: self.status_label.config(
-                        text=f"🔄 Блок #{b.id}: повторение {r} раз..."
-                    ))
-                    
-                    for i in range(repeat_count):
-                        if not self.is_running:
-                            break
-                        self.root.after(0, lambda b=block, idx=i+1, r=repeat_count: self.status_label.config(
-                            text=f"🔄 Блок #{b.id}: итерация {idx}/{r}"
-                        ))
-                        
-                        # Выполняем следующие блоки
-                        for next_block in block.connections_out:
-                            if not self.is_running:
-                                break
-                            execute_block(next_block, context.copy())
-                
-                elif isinstance(block, GroupBlock):
-                    # Блок группы - просто пропуск, группа это визуальный маркер
-                    group_type = block.data['group_type']
-                    group_name = block.data['name']
-                    self.root.after(0, lambda b=block, t=group_type, n=group_name: self.status_label.config(
-                        text=f"📦 Блок #{b.id}: {'Начало' if t == 'start' else 'Конец'} группы '{n}'"
-                    ))
-                    
-                    # Выполняем следующие блоки
-                    for next_block in block.connections_out:
-                        if not self.is_running:
-                            break
-                        execute_block(next_block, context.copy())
-                
-                elif isinstance(block, KeyboardInputBlock):
-                    # Блок ввода текста с клавиатуры
-                    text = block.data['text']
-                    press_enter = block.data['press_enter']
-                    
-                    self.root.after(0, lambda b=block, t=text: self.status_label.config(
-                        text=f"⌨️ Блок #{b.id}: ввод текста '{t[:20]}...'"
-                    ))
-                    
-                    # Простой метод - через буфер обмена (работает с любым языком)
-                    try:
-                        import pyperclip
-                        pyperclip.copy(text)
-                        time.sleep(0.15)
-                        pyautogui.hotkey('ctrl', 'v')
-                        time.sleep(0.2)
-                    except Exception as e:
-                        # Fallback - вводим посимвольно
-                        self.root.after(0, lambda: messagebox.showwarning(
-                            "Предупреждение",
-                            f"Ошибка буфера обмена: {str(e)}\nИспользую посимвольный ввод"
-                        ))
-                        for char in text:
-                            pyautogui.write(char, interval=0.05)
-                    
-                    # Нажимаем Enter если нужно
-                    if press_enter:
-                        time.sleep(0.2)
-                        pyautogui.press('enter')
-                    
-                    time.sleep(0.3)
-                    
-                    # Выполняем следующие блоки с задержкой
-                    for next_block in block.connections_out:
-                        if not self.is_running:
-                            break
-                        delay = get_connection_delay(block, next_block)
-                        if delay > 0:
-                            time.sleep(delay)
-                        execute_block(next_block, context.copy())
-            
-            # Запускаем выполнение от каждого начального блока ОДИН РАЗ
-            for start_block in start_blocks:
-                if not self.is_running:
-                    break
-                execute_block(start_block)
+            # Статус и текущий блок VM пишет в progress, UI опрашивает его в poll_progress
+            def show_error(text):
+                self.root.after(0, lambda: messagebox.showerror("Ошибка", text))
+            
+            def show_warning(text):
+                self.root.after(0, lambda: messagebox.showwarning("Предупреждение", text))
+            
+            tracer = Tracer() if self.trace_file else None
+            self.anchor_locator.stats = LookupStats()
+            vm = FlowVM(
+                plan,
+                token=token,
+                backend=self.input_backend,
+                on_error=show_error,
+                on_warning=show_warning,
+                progress=progress,
+                tracer=tracer,
+                locator=self.anchor_locator
+            )
+            result = vm.run()
+            if tracer is not None:
+                tracer.save(self.trace_file)
+            for line in vm.vision_stats():
+                print(line)
             
             # Завершаем выполнение
-            self.root.after(0, self.stop_execution)
-            self.root.after(0, lambda: self.status_label.config(text="✅ Выполнение завершено!"))
+            saved_time = vm.saved_time if vm.parallel else None
+            self.root.after(0, lambda: self.finish_execution(token, result, vm.stop_latency, saved_time))
         
         except Exception as e:
             self.root.after(0, lambda: messagebox.showerror("Ошибка", f"Ошибка выполнения: {str(e)}"))
             self.root.after(0, self.stop_execution)
     
-    def save_flow(self):
-        """Сохранение потока"""
-        data = {
-            'blocks': [],
-            'connections': []
-        }
-        
-        # Сохраняем блоки
+    def serialize_flow(self):
+        """Сериализация потока в формат vibe_click_config.json"""
+        return self.graph.to_dict()
+    
+    def reset_flow(self):
+        """Удаление всех блоков и соединений"""
         for block in self.blocks:
-            block_data = {
-                'id': block.id,
-                'type': block.type,
-                'x': block.x,
-                'y': block.y,
-                'data': block.data
-            }
-            data['blocks'].append(block_data)
-        
-        # Сохраняем соединения
-        for conn in self.connections:
-            conn_data = {
-                'from': conn.from_block.id,
-                'to': conn.to_block.id,
-                'delay': conn.delay
-            }
-            data['connections'].append(conn_data)
+            block.delete()
+        for conn in self.connections.values():
+            conn.delete()
+        self.blocks.clear()
+        self.block_map.clear()
+        self.connections.clear()
+        self.block_index.clear()
+        self.connection_index.clear()
+        self.live_blocks.clear()
+        self.live_connections.clear()
+        self.graph.clear()
+        self.show_problems({})
+        self.update_timing_selector()
+    
+    def create_block(self, node):
+        """Создание блока на canvas по узлу графа"""
+        block_type = node.type
+        x, y = node.x, node.y
+        block_id = node.id
+        data = node.data
+        
+        if block_type == 'coordinate':
+            block = CoordinateBlock(self.canvas, x, y, block_id)
+            if data.get('x') is not None:
+                block.update_coordinates(data['x'], data['y'])
+            if data.get('anchor'):
+                block.set_anchor(data['anchor'])
+        elif block_type == 'click':
+            block = ClickBlock(self.canvas, x, y, block_id, data.get('click_type', 'left'), data.get('drag'))
+        elif block_type == 'delay':
+            block = DelayBlock(self.canvas, x, y, block_id, data.get('delay', 1.0))
+        elif block_type == 'repeat':
+            block = RepeatBlock(self.canvas, x, y, block_id, data.get('repeat_count', 1))
+        elif block_type == 'group':
+            block = GroupBlock(self.canvas, x, y, block_id, data.get('group_type', 'start'))
+            if data.get('name'):
+                block.update_name(data['name'])
+        elif block_type == 'keyboard_input':
+            block = KeyboardInputBlock(self.canvas, x, y, block_id, data.get('text', ''), data.get('press_enter', True))
+        elif block_type == 'screen_wait':
+            block = ScreenWaitBlock(self.canvas, x, y, block_id, data)
+        else:
+            return None
+        if data.get('join'):
+            block.data['join'] = data['join']
+        return block
+    
+    def build_flow(self, data):
+        """Построение модели и canvas из данных vibe_click_config.json.
+
+        Сначала строится вся модель (граф, блоки, соединения, индексы) без
+        отрисовки, затем видимая часть рисуется порциями в render_viewport
+        """
+        self.reset_flow()
+        graph = FlowGraph.from_dict(data)
+        self.view.suspended = True
+        try:
+            # Блоки
+            for node in list(graph.nodes.values()):
+                block = self.create_block(node)
+                if block is None:
+                    graph.remove_node(node.id)
+                    continue
+                node.data = block.data  # Узел разделяет словарь data с блоком
+                self.attach_block(block)
+                if block.id >= self.next_block_id:
+                    self.next_block_id = block.id + 1
+            
+            # Соединения
+            block_map = self.block_map
+            for edge in graph.edges.values():
+                self.attach_connection(block_map[edge.from_id], block_map[edge.to_id], edge.delay, edge.watch)
+        finally:
+            self.view.suspended = False
+        
+        self.graph = graph
+        self.update_timing_selector()
+        self.render_viewport()
+    
+    def save_flow(self):
+        """Сохранение потока (снимок целиком; между сохранениями изменения пишутся в журнал)"""
+        data = self.serialize_flow()
         
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            if self.journal is None:
+                self.journal = FlowJournal(self.config_file)
+            self.journal.compact(data)
             messagebox.showinfo("Успех", f"✅ Поток сохранен!\n\n📁 {self.config_file}\n📦 Блоков: {len(data['blocks'])}\n🔗 Соединений: {len(data['connections'])}")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить: {str(e)}")
     
+    def read_flow_file(self):
+        """Поток из файла и журнала автосохранения. Журнал подключается после построения"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.load_started = time.perf_counter()
+        journal = FlowJournal(self.config_file)
+        data = journal.load()
+        if data is not None:
+            self.build_flow(data)
+        else:
+            self.load_started = None
+        self.journal = journal
+        return data is not None
+    
     def load_flow_silent(self):
         """Тихая загрузка потока при старте"""
-        if not os.path.exists(self.config_file):
-            return
-        
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Очищаем текущий canvas
-            for block in self.blocks:
-                block.delete()
-            for conn in self.connections:
-                conn.delete()
-            self.blocks.clear()
-            self.connections.clear()
-            
-            # Загружаем блоки
-            block_map = {}
-            for block_data in data.get('blocks', []):
-                block_type = block_data['type']
-                x, y = block_data['x'], block_data['y']
-                block_id = block_data['id']
-                
-                if block_type == 'coordinate':
-                    block = CoordinateBlock(self.canvas, x, y, block_id)
-                    if block_data['data'].get('x') is not None:
-                        block.update_coordinates(block_data['data']['x'], block_data['data']['y'])
-                elif block_type == 'click':
-                    click_type = block_data['data'].get('click_type', 'left')
-                    block = ClickBlock(self.canvas, x, y, block_id, click_type)
-                elif block_type == 'delay':
-                    delay = block_data['data'].get('delay', 1.0)
-                    block = DelayBlock(self.canvas, x, y, block_id, delay)
-                elif block_type == 'repeat':
-                    repeat_count = block_data['data'].get('repeat_count', 1)
-                    block = RepeatBlock(self.canvas, x, y, block_id, repeat_count)
-                elif block_type == 'group':
-                    group_type = block_data['data'].get('group_type', 'start')
-                    block = GroupBlock(self.canvas, x, y, block_id, group_type)
-                    if block_data['data'].get('name'):
-                        block.update_name(block_data['data']['name'])
-                elif block_type == 'keyboard_input':
-                    text = block_data['data'].get('text', '')
-                    press_enter = block_data['data'].get('press_enter', True)
-                    block = KeyboardInputBlock(self.canvas, x, y, block_id, text, press_enter)
-                else:
-                    continue
-                
-                self.blocks.append(block)
-                block_map[block_id] = block
-                
-                if block_id >= self.next_block_id:
-                    self.next_block_id = block_id + 1
-            
-            # Загружаем соединения
-            for conn_data in data.get('connections', []):
-                from_block = block_map.get(conn_data['from'])
-                to_block = block_map.get(conn_data['to'])
-                delay = conn_data.get('delay', 0.0)
-                if from_block and to_block:
-                    connection = Connection(self.canvas, from_block, to_block, delay)
-                    self.connections.append(connection)
-                    from_block.connections_out.append(to_block)
-                    to_block.connections_in.append(from_block)
-            
-            print(f"Загружен поток: {len(self.blocks)} блоков, {len(self.connections)} соединений")
+            started = time.perf_counter()
+            if self.read_flow_file():
+                print(f"Загружен поток: {len(self.blocks)} блоков, {len(self.connections)} соединений "
+                      f"за {(time.perf_counter() - started) * 1000:.0f} мс")
         except Exception as e:
             print(f"Ошибка загрузки потока: {e}")
     
     def load_flow(self):
         """Загрузка потока с сообщением"""
-        if not os.path.exists(self.config_file):
-            messagebox.showwarning("Предупреждение", f"Файл {self.config_file} не найден!")
-            return
-        
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Очищаем текущий canvas
-            for block in self.blocks:
-                block.delete()
-            for conn in self.connections:
-                conn.delete()
-            self.blocks.clear()
-            self.connections.clear()
-            
-            # Загружаем блоки
-            block_map = {}
-            for block_data in data.get('blocks', []):
-                block_type = block_data['type']
-                x, y = block_data['x'], block_data['y']
-                block_id = block_data['id']
-                
-                if block_type == 'coordinate':
-                    block = CoordinateBlock(self.canvas, x, y, block_id)
-                    if block_data['data'].get('x') is not None:
-                        block.update_coordinates(block_data['data']['x'], block_data['data']['y'])
-                elif block_type == 'click':
-                    click_type = block_data['data'].get('click_type', 'left')
-                    block = ClickBlock(self.canvas, x, y, block_id, click_type)
-                elif block_type == 'delay':
-                    delay = block_data['data'].get('delay', 1.0)
-                    block = DelayBlock(self.canvas, x, y, block_id, delay)
-                elif block_type == 'repeat':
-                    repeat_count = block_data['data'].get('repeat_count', 1)
-                    block = RepeatBlock(self.canvas, x, y, block_id, repeat_count)
-                elif block_type == 'group':
-                    group_type = block_data['data'].get('group_type', 'start')
-                    block = GroupBlock(self.canvas, x, y, block_id, group_type)
-                    if block_data['data'].get('name'):
-                        block.update_name(block_data['data']['name'])
-                elif block_type == 'keyboard_input':
-                    text = block_data['data'].get('text', '')
-                    press_enter = block_data['data'].get('press_enter', True)
-                    block = KeyboardInputBlock(self.canvas, x, y, block_id, text, press_enter)
-                else:
-                    continue
-                
-                self.blocks.append(block)
-                block_map[block_id] = block
-                
-                if block_id >= self.next_block_id:
-                    self.next_block_id = block_id + 1
-            
-            # Загружаем соединения
-            for conn_data in data.get('connections', []):
-                from_block = block_map.get(conn_data['from'])
-                to_block = block_map.get(conn_data['to'])
-                delay = conn_data.get('delay', 0.0)
-                if from_block and to_block:
-                    connection = Connection(self.canvas, from_block, to_block, delay)
-                    self.connections.append(connection)
-                    from_block.connections_out.append(to_block)
-                    to_block.connections_in.append(from_block)
+            if not self.read_flow_file():
+                messagebox.showwarning("Предупреждение", f"Файл {self.config_file} не найден!")
+                return
             
+            # Строка статуса с временем загрузки обновляется после отрисовки (render_slice)
             messagebox.showinfo("Успех", f"✅ Поток загружен!\n\n📦 Блоков: {len(self.blocks)}\n🔗 Соединений: {len(self.connections)}")
-            self.status_label.config(text=f"✅ Загружено: {len(self.blocks)} блоков, {len(self.connections)} соединений")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось загрузить: {str(e)}")
     
@@ -2294,175 +3357,24 @@ class FlowEditor:
             return
         
         # Находим начальные блоки (без входящих соединений)
-        start_blocks = [block for block in self.blocks if not block.connections_in]
+        start_blocks = [self.block_map[block_id] for block_id in self.graph.start_ids()]
         
         if not start_blocks:
             messagebox.showwarning("Предупреждение", "Не найдено начальных блоков!\n\nДобавьте хотя бы один блок без входящих соединений.")
             return
         
-        # Генерируем Python код
-        script_lines = []
+        if not self.check_flow("Экспорт"):
+            return
         
-        # Заголовок
-        script_lines.append('#!/usr/bin/env python3')
-        script_lines.append('# -*- coding: utf-8 -*-')
-        script_lines.append('"""')
-        script_lines.append('Автоматически сгенерированный скрипт из FlowClick Studio')
-        script_lines.append('Для запуска: python <имя_файла>.py')
-        script_lines.append('"""')
-        script_lines.append('')
-        
-        # Импорты
-        script_lines.append('import pyautogui')
-        script_lines.append('import time')
-        script_lines.append('import sys')
-        
-        # Проверяем нужен ли pyperclip
-        has_keyboard_input = any(isinstance(b, KeyboardInputBlock) for b in self.blocks)
-        if has_keyboard_input:
-            script_lines.append('try:')
-            script_lines.append('    import pyperclip')
-            script_lines.append('except ImportError:')
-            script_lines.append('    print("Ошибка: установите pyperclip (pip install pyperclip)")')
-            script_lines.append('    sys.exit(1)')
-        
-        script_lines.append('')
-        script_lines.append('def main():')
-        script_lines.append('    """Основная функция выполнения скрипта"""')
-        script_lines.append('    print("🚀 Запуск автоматизации...")')
-        script_lines.append('    print("⏱️  Ожидание 2 секунды перед началом...")')
-        script_lines.append('    time.sleep(2)')
-        script_lines.append('    print("▶ Начало выполнения!\\n")')
-        script_lines.append('')
-        
-        # Генерируем функции для каждого блока
-        visited = set()
-        block_counter = {'count': 0}
-        
-        def generate_block_code(block, indent=1, context=None):
-            """Рекурсивная генерация кода для блока и его потомков"""
-            if context is None:
-                context = {'coordinates': None}
-            
-            if block.id in visited:
-                return []
-            
-            visited.add(block.id)
-            lines = []
-            ind = '    ' * indent
-            
-            if isinstance(block, CoordinateBlock):
-                x, y = block.data.get('x'), block.data.get('y')
-                if x is None or y is None:
-                    lines.append(f'{ind}print("⚠️  Блок #{block.id}: координаты не заданы, пропускаю...")')
-                else:
-                    context['coordinates'] = (x, y)
-                    lines.append(f'{ind}# Блок #{block.id}: Координаты')
-                    lines.append(f'{ind}coord_x, coord_y = {x}, {y}')
-                    lines.append(f'{ind}print(f"📍 Координаты установлены: ({{coord_x}}, {{coord_y}})")')
-            
-            elif isinstance(block, ClickBlock):
-                click_type = block.data['click_type']
-                click_name = {'left': 'Левый', 'right': 'Правый', 'middle': 'Средний'}.get(click_type, click_type)
-                
-                lines.append(f'{ind}# Блок #{block.id}: {click_name} клик')
-                if context.get('coordinates'):
-                    lines.append(f'{ind}print(f"🖱️  {click_name} клик в ({{coord_x}}, {{coord_y}})")')
-                    lines.append(f'{ind}pyautogui.click(coord_x, coord_y, button="{click_type}")')
-                else:
-                    lines.append(f'{ind}print("⚠️  Нет координат для клика, пропускаю...")')
-                lines.append(f'{ind}time.sleep(0.3)')
-            
-            elif isinstance(block, DelayBlock):
-                delay = block.data['delay']
-                lines.append(f'{ind}# Блок #{block.id}: Задержка')
-                lines.append(f'{ind}print(f"⏱️  Задержка {delay} сек...")')
-                lines.append(f'{ind}time.sleep({delay})')
-            
-            elif isinstance(block, RepeatBlock):
-                repeat_count = block.data['repeat_count']
-                lines.append(f'{ind}# Блок #{block.id}: Повторение {repeat_count}x')
-                lines.append(f'{ind}print(f"🔄 Повторение {repeat_count} раз...")')
-                lines.append(f'{ind}for iteration in range({repeat_count}):')
-                lines.append(f'{ind}    print(f"  → Итерация {{iteration + 1}}/{repeat_count}")')
-                
-                # Обрабатываем потомков внутри цикла
-                for next_block in block.connections_out:
-                    child_lines = generate_block_code(next_block, indent + 1, context.copy())
-                    lines.extend(child_lines)
-                
-                return lines  # Возвращаем сразу, потомки уже обработаны
-            
-            elif isinstance(block, GroupBlock):
-                group_type = block.data['group_type']
-                group_name = block.data.get('name', 'Группа')
-                marker = 'Начало' if group_type == 'start' else 'Конец'
-                lines.append(f'{ind}# Блок #{block.id}: {marker} группы "{group_name}"')
-                lines.append(f'{ind}print("📦 {marker} группы: {group_name}")')
-            
-            elif isinstance(block, KeyboardInputBlock):
-                text = block.data.get('text', '')
-                press_enter = block.data.get('press_enter', True)
-                # Экранируем кавычки и переносы строк
-                text_escaped = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
-                lines.append(f'{ind}# Блок #{block.id}: Ввод текста')
-                lines.append(f'{ind}text_to_type = "{text_escaped}"')
-                lines.append(f'{ind}print(f"⌨️  Ввод текста: {{text_to_type[:30]}}...")')
-                lines.append(f'{ind}try:')
-                lines.append(f'{ind}    pyperclip.copy(text_to_type)')
-                lines.append(f'{ind}    time.sleep(0.15)')
-                lines.append(f'{ind}    pyautogui.hotkey("ctrl", "v")')
-                lines.append(f'{ind}    time.sleep(0.2)')
-                lines.append(f'{ind}except Exception as e:')
-                lines.append(f'{ind}    print(f"⚠️  Ошибка буфера обмена: {{e}}")')
-                lines.append(f'{ind}    for char in text_to_type:')
-                lines.append(f'{ind}        pyautogui.write(char, interval=0.05)')
-                
-                if press_enter:
-                    lines.append(f'{ind}time.sleep(0.2)')
-                    lines.append(f'{ind}pyautogui.press("enter")')
-                
-                lines.append(f'{ind}time.sleep(0.3)')
-            
-            # Обрабатываем потомков (если не RepeatBlock, он обработан выше)
-            if not isinstance(block, RepeatBlock):
-                for next_block in block.connections_out:
-                    # Проверяем задержку на соединении
-                    delay_on_connection = 0.0
-                    for conn in self.connections:
-                        if conn.from_block == block and conn.to_block == next_block:
-                            delay_on_connection = conn.delay
-                            break
-                    
-                    if delay_on_connection > 0:
-                        lines.append(f'{ind}# Задержка на переходе')
-                        lines.append(f'{ind}time.sleep({delay_on_connection})')
-                    
-                    child_lines = generate_block_code(next_block, indent, context.copy())
-                    lines.extend(child_lines)
-            
-            return lines
-        
-        # Генерируем код для всех начальных блоков
-        for start_block in start_blocks:
-            code_lines = generate_block_code(start_block, indent=1)
-            script_lines.extend(code_lines)
-            script_lines.append('')
-        
-        script_lines.append('    print("\\n✅ Выполнение завершено!")')
-        script_lines.append('')
-        script_lines.append('if __name__ == "__main__":')
-        script_lines.append('    try:')
-        script_lines.append('        main()')
-        script_lines.append('    except KeyboardInterrupt:')
-        script_lines.append('        print("\\n⏹️  Прервано пользователем")')
-        script_lines.append('        sys.exit(0)')
-        script_lines.append('    except Exception as e:')
-        script_lines.append('        print(f"\\n❌ Ошибка: {e}")')
-        script_lines.append('        sys.exit(1)')
-        
-        # Объединяем строки
-        script_content = '\n'.join(script_lines)
+        export_format = self.export_format_var.get() if hasattr(self, 'export_format_var') else 'table'
+        try:
+            if export_format == 'table':
+                script_content, exported_count = self.build_table_script()
+            else:
+                script_content, exported_count = self.build_python_script()
+        except FlowCompileError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
         
         # Сохраняем в файл
         from tkinter import filedialog
@@ -2483,13 +3395,31 @@ class FlowEditor:
                     "Успех",
                     f"✅ Скрипт успешно экспортирован!\n\n"
                     f"📁 Файл: {file_path}\n"
-                    f"📦 Блоков экспортировано: {len(visited)}\n\n"
+                    f"📦 Блоков экспортировано: {exported_count}\n\n"
                     f"Для запуска:\n"
                     f'python "{file_path}"'
                 )
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось сохранить скрипт: {str(e)}")
     
+    def export_plan(self):
+        """План для экспорта (ветви по очереди, после оптимизации). Возвращает (план, количество блоков в плане)"""
+        plan = compile_flow(self.graph, branch_mode='sequential')
+        exported = {instr[1] for instr in plan.code if instr[1] is not None}
+        plan, report = optimize_plan(plan)
+        print(report.format())
+        return plan, len(exported)
+    
+    def build_table_script(self):
+        """Скрипт с таблицей инструкций плана. Возвращает (текст, количество блоков в плане)"""
+        plan, exported_count = self.export_plan()
+        return build_table_script(plan, self.graph.timing.get('profile', 'safe')), exported_count
+    
+    def build_python_script(self):
+        """Скрипт с кодом по инструкциям плана. Возвращает (текст, количество блоков в плане)"""
+        plan, exported_count = self.export_plan()
+        return build_code_script(plan, self.graph.timing.get('profile', 'safe')), exported_count
+    
     def generate_single_block_code(self, block):
         """Генерация Python кода для одного блока (как в экспорте)"""
         lines = []
@@ -2500,8 +3430,17 @@ class FlowEditor:
         lines.append(f"# ═══════════════════════════════════════════════════")
         lines.append("")
         
+        # Несколько входящих соединений - режим слияния
+        if len(self.graph.inc[block.id]) > 1:
+            if join_mode(block) == 'every':
+                lines.append("# 🔀 Слияние 'каждый путь': блок и всё после него выполняются для каждого входящего пути")
+            else:
+                lines.append("# 🔀 Слияние 'один раз': блок выполняется, когда пройдены все входящие пути")
+            lines.append("")
+        
         # Генерируем код точно как в экспорте
         indent = ""  # Без отступа для просмотра одного блока
+        timing = self.get_timing()
         
         if isinstance(block, CoordinateBlock):
             x, y = block.data.get('x'), block.data.get('y')
@@ -2509,12 +3448,25 @@ class FlowEditor:
                 lines.append(f'{indent}# ⚠️  Coordinates not set!')
             else:
                 lines.append(f'{indent}coord_x, coord_y = {x}, {y}')
+            anchor = block.data.get('anchor')
+            if anchor:
+                lines.append(f"{indent}# 🎯 Точка ищется на экране по образцу {anchor.get('width')}x{anchor.get('height')}")
+                if anchor.get('on_miss') == 'fallback':
+                    lines.append(f'{indent}coord_x, coord_y = find_anchor(ANCHOR_{block.id}) or (coord_x, coord_y)')
+                else:
+                    lines.append(f'{indent}coord_x, coord_y = find_anchor(ANCHOR_{block.id})  # не найден - остановка')
         
         elif isinstance(block, ClickBlock):
             click_type = block.data['click_type']
             
-            lines.append(f'{indent}pyautogui.click(coord_x, coord_y, button="{click_type}")')
-            lines.append(f'{indent}time.sleep(0.3)')
+            if block.data.get('drag'):
+                lines.append(f'{indent}pyautogui.mouseDown(coord_x, coord_y, button="{click_type}")')
+                for dx, dy in block.data['drag']:
+                    lines.append(f'{indent}pyautogui.moveTo(coord_x + {dx}, coord_y + {dy})')
+                lines.append(f'{indent}pyautogui.mouseUp(button="{click_type}")')
+            else:
+                lines.append(f'{indent}pyautogui.click(coord_x, coord_y, button="{click_type}")')
+            lines.append(f'{indent}time.sleep({timing["click_settle"]})')
         
         elif isinstance(block, DelayBlock):
             delay = block.data['delay']
@@ -2537,20 +3489,17 @@ class FlowEditor:
             text_escaped = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
             
             lines.append(f'{indent}text_to_type = "{text_escaped}"')
-            lines.append(f'{indent}try:')
-            lines.append(f'{indent}    pyperclip.copy(text_to_type)')
-            lines.append(f'{indent}    time.sleep(0.15)')
-            lines.append(f'{indent}    pyautogui.hotkey("ctrl", "v")')
-            lines.append(f'{indent}    time.sleep(0.2)')
-            lines.append(f'{indent}except Exception as e:')
-            lines.append(f'{indent}    for char in text_to_type:')
-            lines.append(f'{indent}        pyautogui.write(char, interval=0.05)')
+            strategy = TypingEngine(None, timing).choose_strategy(text)
+            lines.append(f'{indent}type_text(text_to_type, "{strategy}")  # paste - буфер обмена порциями, keys - набор клавишами')
             
             if press_enter:
-                lines.append(f'{indent}time.sleep(0.2)')
+                lines.append(f'{indent}time.sleep({timing["enter_before"]})')
                 lines.append(f'{indent}pyautogui.press("enter")')
             
-            lines.append(f'{indent}time.sleep(0.3)')
+            lines.append(f'{indent}time.sleep({timing["type_settle"]})')
+        
+        elif isinstance(block, ScreenWaitBlock):
+            lines.extend(self.screen_wait_code(block.data, indent))
         
         else:
             lines.append(f'{indent}# ❓ Неизвестный тип блока')
@@ -2560,23 +3509,25 @@ class FlowEditor:
         lines.append("# ─────────────────────────────────────────────────")
         lines.append("# 🔗 Информация о соединениях:")
         
-        if block.connections_in:
-            lines.append(f"# ← Входящие: {len(block.connections_in)} блок(ов)")
-            for in_block in block.connections_in:
+        in_ids = self.graph.predecessors(block.id)
+        out_ids = self.graph.successors(block.id)
+        
+        if in_ids:
+            lines.append(f"# ← Входящие: {len(in_ids)} блок(ов)")
+            for in_id in in_ids:
+                in_block = self.block_map[in_id]
                 lines.append(f"#   • Блок #{in_block.id} ({in_block.type})")
         else:
             lines.append("# ← Входящие: нет (начальный блок)")
         
-        if block.connections_out:
-            lines.append(f"# → Исходящие: {len(block.connections_out)} блок(ов)")
-            for out_block in block.connections_out:
-                delay = 0.0
-                for conn in self.connections:
-                    if conn.from_block == block and conn.to_block == out_block:
-                        delay = conn.delay
-                        break
-                
+        if out_ids:
+            lines.append(f"# → Исходящие: {len(out_ids)} блок(ов)")
+            for out_id in out_ids:
+                out_block = self.block_map[out_id]
+                delay = self.graph.get_delay(block.id, out_id)
                 delay_str = f" [⏱️  {delay}s]" if delay > 0 else ""
+                if self.graph.get_watch(block.id, out_id):
+                    delay_str += " [👁 ожидание экрана]"
                 lines.append(f"#   • Блок #{out_block.id} ({out_block.type}){delay_str}")
         else:
             lines.append("# → Исходящие: нет (конечный блок)")
@@ -2603,6 +3554,11 @@ class FlowEditor:
             lines.append("# Чтобы добавить задержку, измените значение:")
             lines.append("# time.sleep(1.0)")
         
+        if connection.watch:
+            lines.append("")
+            lines.append("# Ожидание экрана (после задержки):")
+            lines.extend(self.screen_wait_code(connection.watch))
+        
         # Информация о соединении
         lines.append("")
         lines.append("# ─────────────────────────────────────────────────")
@@ -2613,6 +3569,19 @@ class FlowEditor:
         
         return '\n'.join(lines)
     
+    def screen_wait_code(self, data, indent=""):
+        """Строки вызова wait_screen для панели кода"""
+        try:
+            spec = watch_spec(data)
+        except FlowCompileError as e:
+            return [f'{indent}# ⚠️  {e}']
+        if spec is None:
+            return [f'{indent}# ⚠️  Область экрана не задана!']
+        return [
+            f'{indent}if not wait_screen{spec!r}:',
+            f'{indent}    sys.exit(1)',
+        ]
+    
     def update_code_panel(self, block):
         """Обновление панели с кодом выбранного блока"""
         if not hasattr(self, 'code_text'):
@@ -2676,8 +3645,7 @@ class FlowEditor:
                 sleep_match = re.search(r'time\.sleep\s*\(\s*([\d.]+)\s*\)', edited_code)
                 if sleep_match:
                     new_delay = float(sleep_match.group(1))
-                    connection.delay = new_delay
-                    connection.update()
+                    self.set_connection_delay(connection, new_delay)
                     self.status_label.config(text=f"✅ Задержка на соединении обновлена: {new_delay} сек")
                     # Обновляем панель кода
                     self.update_code_panel_connection(connection)
@@ -2705,20 +3673,18 @@ class FlowEditor:
                 # Ищем coord_x = NUMBER и coord_y = NUMBER (только строки присваивания)
                 x_match = re.search(r'^\s*coord_x\s*[,=]\s*(\d+)', edited_code, re.MULTILINE)
                 y_match = re.search(r'^\s*coord_y\s*[=]\s*(\d+)', edited_code, re.MULTILINE)
-                
-                # Если не нашли отдельные строки, пробуем формат "coord_x, coord_y = X, Y"
-                if not x_match or not y_match:
+                new_x = new_y = None
+                if x_match and y_match:
+                    new_x = int(x_match.group(1))
+                    new_y = int(y_match.group(1))
+                else:
+                    # Если не нашли отдельные строки, пробуем формат "coord_x, coord_y = X, Y"
                     pair_match = re.search(r'coord_x\s*,\s*coord_y\s*=\s*(\d+)\s*,\s*(\d+)', edited_code)
                     if pair_match:
                         new_x = int(pair_match.group(1))
                         new_y = int(pair_match.group(2))
-                        block.update_coordinates(new_x, new_y)
-                        self.status_label.config(text=f"✅ Координаты обновлены: X={new_x}, Y={new_y}")
-                        return
                 
-                if x_match and y_match:
-                    new_x = int(x_match.group(1))
-                    new_y = int(y_match.group(1))
+                if new_x is not None:
                     block.update_coordinates(new_x, new_y)
                     self.status_label.config(text=f"✅ Координаты обновлены: X={new_x}, Y={new_y}")
                 else:
@@ -2732,13 +3698,15 @@ class FlowEditor:
                     new_button = button_match.group(1)
                     if new_button in ['left', 'right', 'middle']:
                         block.data['click_type'] = new_button
-                        # Перерисовываем блок
+                        # Перерисовываем блок (режим слияния и путь перетаскивания сохраняются)
+                        join = block.data.get('join')
                         block.delete()
-                        block.__init__(block.canvas, block.x, block.y, block.id, new_button)
+                        block.__init__(block.canvas, block.x, block.y, block.id, new_button, block.data.get('drag'))
+                        if join:
+                            block.data['join'] = join
+                        self.graph.nodes[block.id].data = block.data
                         # Восстанавливаем соединения
-                        for conn in self.connections:
-                            if conn.from_block == block or conn.to_block == block:
-                                conn.update()
+                        self.update_connections(block)
                         self.status_label.config(text=f"✅ Тип клика изменен на: {new_button}")
                     else:
                         messagebox.showwarning("Предупреждение", f"Неверный тип кнопки: {new_button}")
@@ -2798,6 +3766,7 @@ class FlowEditor:
                 messagebox.showinfo("Информация", f"Редактирование кода для типа {block.type} пока не поддерживается")
                 return
             
+            self.record_block_data(block)
             # Обновляем панель кода
             self.update_code_panel(block)
             
@@ -2808,13 +3777,37 @@ class FlowEditor:
                 
     def on_closing(self):
         """Обработка закрытия окна"""
+        self.stop_token.stop()
         self.is_running = False
-        keyboard.unhook_all()
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+        if self.keyboard:
+            self.keyboard.unhook_all()
+        if self.journal is not None and self.journal.entries:
+            try:
+                self.journal.compact(self.serialize_flow())
+            except OSError as e:
+                print(f"Ошибка сохранения потока: {e}")
         self.root.destroy()
 
 def main():
+    # Запуск без редактора: python main.py run flow.json
+    if len(sys.argv) > 1 and sys.argv[1] == 'run':
+        from flow_runner import main as run_main
+        sys.exit(run_main(sys.argv[2:], started_at=STARTUP_T0))
+    
+    load_ui_modules()
+    imported_at = time.perf_counter() - STARTUP_T0
     root = tk.Tk()
     app = FlowEditor(root)
+    if '--startup-profile' in sys.argv[1:]:
+        app.startup_profile = {
+            'импорт модулей': imported_at,
+            'интерфейс создан': time.perf_counter() - STARTUP_T0
+        }
+    if '--trace' in sys.argv[1:-1]:
+        app.trace_file = sys.argv[sys.argv.index('--trace') + 1]
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
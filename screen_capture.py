@@ -0,0 +1,356 @@
+"""
+Снимки экрана и ожидание изменений в области экрана.
+
+Источник кадров (ScreenSource) снимает только нужную область и отдает
+Frame - байты RGB по строкам. PilScreen снимает реальный экран через
+PIL.ImageGrab, SyntheticScreen - изменяемый кадр в памяти (для проверок
+без дисплея и для --dry-run).
+
+Для сравнения кадров область уменьшается до миниатюры не больше
+THUMB_SIZE x THUMB_SIZE точек выборкой строк и срезами байтов с шагом -
+это делается на стороне C, поэтому один опрос (снимок + миниатюра +
+сравнение) занимает единицы миллисекунд даже для крупной области.
+
+FrameCache - общий кэш кадров поверх источника: экран снимается не чаще
+одного раза за интервал (по объединению запрошенных областей), а все
+проверки в пределах интервала получают Frame-представления того же
+буфера без копирования.
+"""
+import collections
+import threading
+import time
+
+
+WATCH_MODES = ('change', 'color', 'stable')
+THUMB_SIZE = 32        # Точек миниатюры по стороне (не больше)
+COLOR_TOLERANCE = 24   # Допуск по каналу цвета (0-255)
+POLL_INTERVAL = 0.03   # Пауза между опросами области (сек)
+FRAME_INTERVAL = 0.015  # Кадр кэша считается свежим (сек)
+
+
+class Frame:
+    """Кадр области экрана: RGB, 3 байта на точку.
+
+    Строка y начинается в data с offset + y * stride - кадр может быть
+    представлением части большего буфера (FrameCache) без копирования.
+    """
+    __slots__ = ('width', 'height', 'data', 'left', 'top', 'stride', 'offset')
+
+    def __init__(self, width, height, data, left=0, top=0, stride=None, offset=0):
+        self.width = width
+        self.height = height
+        self.data = data    # bytes / bytearray / memoryview
+        self.left = left    # Положение кадра на экране
+        self.top = top
+        self.stride = stride if stride is not None else width * 3
+        self.offset = offset
+
+    def pixel(self, x, y):
+        """Цвет точки (координаты внутри кадра)"""
+        offset = self.offset + y * self.stride + x * 3
+        data = self.data
+        return data[offset], data[offset + 1], data[offset + 2]
+
+    def row(self, y):
+        """Байты строки y (для представления - без копирования)"""
+        start = self.offset + y * self.stride
+        return self.data[start:start + self.width * 3]
+
+    def tobytes(self):
+        """Точки кадра подряд (копия)"""
+        if self.stride == self.width * 3 and self.offset == 0:
+            return bytes(self.data[:self.width * self.height * 3])
+        return b''.join(bytes(self.row(y)) for y in range(self.height))
+
+    def view(self, x, y, width, height):
+        """Представление прямоугольника (координаты экрана) без копирования"""
+        offset = self.offset + (y - self.top) * self.stride + (x - self.left) * 3
+        return Frame(width, height, self.data, x, y, self.stride, offset)
+
+    def covers(self, x, y, width, height):
+        """Лежит ли прямоугольник (координаты экрана) внутри кадра"""
+        return (self.left <= x and self.top <= y
+                and x + width <= self.left + self.width and y + height <= self.top + self.height)
+
+
+def thumbnail(frame, size=THUMB_SIZE):
+    """Миниатюра кадра: (байты R, байты G, байты B) выбранных точек"""
+    width, height = frame.width, frame.height
+    step_x = max(1, width // size)
+    step_y = max(1, height // size)
+    pixel_step = step_x * 3
+    reds, greens, blues = [], [], []
+    for y in range(step_y // 2, height, step_y):
+        row = frame.row(y)
+        reds.append(bytes(row[0::pixel_step]))
+        greens.append(bytes(row[1::pixel_step]))
+        blues.append(bytes(row[2::pixel_step]))
+    return b''.join(reds), b''.join(greens), b''.join(blues)
+
+
+def differs(first, second, tolerance=COLOR_TOLERANCE):
+    """Отличаются ли миниатюры хотя бы в одной точке больше чем на tolerance"""
+    if first == second:
+        return False
+    for channel_a, channel_b in zip(first, second):
+        if len(channel_a) != len(channel_b):
+            return True
+        if channel_a == channel_b:
+            continue
+        for a, b in zip(channel_a, channel_b):
+            if a - b > tolerance or b - a > tolerance:
+                return True
+    return False
+
+
+def average_color(thumb):
+    """Средний цвет миниатюры (r, g, b)"""
+    count = len(thumb[0]) or 1
+    return tuple(sum(channel) / count for channel in thumb)
+
+
+def parse_color(text):
+    """'#rrggbb' -> (r, g, b). ValueError, если формат другой"""
+    value = text.strip().lstrip('#')
+    if len(value) != 6:
+        raise ValueError(f"Цвет должен быть в формате #rrggbb: {text}")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def color_matches(color, target, tolerance=COLOR_TOLERANCE):
+    """Совпадает ли цвет с целевым с допуском по каждому каналу"""
+    return all(abs(a - b) <= tolerance for a, b in zip(color, target))
+
+
+class ScreenSource:
+    """Источник кадров экрана"""
+    def grab(self, region):
+        """Кадр области (x, y, ширина, высота) в экранных координатах"""
+        raise NotImplementedError
+
+    def size(self):
+        """Размер экрана (ширина, высота)"""
+        raise NotImplementedError
+
+
+class PilScreen(ScreenSource):
+    """Снимки реального экрана через PIL.ImageGrab (только запрошенная область)"""
+    def __init__(self):
+        from PIL import ImageGrab
+        self.image_grab = ImageGrab
+        self.screen_size = None
+
+    def grab(self, region):
+        x, y, width, height = region
+        image = self.image_grab.grab(bbox=(x, y, x + width, y + height))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return Frame(image.width, image.height, image.tobytes(), x, y)
+
+    def size(self):
+        if self.screen_size is None:
+            self.screen_size = self.image_grab.grab().size
+        return self.screen_size
+
+
+class SyntheticScreen(ScreenSource):
+    """Экран в памяти: кадр можно менять из теста или другого потока"""
+    def __init__(self, width=1920, height=1080, color=(0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(color) * (width * height))
+        self.grabs = 0
+
+    def fill(self, region, color):
+        """Заливка прямоугольника (x, y, ширина, высота) цветом (r, g, b)"""
+        x, y, width, height = self.clip(region)
+        row = bytes(color) * width
+        for line in range(y, y + height):
+            offset = (line * self.width + x) * 3
+            self.pixels[offset:offset + width * 3] = row
+
+    def clip(self, region):
+        x, y, width, height = region
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(self.width, x + width), min(self.height, y + height)
+        return x1, y1, max(0, x2 - x1), max(0, y2 - y1)
+
+    def grab(self, region):
+        self.grabs += 1
+        x, y, width, height = self.clip(region)
+        stride = self.width * 3
+        pixels = self.pixels
+        rows = [
+            bytes(pixels[line * stride + x * 3:line * stride + (x + width) * 3])
+            for line in range(y, y + height)
+        ]
+        return Frame(width, height, b''.join(rows), x, y)
+
+    def size(self):
+        return self.width, self.height
+
+    def paste(self, left, top, frame):
+        """Вставка кадра (например, образца) в точку (left, top)"""
+        stride = frame.width * 3
+        for line in range(frame.height):
+            offset = ((top + line) * self.width + left) * 3
+            self.pixels[offset:offset + stride] = frame.row(line)
+
+
+class FrameStats:
+    """Счетчики FrameCache"""
+    def __init__(self):
+        self.captures = 0      # Снимков источника
+        self.views = 0         # Запросов, отданных из кэша
+        self.bytes_copied = 0  # Байт, скопированных снимками
+        self.moments = collections.deque(maxlen=1024)  # Время последних снимков
+
+    def captures_per_second(self, window=1.0):
+        """Снимков за последние window сек (в пересчете на секунду)"""
+        now = time.perf_counter()
+        return sum(1 for moment in self.moments if now - moment <= window) / window
+
+    def format(self):
+        """Текст статистики (одна строка)"""
+        total = self.captures + self.views
+        share = self.views / total * 100 if total else 0.0
+        return (
+            f"🖼️ Кадры экрана: {self.captures} снимков, {self.views} из кэша ({share:.0f}%), "
+            f"скопировано {self.bytes_copied / 1024:.0f} КБ"
+        )
+
+
+class FrameCache(ScreenSource):
+    """Общий кэш кадров: не больше одного снимка за interval.
+
+    Снимается объединение областей, запрошенных с прошлого снимка, и
+    новой области - проверки разных областей в пределах интервала
+    обслуживает один снимок. Запросы отдаются Frame-представлениями
+    (memoryview того же буфера), pixel() - одна точка без снимка.
+    Потокобезопасен (общий для параллельных ветвей).
+    """
+    def __init__(self, source=None, interval=FRAME_INTERVAL):
+        self.source = source  # None - PilScreen при первом снимке
+        self.interval = interval
+        self.frame = None
+        self.captured_at = 0.0
+        self.requested = None  # Объединение областей с прошлого снимка
+        self.lock = threading.Lock()
+        self.stats = FrameStats()
+
+    def size(self):
+        if self.source is None:
+            self.source = PilScreen()
+        return self.source.size()
+
+    def invalidate(self):
+        """Следующий запрос снимет экран заново"""
+        self.frame = None
+
+    def grab(self, region):
+        with self.lock:
+            x, y, width, height = self.clip(region)
+            now = time.perf_counter()
+            frame = self.frame
+            self.requested = union(self.requested, (x, y, width, height))
+            if (frame is not None and now - self.captured_at < self.interval
+                    and frame.covers(x, y, width, height)):
+                self.stats.views += 1
+                return frame.view(x, y, width, height)
+            frame = self.capture(self.requested, now)
+            self.requested = (x, y, width, height)
+            return frame.view(x, y, width, height)
+
+    def pixel(self, x, y):
+        """Цвет точки экрана (r, g, b) из кадра кэша"""
+        return self.grab((x, y, 1, 1)).pixel(0, 0)
+
+    def clip(self, region):
+        width, height = self.size()
+        x, y, w, h = region
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(width, x + w), min(height, y + h)
+        return x1, y1, max(0, x2 - x1), max(0, y2 - y1)
+
+    def capture(self, region, now):
+        frame = self.source.grab(region)
+        data = frame.data if isinstance(frame.data, memoryview) else memoryview(frame.data)
+        frame = Frame(frame.width, frame.height, data, frame.left, frame.top, frame.stride, frame.offset)
+        self.frame = frame
+        self.captured_at = now
+        stats = self.stats
+        stats.captures += 1
+        stats.bytes_copied += frame.width * frame.height * 3
+        stats.moments.append(now)
+        return frame
+
+
+def union(first, second):
+    """Ограничивающий прямоугольник двух областей (x, y, ширина, высота)"""
+    if first is None:
+        return second
+    x1, y1 = min(first[0], second[0]), min(first[1], second[1])
+    x2 = max(first[0] + first[2], second[0] + second[2])
+    y2 = max(first[1] + first[3], second[1] + second[3])
+    return x1, y1, x2 - x1, y2 - y1
+
+
+def create_screen(interval=FRAME_INTERVAL):
+    """Источник кадров реального экрана через общий кэш (ImportError, если нет Pillow)"""
+    return FrameCache(PilScreen(), interval)
+
+
+class WatchResult:
+    """Итог ожидания области экрана"""
+    __slots__ = ('matched', 'stopped', 'elapsed', 'polls', 'poll_cost')
+
+    def __init__(self, matched, stopped, elapsed, polls, poll_cost):
+        self.matched = matched
+        self.stopped = stopped
+        self.elapsed = elapsed      # Сек от начала ожидания
+        self.polls = polls          # Снимков области
+        self.poll_cost = poll_cost  # Среднее время снимка и сравнения (сек)
+
+
+def wait_for_screen(screen, region, mode, color=None, stable_ms=300, timeout=10.0, wait=None,
+                    tolerance=COLOR_TOLERANCE, poll=POLL_INTERVAL):
+    """Ожидание условия в области экрана.
+
+    mode: 'change' - область отличается от первого снимка, 'color' - средний
+    цвет области совпадает с color, 'stable' - область не меняется stable_ms.
+    wait(seconds) -> False, если выполнение остановлено (StopToken.wait).
+    Время ожидания - большее из реального и суммы пауз (паузы без сна
+    в --dry-run тоже продвигают время).
+    """
+    wait = wait or (lambda seconds: time.sleep(seconds) or True)
+    started = time.perf_counter()
+    cost = 0.0
+
+    def capture():
+        nonlocal cost
+        moment = time.perf_counter()
+        thumb = thumbnail(screen.grab(region))
+        cost += time.perf_counter() - moment
+        return thumb
+
+    baseline = previous = current = capture()
+    polls = 1
+    waited = 0.0
+    stable_since = 0.0
+    while True:
+        elapsed = max(time.perf_counter() - started, waited)
+        if mode == 'change':
+            matched = differs(baseline, current, tolerance)
+        elif mode == 'color':
+            matched = color_matches(average_color(current), color, tolerance)
+        else:
+            if differs(previous, current, tolerance):
+                stable_since = elapsed
+            matched = elapsed - stable_since >= stable_ms / 1000
+        if matched or elapsed >= timeout:
+            return WatchResult(matched, False, elapsed, polls, cost / polls)
+        if not wait(poll):
+            return WatchResult(False, True, elapsed, polls, cost / polls)
+        waited += poll
+        previous, current = current, capture()
+        polls += 1
@@ -0,0 +1,145 @@
+"""
+Пространственный индекс для поиска элементов canvas по координатам.
+
+Равномерная сетка: каждый элемент хранится во всех ячейках, которые
+пересекает его прямоугольник (для отрезков - только ячейки вдоль самого
+отрезка). Поиск по точке проверяет одну ячейку, поэтому не зависит от
+общего количества блоков и соединений.
+"""
+
+
+class GridIndex:
+    """Индекс прямоугольников на равномерной сетке"""
+    def __init__(self, cell_size=200):
+        self.cell_size = cell_size
+        self.cells = {}   # (cx, cy) -> {ключ, ...}
+        self.boxes = {}   # ключ -> (x1, y1, x2, y2)
+        self.key_cells = {}  # ключ -> ячейки, в которых он хранится
+        self.order = {}   # ключ -> порядковый номер добавления (для выбора верхнего элемента)
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        return key in self.boxes
+
+    def cell_range(self, box):
+        """Ячейки, которые пересекает прямоугольник"""
+        size = self.cell_size
+        x1, y1, x2, y2 = box
+        for cx in range(int(x1 // size), int(x2 // size) + 1):
+            for cy in range(int(y1 // size), int(y2 // size) + 1):
+                yield cx, cy
+
+    def segment_cells(self, x1, y1, x2, y2, pad=0):
+        """Ячейки, в которых есть точки не дальше pad от отрезка"""
+        size = self.cell_size
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        cells = set()
+        for cx in range(int((x1 - pad) // size), int((x2 + pad) // size) + 1):
+            # Участок отрезка, ближайший к точкам этого столбца ячеек
+            ax = min(max(cx * size - pad, x1), x2)
+            bx = min(max((cx + 1) * size + pad, x1), x2)
+            if x2 == x1:
+                ya, yb = y1, y2
+            else:
+                slope = (y2 - y1) / (x2 - x1)
+                ya = y1 + slope * (ax - x1)
+                yb = y1 + slope * (bx - x1)
+            for cy in range(int((min(ya, yb) - pad) // size), int((max(ya, yb) + pad) // size) + 1):
+                cells.add((cx, cy))
+        return cells
+
+    def insert(self, key, box, cells=None):
+        """Добавление элемента или обновление его прямоугольника.
+
+        cells - ячейки элемента, если они уже, чем его прямоугольник (см. segment_cells)
+        """
+        if key in self.boxes:
+            self.update(key, box, cells)
+            return
+        self.counter += 1
+        self.order[key] = self.counter
+        self.boxes[key] = box
+        key_cells = set(self.cell_range(box)) if cells is None else set(cells)
+        self.key_cells[key] = key_cells
+        buckets = self.cells
+        for cell in key_cells:
+            buckets.setdefault(cell, set()).add(key)
+
+    def update(self, key, box, cells=None):
+        """Новый прямоугольник элемента (порядок добавления сохраняется)"""
+        self.boxes[key] = box
+        old_cells = self.key_cells[key]
+        new_cells = set(self.cell_range(box)) if cells is None else set(cells)
+        if old_cells == new_cells:
+            return
+        self.key_cells[key] = new_cells
+        buckets = self.cells
+        for cell in old_cells - new_cells:
+            bucket = buckets[cell]
+            bucket.discard(key)
+            if not bucket:
+                del buckets[cell]
+        for cell in new_cells - old_cells:
+            buckets.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        """Удаление элемента (если он есть)"""
+        if self.boxes.pop(key, None) is None:
+            return
+        del self.order[key]
+        buckets = self.cells
+        for cell in self.key_cells.pop(key):
+            bucket = buckets.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[cell]
+
+    def query_point(self, x, y):
+        """Ключи элементов, прямоугольник которых содержит точку"""
+        size = self.cell_size
+        bucket = self.cells.get((int(x // size), int(y // size)))
+        if not bucket:
+            return []
+        boxes = self.boxes
+        result = []
+        for key in bucket:
+            x1, y1, x2, y2 = boxes[key]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                result.append(key)
+        return result
+
+    def query_rect(self, x1, y1, x2, y2):
+        """Ключи элементов, прямоугольник которых пересекает заданный"""
+        cells = self.cells
+        boxes = self.boxes
+        result = set()
+        seen = set()
+        size = self.cell_size
+        span = (int(x2 // size) - int(x1 // size) + 1) * (int(y2 // size) - int(y1 // size) + 1)
+        if span > len(cells):
+            # Прямоугольник больше занятой области - быстрее перебрать непустые ячейки
+            buckets = cells.values()
+        else:
+            buckets = (cells.get(cell) for cell in self.cell_range((x1, y1, x2, y2)))
+        for bucket in buckets:
+            if not bucket:
+                continue
+            for key in bucket:
+                if key in seen:
+                    continue
+                seen.add(key)
+                bx1, by1, bx2, by2 = boxes[key]
+                if bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2:
+                    result.add(key)
+        return result
+
+    def clear(self):
+        self.cells.clear()
+        self.boxes.clear()
+        self.key_cells.clear()
+        self.order.clear()
@@ -0,0 +1,288 @@
+"""
+Поиск образца (небольшого снимка экрана) на экране - привязка координат к изображению.
+
+Образец хранится в потоке в data['anchor'] блока координат: размеры,
+точки RGB (zlib + base64) и смещение точки клика внутри образца.
+
+Поиск без numpy и OpenCV, только операциями над bytes и int на стороне C:
+- яркость - зеленый канал, уменьшение в f раз - выборка строк и среза
+  байтов с шагом (уровни пирамиды f = COARSE_FACTOR и 1);
+- на грубом уровне для каждой фазы образца (f x f вариантов выборки) берется
+  несколько характерных точек; маска "яркость точки в допуске" строится
+  bytes.translate по всей плоскости, маски точек сдвигаются на смещение точки
+  и пересекаются как большие целые числа - кандидаты получаются сразу для
+  всех положений;
+- кандидаты проверяются на полном разрешении средней разностью яркости
+  с ранним выходом.
+
+Сначала поиск идет в окрестности прошлой находки (обычно окно не сдвинулось),
+и только при промахе - по всему экрану. Декодированные образцы и их
+уменьшенные варианты кэшируются (TemplateCache).
+"""
+import base64
+import time
+import zlib
+
+from screen_capture import Frame
+
+
+COARSE_FACTOR = 4       # Уменьшение грубого уровня пирамиды
+MASK_POINTS = 8         # Характерных точек образца для маски кандидатов
+POINT_TOLERANCE = 32    # Допуск яркости точки маски (0-255)
+MATCH_TOLERANCE = 12    # Допустимая средняя разность яркости совпадения
+REGION_MARGIN = 48      # Поле вокруг прошлой находки (пиксели)
+MAX_CANDIDATES = 2000   # Проверок на полном разрешении за поиск (не больше)
+CACHE_SIZE = 32         # Декодированных образцов в кэше
+ANCHOR_SIZE = 48        # Сторона образца, снимаемого вокруг точки в редакторе
+
+
+def encode_template(frame):
+    """Образец из кадра -> данные для data['anchor'] (точка клика - центр)"""
+    return {
+        'width': frame.width,
+        'height': frame.height,
+        'pixels': base64.b64encode(zlib.compress(frame.tobytes())).decode('ascii'),
+        'offset': [frame.width // 2, frame.height // 2],
+    }
+
+
+def anchor_key(anchor):
+    """Ключ образца для кэша и инструкции плана (хешируемый кортеж)"""
+    offset = anchor.get('offset') or (anchor['width'] // 2, anchor['height'] // 2)
+    return (int(anchor['width']), int(anchor['height']), anchor['pixels'], int(offset[0]), int(offset[1]))
+
+
+def gray_plane(frame, factor=1, phase_x=0, phase_y=0):
+    """Яркость (зеленый канал) с шагом factor: (ширина, высота, байты)"""
+    step = factor * 3
+    rows = [bytes(frame.row(y)[phase_x * 3 + 1::step]) for y in range(phase_y, frame.height, factor)]
+    plane_width = len(rows[0]) if rows else 0
+    if any(len(row) != plane_width for row in rows):
+        return 0, 0, b''
+    return plane_width, len(rows), b''.join(rows)
+
+
+def pick_points(width, height, plane, count=MASK_POINTS):
+    """Точки маски: по квантилям яркости (и фон образца, и детали), не соседние"""
+    order = sorted(range(len(plane)), key=plane.__getitem__)
+    last = len(order) - 1
+    points = []
+    for q in range(count):
+        for i in order[q * last // max(1, count - 1):]:
+            x, y = i % width, i // width
+            if not any(abs(x - px) < 2 and abs(y - py) < 2 for px, py, _ in points):
+                points.append((x, y, plane[i]))
+                break
+    return points
+
+
+# Таблицы bytes.translate: значение в допуске -> 1, иначе 0
+_tables = {}
+
+
+def tolerance_table(value, tolerance=POINT_TOLERANCE):
+    table = _tables.get((value, tolerance))
+    if table is None:
+        table = bytes(1 if abs(v - value) <= tolerance else 0 for v in range(256))
+        _tables[(value, tolerance)] = table
+    return table
+
+
+class Template:
+    """Декодированный образец: яркость и варианты выборки грубого уровня"""
+    def __init__(self, key):
+        width, height, pixels, offset_x, offset_y = key
+        data = zlib.decompress(base64.b64decode(pixels))
+        if len(data) != width * height * 3:
+            raise ValueError("Размер данных образца не совпадает с его размерами")
+        self.width = width
+        self.height = height
+        self.offset = (offset_x, offset_y)
+        self.frame = Frame(width, height, data)
+        _, _, self.gray = gray_plane(self.frame)
+        self.rows = [self.gray[y * width:(y + 1) * width] for y in range(height)]
+        self.levels = {}  # factor -> [(phase_x, phase_y, ширина, высота, точки), ...]
+
+    def coarse_factor(self, factor=COARSE_FACTOR):
+        """Уменьшение, при котором образец еще не меньше 8 точек по стороне"""
+        return max(1, min(factor, min(self.width, self.height) // 8))
+
+    def variants(self, factor):
+        """Варианты выборки образца для уровня factor (строятся один раз)"""
+        level = self.levels.get(factor)
+        if level is None:
+            level = []
+            for phase_y in range(factor):
+                for phase_x in range(factor):
+                    width, height, plane = gray_plane(self.frame, factor, phase_x, phase_y)
+                    if width and height:
+                        level.append((phase_x, phase_y, width, height, pick_points(width, height, plane)))
+            self.levels[factor] = level
+        return level
+
+
+class TemplateCache:
+    """Кэш декодированных образцов (старые вытесняются)"""
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.templates = {}
+        self.decoded = 0  # Сколько раз образец пришлось декодировать
+
+    def get(self, key):
+        template = self.templates.pop(key, None)
+        if template is None:
+            template = Template(key)
+            self.decoded += 1
+            if len(self.templates) >= self.size:
+                del self.templates[next(iter(self.templates))]
+        self.templates[key] = template  # В конец - недавно использованный
+        return template
+
+
+def score_at(frame, template, left, top, limit):
+    """Средняя разность яркости образца и кадра в (left, top) или None, если больше limit"""
+    stride = frame.stride
+    data = frame.data
+    budget = limit * template.width * template.height
+    total = 0
+    for y, row in enumerate(template.rows):
+        start = frame.offset + (top + y) * stride + left * 3 + 1
+        line = bytes(data[start:start + template.width * 3:3])
+        if line == row:
+            continue
+        total += sum(a - b if a > b else b - a for a, b in zip(line, row))
+        if total > budget:
+            return None
+    return total / (template.width * template.height)
+
+
+def find_template(frame, template, factor=COARSE_FACTOR, tolerance=MATCH_TOLERANCE):
+    """Лучшее положение образца в кадре: (left, top, средняя разность) или None"""
+    factor = template.coarse_factor(factor)
+    if frame.width < template.width or frame.height < template.height:
+        return None
+    plane_width, plane_height, plane = gray_plane(frame, factor)
+    size = len(plane)
+    best = None
+    checked = 0
+    for phase_x, phase_y, width, height, points in template.variants(factor):
+        # Пересечение масок точек: байт i != 0 - положение i подходит по всем точкам
+        mask = -1
+        for x, y, value in points:
+            offset = y * plane_width + x
+            mask &= int.from_bytes(plane.translate(tolerance_table(value)), 'little') >> (offset * 8)
+            if not mask:
+                break
+        if not mask:
+            continue
+        candidates = mask.to_bytes(size, 'little')
+        index = candidates.find(1)
+        while index >= 0:
+            column, row = index % plane_width, index // plane_width
+            left, top = column * factor - phase_x, row * factor - phase_y
+            if (column + width <= plane_width and row + height <= plane_height and left >= 0 and top >= 0
+                    and left + template.width <= frame.width and top + template.height <= frame.height):
+                checked += 1
+                limit = best[2] if best is not None else tolerance
+                score = score_at(frame, template, left, top, limit)
+                if score is not None and (best is None or score < best[2]):
+                    best = (left, top, score)
+                    if score == 0:
+                        return best
+                if checked >= MAX_CANDIDATES:
+                    return best
+            index = candidates.find(1, index + 1)
+    return best
+
+
+class LookupStats:
+    """Статистика поисков образцов: задержка, попадания и промахи"""
+    def __init__(self):
+        self.lookups = 0
+        self.hits = 0
+        self.region_hits = 0  # Найдено в окрестности прошлой находки
+        self.misses = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+
+    def add(self, elapsed, found, in_region):
+        self.lookups += 1
+        if found:
+            self.hits += 1
+            if in_region:
+                self.region_hits += 1
+        else:
+            self.misses += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    @property
+    def average_time(self):
+        return self.total_time / self.lookups if self.lookups else 0.0
+
+    def format(self):
+        """Текст статистики (одна строка)"""
+        return (
+            f"🎯 Поиск по изображению: {self.lookups} поисков, найдено {self.hits} "
+            f"(в прошлой области {self.region_hits}), промахов {self.misses}, "
+            f"среднее {self.average_time * 1000:.1f} мс, максимум {self.max_time * 1000:.1f} мс"
+        )
+
+
+class Lookup:
+    """Итог одного поиска образца"""
+    __slots__ = ('x', 'y', 'score', 'in_region', 'elapsed')
+
+    def __init__(self, x, y, score, in_region, elapsed):
+        self.x = x              # Точка клика (None - не найдено)
+        self.y = y
+        self.score = score      # Средняя разность яркости
+        self.in_region = in_region
+        self.elapsed = elapsed  # Сек
+
+    @property
+    def found(self):
+        return self.x is not None
+
+
+class AnchorLocator:
+    """Поиск образцов на экране с кэшем и памятью прошлых находок"""
+    def __init__(self, screen, cache=None, margin=REGION_MARGIN):
+        self.screen = screen
+        self.cache = cache or TemplateCache()
+        self.margin = margin
+        self.last = {}  # Ключ образца -> (left, top) прошлой находки
+        self.stats = LookupStats()
+
+    def locate(self, key):
+        """Поиск образца: сначала у прошлой находки, затем по всему экрану"""
+        started = time.perf_counter()
+        template = self.cache.get(key)
+        found = None
+        in_region = False
+        last = self.last.get(key)
+        if last is not None:
+            margin = self.margin
+            region = (last[0] - margin, last[1] - margin, template.width + 2 * margin, template.height + 2 * margin)
+            found = self.search(template, region, 1)
+            in_region = found is not None
+        if found is None:
+            width, height = self.screen.size()
+            found = self.search(template, (0, 0, width, height), COARSE_FACTOR)
+        elapsed = time.perf_counter() - started
+        self.stats.add(elapsed, found is not None, in_region)
+        if found is None:
+            return Lookup(None, None, None, False, elapsed)
+        left, top, score = found
+        self.last[key] = (left, top)
+        return Lookup(left + template.offset[0], top + template.offset[1], score, in_region, elapsed)
+
+    def search(self, template, region, factor):
+        """Поиск в области экрана: (left, top, разность) в координатах экрана или None"""
+        frame = self.screen.grab(region)
+        result = find_template(frame, template, factor)
+        if result is None:
+            return None
+        return result[0] + frame.left, result[1] + frame.top, result[2]
@@ -0,0 +1,80 @@
+"""
+Общие помощники тестов: построение графа и выполнение плана без ожиданий.
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flow_engine import FlowVM, StopToken  # noqa: E402
+from flow_graph import FlowGraph  # noqa: E402
+from input_backends import RecordingBackend  # noqa: E402
+
+
+class CountingToken(StopToken):
+    """Токен без реальных пауз: только суммирует запрошенное время"""
+    def __init__(self):
+        super().__init__()
+        self.waited = 0.0
+
+    def wait(self, seconds):
+        if seconds > 0:
+            self.waited += seconds
+        return not self.is_stopped()
+
+
+def make_graph(blocks, edges=(), profile='turbo'):
+    """FlowGraph из {id: (тип, data)} и [(from, to) или (from, to, задержка)]"""
+    graph = FlowGraph()
+    for block_id, (block_type, data) in blocks.items():
+        graph.add_node(block_id, block_type, data=dict(data))
+    for edge in edges:
+        graph.add_edge(*edge)
+    graph.timing = {'profile': profile}
+    return graph
+
+
+def run_plan(plan, **options):
+    """Выполнение плана на RecordingBackend: (результат, [(действие, аргументы)], секунд ожидания)"""
+    backend = RecordingBackend()
+    token = CountingToken()
+    result = FlowVM(plan, token=token, backend=backend, **options).run()
+    return result, [(action, args) for _, action, args in backend.events], token.waited
+
+
+def random_graph(rng, kinds=('coordinate', 'click', 'keyboard_input', 'repeat', 'delay', 'group')):
+    """Случайный ациклический поток: цепочка с лишними соединениями (ромбами)"""
+    count = rng.randint(2, 9)
+    blocks = {}
+    for block_id in range(1, count + 1):
+        kind = rng.choice(kinds)
+        data = {
+            'coordinate': {'x': block_id, 'y': block_id * 2},
+            'click': {'click_type': rng.choice(['left', 'right'])},
+            'keyboard_input': {'text': rng.choice(['', 'abc', 'привет']), 'press_enter': rng.random() < 0.5},
+            'repeat': {'repeat_count': rng.randint(0, 3)},
+            'delay': {'delay': rng.choice([0, 0.5, 1.0])},
+            'group': {'group_type': 'start', 'name': 'g'},
+        }[kind]
+        if rng.random() < 0.3:
+            data['join'] = 'every'
+        blocks[block_id] = (kind, data)
+    edges = []
+    for block_id in range(1, count):
+        if rng.random() < 0.85:
+            edges.append((block_id, block_id + 1, rng.choice([0.0, 0.0, 0.25])))
+    pairs = {edge[:2] for edge in edges}
+    for _ in range(rng.randint(0, 4)):
+        a, b = sorted(rng.sample(range(1, count + 1), 2))
+        if (a, b) not in pairs:
+            pairs.add((a, b))
+            edges.append((a, b))
+    return make_graph(blocks, edges)
+
+
+@pytest.fixture
+def rng():
+    return random.Random(20261018)
@@ -0,0 +1,154 @@
+"""
+Компиляция и выполнение плана: слияния, повторения, ветви, остановка.
+"""
+import pytest
+
+from conftest import CountingToken, make_graph, run_plan
+from flow_engine import FlowVM, compile_flow, join_owners, looped_joins
+from flow_graph import FlowGraph
+from input_backends import RecordingBackend
+
+
+def typed(events):
+    """Тексты, введенные через буфер обмена"""
+    return [args[0] for action, args in events if action == 'copy']
+
+
+def diamond(join=None):
+    """C → A, C → B, A → K, B → K (K - слияние)"""
+    data = {'text': 'K'}
+    if join:
+        data['join'] = join
+    return make_graph({
+        1: ('coordinate', {'x': 1, 'y': 1}),
+        2: ('keyboard_input', {'text': 'A', 'press_enter': False}),
+        3: ('keyboard_input', {'text': 'B', 'press_enter': False}),
+        4: ('keyboard_input', dict(data, press_enter=False)),
+    }, [(1, 2), (1, 3), (2, 4), (3, 4)])
+
+
+def test_once_join_runs_after_all_branches():
+    graph = diamond()
+    assert join_owners(graph) == {4: 1}
+    result, events, _ = run_plan(compile_flow(graph))
+    assert result == 'done'
+    assert typed(events) == ['A', 'B', 'K']
+
+
+def test_every_join_runs_for_each_path():
+    result, events, _ = run_plan(compile_flow(diamond('every')))
+    assert typed(events) == ['A', 'K', 'B', 'K']
+
+
+def test_chain_of_diamonds_compiles_linearly():
+    # 30 ромбов подряд: со слияниями 'один раз' план растет линейно, а не как 2^30
+    blocks = {0: ('coordinate', {'x': 1, 'y': 1})}
+    edges = []
+    for top in range(0, 90, 3):
+        blocks[top + 1] = ('delay', {'delay': 0})
+        blocks[top + 2] = ('delay', {'delay': 0})
+        blocks[top + 3] = ('delay', {'delay': 0.5})
+        edges += [(top, top + 1), (top, top + 2), (top + 1, top + 3), (top + 2, top + 3)]
+    plan = compile_flow(make_graph(blocks, edges))
+    assert len(plan) < 200
+    assert run_plan(plan)[2] == pytest.approx(15.0)
+
+
+def looped_graph(join=None):
+    """C → R (×3) → K и C → K"""
+    data = {'text': 'K', 'press_enter': False}
+    if join:
+        data['join'] = join
+    return make_graph({
+        1: ('coordinate', {'x': 1, 'y': 1}),
+        2: ('repeat', {'repeat_count': 3}),
+        3: ('keyboard_input', data),
+    }, [(1, 2), (2, 3), (1, 3)])
+
+
+def test_looped_once_join_runs_once_after_loop():
+    graph = looped_graph()
+    assert looped_joins(graph, join_owners(graph)) == {3: 2}
+    assert typed(run_plan(compile_flow(graph))[1]) == ['K']
+
+
+def test_looped_every_join_keeps_iterations():
+    assert typed(run_plan(compile_flow(looped_graph('every')))[1]) == ['K'] * 4
+
+
+def test_click_takes_point_of_incoming_coordinate_block():
+    graph = make_graph({
+        1: ('coordinate', {'x': 7, 'y': 8}),
+        2: ('delay', {'delay': 0.25}),
+        3: ('click', {'click_type': 'right'}),
+    }, [(1, 2), (2, 3)])
+    result, events, waited = run_plan(compile_flow(graph))
+    assert events == [('click', (7, 8, 'right'))]
+    assert waited == pytest.approx(0.25)
+
+
+def test_drag_replays_path():
+    graph = make_graph({
+        1: ('coordinate', {'x': 10, 'y': 20}),
+        2: ('click', {'click_type': 'left', 'drag': [[5, 0], [5, 5]]}),
+    }, [(1, 2)])
+    backend = RecordingBackend()
+    FlowVM(compile_flow(graph), token=CountingToken(), backend=backend).run()
+    assert [(action, args) for _, action, args in backend.events] == [('drag', (10, 20, ((5, 0), (5, 5)), 'left'))]
+    assert backend.cursor == (15, 25)
+
+
+def test_missing_coordinates_fail_the_run():
+    graph = make_graph({1: ('coordinate', {}), 2: ('click', {})}, [(1, 2)])
+    errors = []
+    result, events, _ = run_plan(compile_flow(graph), on_error=errors.append)
+    assert (result, events) == ('failed', [])
+    assert len(errors) == 1
+
+
+def test_stop_interrupts_delay():
+    graph = make_graph({
+        1: ('delay', {'delay': 30}),
+        2: ('coordinate', {'x': 1, 'y': 1}),
+        3: ('click', {}),
+    }, [(1, 2), (2, 3)])
+
+    class StopOnWait(CountingToken):
+        def wait(self, seconds):
+            self.stop()
+            return False
+
+    backend = RecordingBackend()
+    result = FlowVM(compile_flow(graph), token=StopOnWait(), backend=backend).run()
+    assert result == 'stopped'
+    assert backend.events == []
+
+
+def test_parallel_branch_error_stops_run_and_is_raised():
+    class FailingBackend(RecordingBackend):
+        def click(self, x, y, button='left'):
+            if x == 2:
+                raise RuntimeError('нет экрана')
+            super().click(x, y, button)
+
+    graph = make_graph({
+        1: ('delay', {'delay': 0}),
+        2: ('coordinate', {'x': 2, 'y': 2}),
+        3: ('click', {}),
+        4: ('coordinate', {'x': 4, 'y': 4}),
+        5: ('click', {}),
+    }, [(1, 2), (2, 3), (1, 4), (4, 5)])
+    token = CountingToken()
+    vm = FlowVM(compile_flow(graph, branch_mode='parallel'), token=token, backend=FailingBackend())
+    with pytest.raises(RuntimeError, match='нет экрана'):
+        vm.run()
+    assert token.is_stopped()
+
+
+def test_unversioned_flow_upgrades_looped_joins():
+    data = looped_graph().to_dict()
+    assert FlowGraph.from_dict(data).nodes[3].data.get('join') is None
+    del data['version']
+    upgraded = FlowGraph.from_dict(data)
+    assert upgraded.nodes[3].data['join'] == 'every'
+    assert typed(run_plan(compile_flow(upgraded))[1]) == ['K'] * 4
@@ -0,0 +1,94 @@
+"""
+Экспорт в Python: оба формата повторяют ввод FlowVM по тому же плану.
+"""
+import sys
+import time
+import types
+
+import pytest
+
+from conftest import make_graph, random_graph, run_plan
+from flow_engine import OP_NAMES, FlowCompileError, compile_flow
+from flow_export import EXPORT_OPS, MAX_CODE_LOOPS, build_code_script, build_table_script
+from flow_optimizer import optimize_plan
+
+START_PAUSE = 2  # Скрипт ждет перед началом выполнения
+
+
+@pytest.fixture
+def script_runner(monkeypatch):
+    """Выполнение текста скрипта с поддельными pyautogui и pyperclip: ([(действие, аргументы)], секунд пауз)"""
+    events = []
+    slept = []
+    drag = []
+
+    pyautogui = types.ModuleType('pyautogui')
+    pyautogui.click = lambda x, y, button='left': events.append(('click', (x, y, button)))
+    pyautogui.hotkey = lambda *keys: events.append(('hotkey', keys))
+    pyautogui.press = lambda key: events.append(('press', (key,)))
+    pyautogui.write = lambda text, interval=0.0: events.append(('write', (text,)))
+
+    def mouse_down(x, y, button='left', _pause=True):
+        drag[:] = [x, y, [], button]
+
+    def move_to(x, y, _pause=True):
+        drag[2].append((x - drag[0], y - drag[1]))
+
+    def mouse_up(button='left', _pause=True):
+        events.append(('drag', (drag[0], drag[1], tuple(drag[2]), drag[3])))
+
+    pyautogui.mouseDown = mouse_down
+    pyautogui.moveTo = move_to
+    pyautogui.mouseUp = mouse_up
+    pyperclip = types.ModuleType('pyperclip')
+    pyperclip.copy = lambda text: events.append(('copy', (text,)))
+    monkeypatch.setitem(sys.modules, 'pyautogui', pyautogui)
+    monkeypatch.setitem(sys.modules, 'pyperclip', pyperclip)
+    monkeypatch.setattr(time, 'sleep', lambda seconds: slept.append(seconds))
+
+    def run(source):
+        events.clear()
+        slept.clear()
+        namespace = {'__name__': 'exported'}
+        exec(compile(source, 'exported.py', 'exec'), namespace)
+        try:
+            namespace['main']()
+        except SystemExit:
+            pass
+        return list(events), sum(slept) - START_PAUSE
+
+    return run
+
+
+def test_interpreter_knows_every_opcode():
+    assert EXPORT_OPS == OP_NAMES
+
+
+@pytest.mark.parametrize('build', [build_table_script, build_code_script])
+def test_export_matches_vm(rng, script_runner, build):
+    for _ in range(150):
+        graph = random_graph(rng)
+        if rng.random() < 0.3:
+            for node in graph.nodes.values():
+                if node.type == 'click':
+                    node.data['drag'] = [[3, 4], [10, -2]]
+        plan, _ = optimize_plan(compile_flow(graph))
+        _, vm_events, vm_waited = run_plan(plan)
+        events, slept = script_runner(build(plan, 'turbo'))
+        assert events == vm_events
+        assert slept == pytest.approx(vm_waited)
+
+
+def nested_repeats(depth):
+    blocks = {block_id: ('repeat', {'repeat_count': 1}) for block_id in range(1, depth + 1)}
+    blocks[depth + 1] = ('delay', {'delay': 1})
+    return make_graph(blocks, [(block_id, block_id + 1) for block_id in range(1, depth + 1)])
+
+
+def test_code_export_limits_loop_nesting(script_runner):
+    plan = compile_flow(nested_repeats(MAX_CODE_LOOPS))
+    assert script_runner(build_code_script(plan, 'turbo'))[1] == pytest.approx(1)
+    with pytest.raises(FlowCompileError):
+        build_code_script(compile_flow(nested_repeats(MAX_CODE_LOOPS + 1)), 'turbo')
+    # Таблица инструкций не ограничена вложенностью
+    compile(build_table_script(compile_flow(nested_repeats(MAX_CODE_LOOPS + 1)), 'turbo'), 'exported.py', 'exec')
@@ -0,0 +1,95 @@
+"""
+Журнал автосохранения: повтор записей, сжатие и восстановление после сбоя.
+"""
+import json
+
+import pytest
+
+from flow_graph import FlowGraph
+from flow_journal import GENERATION_KEY, FlowJournal, apply_entry, journal_path, load_flow
+
+BLOCK = {'id': 1, 'type': 'coordinate', 'x': 10, 'y': 20, 'data': {'x': 5, 'y': 6}}
+CLICK = {'id': 2, 'type': 'click', 'x': 10, 'y': 120, 'data': {'click_type': 'left'}}
+
+
+def record_all(journal, entries):
+    for entry in entries:
+        journal.record(entry)
+    journal.close()
+
+
+EDITS = [
+    {'op': 'add', 'block': BLOCK},
+    {'op': 'add', 'block': CLICK},
+    {'op': 'connect', 'from': 1, 'to': 2, 'delay': 0.0},
+    {'op': 'delay', 'from': 1, 'to': 2, 'delay': 1.5},
+    {'op': 'move', 'id': 2, 'x': 40, 'y': 140},
+    {'op': 'data', 'id': 2, 'data': {'click_type': 'right'}},
+    {'op': 'settings', 'timing': {'profile': 'fast'}, 'branches': 'parallel'},
+]
+
+
+def test_load_replays_journal_over_missing_snapshot(tmp_path):
+    path = str(tmp_path / 'flow.json')
+    record_all(FlowJournal(path), EDITS)
+    graph = FlowGraph.from_dict(load_flow(path))
+    assert graph.get_delay(1, 2) == 1.5
+    assert (graph.nodes[2].x, graph.nodes[2].y) == (40, 140)
+    assert graph.nodes[2].data == {'click_type': 'right'}
+    assert graph.timing == {'profile': 'fast'}
+    assert graph.branch_mode == 'parallel'
+
+
+def test_entries_are_idempotent():
+    once = FlowGraph()
+    twice = FlowGraph()
+    for entry in EDITS:
+        apply_entry(once, entry)
+    for entry in EDITS + EDITS:
+        apply_entry(twice, entry)
+    assert once.to_dict() == twice.to_dict()
+    apply_entry(once, {'op': 'delete', 'id': 2})
+    apply_entry(once, {'op': 'delete', 'id': 2})
+    assert list(once.nodes) == [1] and not once.edges
+    with pytest.raises(ValueError):
+        apply_entry(once, {'op': 'rename'})
+
+
+def test_compact_writes_snapshot_and_restarts_journal(tmp_path):
+    path = str(tmp_path / 'flow.json')
+    journal = FlowJournal(path)
+    record_all(journal, EDITS[:3])
+    data = FlowGraph.from_dict(journal.load()).to_dict()
+    journal.compact(data)
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)[GENERATION_KEY] == 1
+    with open(journal_path(path), encoding='utf-8') as f:
+        assert f.read().count('\n') == 1  # Только заголовок
+
+    record_all(journal, [{'op': 'move', 'id': 1, 'x': 0, 'y': 0}])
+    reloaded = FlowJournal(path)
+    graph = FlowGraph.from_dict(reloaded.load())
+    assert reloaded.generation == 1 and reloaded.entries == 1
+    assert (graph.nodes[1].x, graph.nodes[1].y) == (0, 0)
+    assert graph.get_edge(1, 2) is not None
+
+
+def test_journal_of_older_generation_is_skipped(tmp_path):
+    # Сбой после записи снимка, но до очистки журнала: журнал уже вошел в снимок
+    path = str(tmp_path / 'flow.json')
+    record_all(FlowJournal(path), [{'op': 'add', 'block': BLOCK}, {'op': 'delete', 'id': 1}])
+    snapshot = {'blocks': [CLICK], 'connections': [], GENERATION_KEY: 1}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    assert load_flow(path) == snapshot
+
+
+def test_torn_last_line_is_skipped_and_next_record_starts_new_line(tmp_path):
+    path = str(tmp_path / 'flow.json')
+    record_all(FlowJournal(path), [{'op': 'add', 'block': BLOCK}])
+    with open(journal_path(path), 'a', encoding='utf-8') as f:
+        f.write('{"op": "move", "id": 1, "x"')
+    journal = FlowJournal(path)
+    assert FlowGraph.from_dict(journal.load()).nodes[1].x == 10
+    record_all(journal, [{'op': 'move', 'id': 1, 'x': 77, 'y': 0}])
+    assert FlowGraph.from_dict(load_flow(path)).nodes[1].x == 77
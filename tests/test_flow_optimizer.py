@@ -0,0 +1,67 @@
+"""
+Оптимизация плана: тот же ввод и то же суммарное ожидание, меньше инструкций.
+"""
+import pytest
+
+from conftest import make_graph, random_graph, run_plan
+from flow_engine import OP_DELAY, OP_LOOP, compile_flow
+from flow_optimizer import estimate_plan, optimize_plan
+
+
+@pytest.mark.parametrize('branch_mode', ['sequential', 'parallel'])
+def test_optimized_plan_is_equivalent(rng, branch_mode):
+    for _ in range(200):
+        plan = compile_flow(random_graph(rng), branch_mode=branch_mode)
+        optimized, report = optimize_plan(plan)
+        result, events, waited = run_plan(plan, branch_mode='sequential')
+        opt_result, opt_events, opt_waited = run_plan(optimized, branch_mode='sequential')
+        assert (opt_result, opt_events) == (result, events)
+        assert opt_waited == pytest.approx(waited)
+        assert report.ops_after <= report.ops_before
+
+
+def test_zero_repeat_drops_body():
+    graph = make_graph({
+        1: ('repeat', {'repeat_count': 0}),
+        2: ('coordinate', {'x': 1, 'y': 2}),
+        3: ('click', {}),
+    }, [(1, 2), (2, 3)])
+    optimized, report = optimize_plan(compile_flow(graph))
+    assert optimized.code == ()
+    assert report.removed['мертвый код'] > 0
+
+
+def test_consecutive_delays_fold_into_one():
+    graph = make_graph({
+        1: ('delay', {'delay': 0.5}),
+        2: ('delay', {'delay': 1.0}),
+        3: ('delay', {'delay': 0.25}),
+    }, [(1, 2, 0.5), (2, 3)])
+    optimized, report = optimize_plan(compile_flow(graph))
+    assert [instr[0] for instr in optimized.code] == [OP_DELAY]
+    assert optimized.code[0][2] == pytest.approx(2.25)
+    assert report.folded == 3
+
+
+def test_code_after_error_is_dead_in_sequential_mode():
+    graph = make_graph({
+        1: ('coordinate', {}),
+        2: ('coordinate', {'x': 5, 'y': 5}),
+        3: ('click', {}),
+    }, [(2, 3)])
+    plan = compile_flow(graph)
+    optimized, _ = optimize_plan(plan)
+    result, events, _ = run_plan(optimized)
+    assert (result, events) == ('failed', [])
+    assert len(optimized) < len(plan)
+
+
+def test_estimate_counts_loop_iterations():
+    graph = make_graph({
+        1: ('repeat', {'repeat_count': 3}),
+        2: ('delay', {'delay': 0.5}),
+    }, [(1, 2)])
+    plan = compile_flow(graph)
+    seconds, _ = estimate_plan(plan)
+    assert seconds == pytest.approx(1.5)
+    assert any(instr[0] == OP_LOOP for instr in plan.code)
@@ -0,0 +1,115 @@
+"""
+Проверка потока перед запуском: ошибки, предупреждения и блоки для подсветки.
+"""
+from conftest import make_graph
+from flow_validator import JOIN_BLOWUP, validate_flow
+
+
+def test_valid_flow_has_no_issues():
+    graph = make_graph({
+        1: ('coordinate', {'x': 10, 'y': 20}),
+        2: ('click', {}),
+        3: ('keyboard_input', {'text': 'abc'}),
+    }, [(1, 2), (2, 3)])
+    report = validate_flow(graph)
+    assert report.ok
+    assert report.issues == []
+
+
+def test_cycle_is_error_and_its_blocks_unreachable():
+    graph = make_graph({
+        1: ('coordinate', {'x': 1, 'y': 1}),
+        2: ('delay', {'delay': 1}),
+        3: ('delay', {'delay': 1}),
+    }, [(2, 3), (3, 2)])
+    report = validate_flow(graph)
+    assert not report.ok
+    cycle = [issue for issue in report.errors if issue.message.startswith('Цикл')]
+    assert len(cycle) == 1 and set(cycle[0].block_ids) == {2, 3}
+    unreachable = [issue for issue in report.warnings if issue.message.startswith('Недостижимые')]
+    assert [issue.block_ids for issue in unreachable] == [(2, 3)]
+
+
+def test_click_without_coordinates():
+    graph = make_graph({
+        1: ('delay', {'delay': 1}),
+        2: ('click', {}),
+    }, [(1, 2)])
+    report = validate_flow(graph)
+    assert [issue.block_ids for issue in report.errors] == [(2,)]
+
+
+def test_click_after_partial_coordinates_uses_incoming_block():
+    # Один путь без координат, но входящий блок координат дает точку - как при компиляции
+    graph = make_graph({
+        1: ('delay', {'delay': 1}),
+        2: ('coordinate', {'x': 5, 'y': 5}),
+        3: ('click', {}),
+    }, [(1, 3), (2, 3)])
+    assert validate_flow(graph).ok
+
+
+def test_block_data_errors():
+    graph = make_graph({
+        1: ('coordinate', {}),
+        2: ('screen_wait', {}),
+        3: ('coordinate', {'anchor': {'width': 2}}),
+        4: ('delay', {'delay': 1}),
+    }, [(1, 2), (2, 3), (3, 4)])
+    graph.set_watch(3, 4, {'mode': 'change'})
+    report = validate_flow(graph)
+    assert sorted(issue.block_ids for issue in report.errors) == [(1,), (2,), (3,), (3, 4)]
+
+
+def test_zero_repeat_warns():
+    graph = make_graph({
+        1: ('repeat', {'repeat_count': 0}),
+        2: ('delay', {'delay': 1}),
+    }, [(1, 2)])
+    report = validate_flow(graph)
+    assert report.ok
+    assert [issue.block_ids for issue in report.warnings] == [(1,)]
+
+
+def test_looped_once_join_warns_until_every():
+    blocks = {
+        1: ('coordinate', {'x': 1, 'y': 1}),
+        2: ('repeat', {'repeat_count': 3}),
+        3: ('click', {}),
+    }
+    edges = [(1, 2), (2, 3), (1, 3)]
+    report = validate_flow(make_graph(blocks, edges))
+    assert [issue.block_ids for issue in report.warnings] == [(3, 2)]
+
+    blocks[3] = ('click', {'join': 'every'})
+    assert validate_flow(make_graph(blocks, edges)).issues == []
+
+
+def test_stacked_every_joins_warn_once_past_blowup():
+    # Ромбы подряд: каждый удваивает выполнения блоков после слияния 'every'
+    blocks = {0: ('coordinate', {'x': 1, 'y': 1})}
+    edges = []
+    top = 0
+    runs = 1
+    joins = []
+    while runs <= JOIN_BLOWUP:
+        left, right, bottom = top + 1, top + 2, top + 3
+        blocks[left] = ('delay', {'delay': 0})
+        blocks[right] = ('delay', {'delay': 0})
+        blocks[bottom] = ('delay', {'delay': 0, 'join': 'every'})
+        edges += [(top, left), (top, right), (left, bottom), (right, bottom)]
+        joins.append(bottom)
+        top = bottom
+        runs *= 2
+    report = validate_flow(make_graph(blocks, edges))
+    assert [issue.block_ids for issue in report.warnings] == [(joins[-1],)]
+
+
+def test_block_levels_prefer_errors():
+    graph = make_graph({
+        1: ('repeat', {'repeat_count': 0}),
+        2: ('click', {}),
+    }, [(1, 2)])
+    report = validate_flow(graph)
+    assert report.block_levels() == {1: 'warning', 2: 'error'}
+    assert report.format().startswith('❌')
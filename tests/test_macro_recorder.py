@@ -0,0 +1,98 @@
+"""
+Запись макроса: кольцевой буфер, пути перетаскивания и сборка шагов.
+"""
+from macro_recorder import EventRing, MacroRecorder, build_macro, simplify_path
+
+
+class Key:
+    """Клавиша в духе pynput: специальная (name) или символ (char)"""
+    def __init__(self, name=None, char=None):
+        self.name = name
+        self.char = char
+
+
+def chars(text, moment=1.0):
+    return [(moment, 'key', Key(char=char), None, None) for char in text]
+
+
+def test_ring_drains_in_order():
+    ring = EventRing(8)
+    for i in range(5):
+        ring.push('click', i, i, 'left')
+    assert [event[2] for event in ring.drain()] == [0, 1, 2, 3, 4]
+    assert ring.drain() == []
+    ring.push('key', 'a')
+    assert [event[1:3] for event in ring.drain()] == [('key', 'a')]
+    assert ring.lost == 0
+
+
+def test_ring_overrun_counts_lost_events():
+    ring = EventRing(4)
+    for i in range(10):
+        ring.push('move', i, i)
+    events = ring.drain()
+    assert [event[2] for event in events] == [6, 7, 8, 9]
+    assert ring.lost == 6
+
+
+def test_simplify_path_keeps_corners():
+    line = [(i, 0) for i in range(50)] + [(49, i) for i in range(1, 50)]
+    assert simplify_path(line, 3.0) == [(0, 0), (49, 0), (49, 49)]
+    assert simplify_path([(0, 0), (1, 1)]) == [(0, 0), (1, 1)]
+
+
+def test_recorder_turns_held_moves_into_drag():
+    recorder = MacroRecorder(1024)
+    push = recorder.ring.push
+    push('move', 0, 0)
+    push('click', 10, 10, 'left')
+    for i in range(1, 40):
+        push('move', 10 + i, 10)
+    push('up', 49, 10, 'left')
+    push('move', 60, 60)
+    push('click', 100, 100, 'right')
+    push('up', 101, 100, 'right')
+    assert recorder.drain() == 4
+    assert recorder.moves == 41
+    steps, skipped = build_macro(recorder.events)
+    assert steps == [
+        ('drag', 10, 10, 'left', 0.0, [(39, 0)]),
+        ('click', 100, 100, 'right', 0.0),
+    ]
+    assert skipped == 0
+
+
+def test_text_enter_and_backspace():
+    events = chars('abx') + [
+        (1.0, 'key', Key(name='backspace'), None, None),
+        (1.0, 'key', Key(name='space'), None, None),
+        (1.0, 'key', Key(name='enter'), None, None),
+        (2.0, 'click', 5, 5, 'left'),
+    ]
+    steps, _ = build_macro(events)
+    assert steps == [('type', 'ab ', True, 0.0), ('click', 5, 5, 'left', 1.0)]
+
+
+def test_modifiers_are_tracked_per_physical_key():
+    ctrl_l, ctrl_r = Key(name='ctrl_l'), Key(name='ctrl_r')
+    events = [
+        (0.0, 'key', ctrl_l, None, None),
+        (0.0, 'key', ctrl_r, None, None),
+        (0.0, 'release', ctrl_l, None, None),
+    ] + chars('c') + [
+        (0.0, 'release', ctrl_r, None, None),
+    ] + chars('d')
+    steps, skipped = build_macro(events)
+    assert steps == [('type', 'd', False, 0.0)]
+    assert skipped == 1
+
+
+def test_clicks_inside_editor_window_are_excluded():
+    events = [
+        (0.0, 'click', 50, 50, 'left'),
+        (0.0, 'up', 90, 90, ('left', [(40, 40)])),
+        (0.5, 'click', 500, 500, 'left'),
+        (0.6, 'up', 500, 500, ('left', [])),
+    ]
+    steps, _ = build_macro(events, exclude=(0, 0, 100, 100))
+    assert steps == [('click', 500, 500, 'left', 0.0)]
@@ -0,0 +1,109 @@
+"""
+Поиск образца на экране: точное положение, окрестность прошлой находки, кэш.
+"""
+import random
+
+import pytest
+
+from conftest import CountingToken, make_graph
+from flow_engine import FlowVM, compile_flow
+from input_backends import RecordingBackend
+from screen_capture import Frame, FrameCache, SyntheticScreen
+from template_match import (
+    AnchorLocator, Template, TemplateCache, anchor_key, encode_template, find_template
+)
+
+SIZE = 24
+
+
+def pattern(seed=7, size=SIZE):
+    """Образец из случайных точек (не совпадает с фоном ни в одном положении)"""
+    rng = random.Random(seed)
+    return Frame(size, size, bytes(rng.randrange(32, 256) for _ in range(size * size * 3)))
+
+
+def screen_with(frame, left, top):
+    screen = SyntheticScreen(320, 240)
+    screen.paste(left, top, frame)
+    return screen
+
+
+def test_encoded_template_decodes_to_same_pixels():
+    frame = pattern()
+    template = Template(anchor_key(encode_template(frame)))
+    assert template.frame.tobytes() == frame.tobytes()
+    assert template.offset == (SIZE // 2, SIZE // 2)
+
+
+def test_corrupted_template_is_rejected():
+    anchor = encode_template(pattern())
+    anchor['width'] += 1
+    with pytest.raises(ValueError):
+        Template(anchor_key(anchor))
+
+
+@pytest.mark.parametrize('left, top', [(0, 0), (101, 67), (320 - SIZE, 240 - SIZE)])
+def test_find_template_exact_position(left, top):
+    frame = pattern()
+    screen = screen_with(frame, left, top)
+    template = Template(anchor_key(encode_template(frame)))
+    assert find_template(screen.grab((0, 0, 320, 240)), template) == (left, top, 0)
+
+
+def test_find_template_misses_absent_pattern():
+    screen = screen_with(pattern(seed=1), 50, 50)
+    template = Template(anchor_key(encode_template(pattern(seed=2))))
+    assert find_template(screen.grab((0, 0, 320, 240)), template) is None
+
+
+def test_locator_searches_near_last_hit_first():
+    frame = pattern()
+    key = anchor_key(encode_template(frame))
+    screen = screen_with(frame, 100, 60)
+    locator = AnchorLocator(screen)
+
+    first = locator.locate(key)
+    assert (first.x, first.y, first.in_region) == (100 + SIZE // 2, 60 + SIZE // 2, False)
+    second = locator.locate(key)
+    assert (second.x, second.y, second.in_region) == (first.x, first.y, True)
+
+    # Окно сдвинулось далеко - после промаха в окрестности ищется по всему экрану
+    screen.fill((0, 0, 320, 240), (0, 0, 0))
+    screen.paste(250, 200, frame)
+    moved = locator.locate(key)
+    assert (moved.x, moved.y, moved.in_region) == (250 + SIZE // 2, 200 + SIZE // 2, False)
+
+    screen.fill((0, 0, 320, 240), (0, 0, 0))
+    assert not locator.locate(key).found
+    stats = locator.stats
+    assert (stats.lookups, stats.hits, stats.region_hits, stats.misses) == (4, 3, 1, 1)
+    assert locator.cache.decoded == 1
+
+
+def test_template_cache_evicts_least_recent():
+    keys = [anchor_key(encode_template(pattern(seed=seed, size=8))) for seed in range(3)]
+    cache = TemplateCache(size=2)
+    cache.get(keys[0])
+    cache.get(keys[1])
+    cache.get(keys[0])
+    cache.get(keys[2])  # Вытесняет keys[1]
+    assert list(cache.templates) == [keys[0], keys[2]]
+    assert cache.decoded == 3
+
+
+def test_vm_clicks_found_point_and_falls_back_to_saved_one():
+    frame = pattern()
+    screen = screen_with(frame, 40, 30)
+    anchor = dict(encode_template(frame), on_miss='fallback')
+    graph = make_graph({
+        1: ('coordinate', {'x': 5, 'y': 6, 'anchor': anchor}),
+        2: ('click', {}),
+    }, [(1, 2)])
+    plan = compile_flow(graph)
+
+    backend = RecordingBackend()
+    FlowVM(plan, token=CountingToken(), backend=backend, screen=FrameCache(screen)).run()
+    screen.fill((0, 0, 320, 240), (0, 0, 0))
+    FlowVM(plan, token=CountingToken(), backend=backend, screen=FrameCache(screen)).run()
+    clicks = [args for _, action, args in backend.events if action == 'click']
+    assert clicks == [(40 + SIZE // 2, 30 + SIZE // 2, 'left'), (5, 6, 'left')]
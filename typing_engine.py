@@ -0,0 +1,131 @@
+"""
+Движок ввода текста для KeyboardInputBlock.
+
+Способы ввода:
+- вставка через буфер обмена порциями ограниченного размера - основной
+  способ: не зависит от раскладки клавиатуры и быстр для любой длины;
+- набор клавишами пакетами - один вызов бэкенда на пакет, а не на символ,
+  с суммарным интервалом после пакета. Только когда буфер обмена отказал:
+  клавиши проходят через активную раскладку, и ASCII-текст при кириллической
+  раскладке набрался бы неверными символами.
+"""
+import time
+
+
+# Размер порции при вставке через буфер обмена (символов)
+PASTE_CHUNK_CHARS = 2000
+
+# Размер пакета при наборе клавишами (символов на один вызов бэкенда).
+# Интервал между символами выдерживается одной паузой после пакета - она
+# прерывается остановкой.
+KEY_BATCH_CHARS = 200
+
+
+def is_typeable_ascii(text):
+    """Можно ли набрать текст клавишами (печатный ASCII, перевод строки, табуляция)"""
+    return text.isascii() and text.replace('\n', ' ').replace('\t', ' ').isprintable()
+
+
+def split_chunks(text, size):
+    """Разбиение текста на порции не длиннее size"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TypingResult:
+    """Итог ввода текста"""
+    __slots__ = ('strategy', 'chars', 'seconds', 'completed')
+
+    def __init__(self, strategy, chars, seconds, completed=True):
+        self.strategy = strategy
+        self.chars = chars
+        self.seconds = seconds
+        self.completed = completed
+
+    @property
+    def chars_per_second(self):
+        if self.seconds <= 0:
+            return float(self.chars) if self.chars else 0.0
+        return self.chars / self.seconds
+
+    def __repr__(self):
+        return f"TypingResult({self.strategy}, {self.chars} симв., {self.chars_per_second:.0f} симв/с)"
+
+
+class TypingEngine:
+    """Ввод текста через бэкенд с учетом профиля таймингов"""
+    def __init__(self, backend, timing, wait=None, on_warning=None):
+        self.backend = backend
+        self.timing = timing
+        self.wait = wait or (lambda seconds: time.sleep(seconds) or True)
+        self.on_warning = on_warning or (lambda text: None)
+        self.clipboard_failed = False  # Буфер обмена уже отказывал в этом запуске
+
+    def estimate(self, text, strategy):
+        """Оценка времени ввода (сек) без учета самих вызовов ввода"""
+        timing = self.timing
+        if strategy == 'paste':
+            chunks = len(split_chunks(text, PASTE_CHUNK_CHARS))
+            return chunks * (timing['paste_before'] + timing['paste_after'] + timing['input_pause'])
+        batches = (len(text) + KEY_BATCH_CHARS - 1) // KEY_BATCH_CHARS
+        return len(text) * timing['char_interval'] + batches * timing['input_pause']
+
+    def choose_strategy(self, text):
+        """'none', 'paste' или 'keys'.
+
+        Набор клавишами - только после отказа буфера обмена и только для
+        текста, который вообще можно набрать: вставка не зависит от раскладки.
+        """
+        if not text:
+            return 'none'
+        if self.clipboard_failed and is_typeable_ascii(text):
+            return 'keys'
+        return 'paste'
+
+    def chunk_size(self, strategy):
+        """Символов на одну порцию (вставку или вызов бэкенда) для способа ввода"""
+        return PASTE_CHUNK_CHARS if strategy == 'paste' else KEY_BATCH_CHARS
+
+    def type_text(self, text, strategy=None):
+        """Ввод текста. Возвращает TypingResult.
+
+        strategy - способ, выбранный при компиляции плана (None - выбрать сейчас).
+        После отказа буфера обмена вставка заменяется набором, где это возможно.
+        """
+        if strategy is None or (strategy == 'paste' and self.clipboard_failed):
+            strategy = self.choose_strategy(text)
+        started = time.perf_counter()
+        typed = 0
+        completed = True
+
+        if strategy == 'paste':
+            try:
+                for chunk in split_chunks(text, self.chunk_size('paste')):
+                    self.backend.copy_to_clipboard(chunk)
+                    if not self.wait(self.timing['paste_before']):
+                        completed = False
+                        break
+                    self.backend.hotkey('ctrl', 'v')
+                    typed += len(chunk)
+                    if not self.wait(self.timing['paste_after']):
+                        completed = False
+                        break
+            except Exception as e:
+                # Fallback - набираем оставшийся текст клавишами
+                self.clipboard_failed = True
+                self.on_warning(f"Ошибка буфера обмена: {str(e)}\nИспользую посимвольный ввод")
+                strategy = 'keys'
+                text = text[typed:]
+
+        if strategy == 'keys':
+            interval = self.timing['char_interval']
+            for batch in split_chunks(text, self.chunk_size('keys')):
+                if not self.wait(0):
+                    completed = False
+                    break
+                self.backend.write(batch)
+                typed += len(batch)
+                if not self.wait(len(batch) * interval):
+                    completed = False
+                    break
+
+        return TypingResult(strategy, typed, time.perf_counter() - started, completed)
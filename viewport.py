@@ -0,0 +1,84 @@
+"""
+Видимая область canvas редактора.
+
+Координаты блоков (block.x, block.y) - мировые. На canvas они рисуются
+умноженными на zoom, а сдвиг (панорамирование) делает сам Tk через
+scan_dragto, поэтому для перевода координат события в мировые
+достаточно canvasx()/canvasy() и деления на zoom.
+
+Элементы canvas существуют только у блоков и соединений, которые
+пересекают видимую область с запасом CULL_MARGIN. При zoom меньше
+DETAIL_ZOOM блоки рисуются простыми прямоугольниками без текста и тени.
+"""
+
+
+ZOOM_LEVELS = (0.05, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0)
+DETAIL_ZOOM = 0.5    # Ниже - упрощенная отрисовка (level of detail)
+CULL_MARGIN = 200    # Запас вокруг видимой области (экранные пиксели)
+GRID_STEP = 40       # Шаг сетки в мировых координатах
+MIN_GRID_PIXELS = 12  # Линии сетки не рисуются чаще, чем через столько пикселей
+
+
+class Viewport:
+    """Масштаб и видимая область canvas"""
+    def __init__(self):
+        self.zoom = 1.0
+        self.left = 0     # Координаты canvas левого верхнего угла окна
+        self.top = 0
+        self.width = 1200  # Размер окна canvas (пиксели)
+        self.height = 700
+        self.suspended = False  # Пакетная загрузка: блоки и соединения не рисуют себя сами
+
+    @property
+    def detailed(self):
+        """Рисовать ли блоки полностью (иначе - упрощенно)"""
+        return self.zoom >= DETAIL_ZOOM
+
+    def set_window(self, left, top, width, height):
+        """Положение и размер окна canvas (из canvasx(0), canvasy(0), winfo_width/height)"""
+        self.left = left
+        self.top = top
+        if width > 1:
+            self.width = width
+        if height > 1:
+            self.height = height
+
+    def to_world(self, canvas_x, canvas_y):
+        """Координаты canvas -> мировые"""
+        return canvas_x / self.zoom, canvas_y / self.zoom
+
+    def world_rect(self, margin=CULL_MARGIN):
+        """Видимая мировая область с запасом (x1, y1, x2, y2)"""
+        zoom = self.zoom
+        return (
+            (self.left - margin) / zoom,
+            (self.top - margin) / zoom,
+            (self.left + self.width + margin) / zoom,
+            (self.top + self.height + margin) / zoom
+        )
+
+    def intersects(self, box, rect=None):
+        """Пересекает ли мировой прямоугольник видимую область"""
+        x1, y1, x2, y2 = rect or self.world_rect()
+        bx1, by1, bx2, by2 = box
+        return bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2
+
+    def visible(self, box):
+        """Нужно ли сейчас рисовать элемент с таким мировым прямоугольником"""
+        return not self.suspended and self.intersects(box)
+
+    def next_zoom(self, direction):
+        """Следующий уровень масштаба (direction > 0 - приблизить)"""
+        zoom = self.zoom
+        if direction > 0:
+            larger = [level for level in ZOOM_LEVELS if level > zoom + 1e-9]
+            return larger[0] if larger else zoom
+        smaller = [level for level in ZOOM_LEVELS if level < zoom - 1e-9]
+        return smaller[-1] if smaller else zoom
+
+    def grid_step(self):
+        """Шаг сетки в мировых координатах для текущего масштаба"""
+        step = GRID_STEP
+        while step * self.zoom < MIN_GRID_PIXELS:
+            step *= 2
+        return step